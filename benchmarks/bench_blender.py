@@ -0,0 +1,90 @@
+"""Export benchmarks of synthetic scenes inside Blender
+
+    blender -b --factory-startup --python benchmarks/bench_blender.py -- \\
+        [--quick] [--output results.json] [--baseline old.json]
+
+Every scene of SCENES is generated with synthetic_scene.py and exported
+with each configuration of CONFIGS. Time, peak traced memory, peak resident
+memory and the size of the export are written to a json file.
+"""
+import os, sys, shutil, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import REPO_DIR, measure, dir_size, result_entry, save_results, compare_results, print_results
+import synthetic_scene
+
+sys.path.insert(0, REPO_DIR)
+import bpy
+from io_nori.nori_writer import NoriWriter
+from io_nori.profiler import max_rss
+
+SCENES = [
+    {"objects": 100, "triangles": 1000, "materials": 8, "textures": 4, "instances": 0},
+    {"objects": 1000, "triangles": 500, "materials": 16, "textures": 8, "instances": 0},
+    {"objects": 20, "triangles": 100000, "materials": 4, "textures": 2, "instances": 0},
+    {"objects": 10, "triangles": 1000, "materials": 4, "textures": 0, "instances": 5000},
+]
+QUICK_SCENES = [
+    {"objects": 10, "triangles": 500, "materials": 2, "textures": 1, "instances": 10},
+]
+CONFIGS = [
+    {"xml_backend": "STREAM", "mesh_backend": "NATIVE", "mesh_format": "OBJ"},
+    {"xml_backend": "STREAM", "mesh_backend": "NATIVE", "mesh_format": "PLY"},
+    {"xml_backend": "DOM", "mesh_backend": "OPERATOR", "mesh_format": "OBJ", "instance_mode": "MERGE"},
+]
+
+def export(filepath, config):
+    writer = NoriWriter(bpy.context, filepath)
+    writer.verbose = lambda text: None
+    writer.setExportMeshesWorld(True)
+    for key, value in config.items():
+        setattr(writer, key, value)
+    writer.write(True, True, 16)
+
+def bench_export(directory, scenes, repeat):
+    results = []
+    for scene in scenes:
+        scene_dir = os.path.join(directory, "scene")
+        synthetic_scene.build_scene(scene_dir, **scene)
+        for config in CONFIGS:
+            out_dir = os.path.join(directory, "export")
+            def run():
+                shutil.rmtree(out_dir, ignore_errors=True)
+                os.makedirs(out_dir)
+                export(os.path.join(out_dir, "scene.xml"), config)
+            elapsed, peak, _ = measure(run, repeat=repeat)
+            params = dict(scene, **config)
+            results.append(result_entry("export", params, elapsed, peak, dir_size(out_dir), max_rss=max_rss()))
+        shutil.rmtree(scene_dir, ignore_errors=True)
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="small scenes, to check that everything runs")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best time is kept")
+    parser.add_argument("--output", default="bench_blender.json", help="json file receiving the results")
+    parser.add_argument("--baseline", help="json of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative increase reported as a regression")
+    args = parser.parse_args(argv)
+
+    repeat = 1 if args.quick else args.repeat
+    directory = tempfile.mkdtemp(prefix="nori_bench_")
+    try:
+        results = bench_export(directory, QUICK_SCENES if args.quick else SCENES, repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print_results(results)
+    save_results(args.output, results, "blender %s" % bpy.app.version_string)
+    print("Results written to " + args.output)
+    if args.baseline:
+        regressions = compare_results(args.baseline, results, args.tolerance)
+        if regressions:
+            print("%d regressions above %d%%" % (len(regressions), 100 * args.tolerance))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    # blender passes its own arguments, ours follow "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
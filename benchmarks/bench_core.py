@@ -0,0 +1,156 @@
+"""Benchmarks of the exporter that run in plain Python
+
+    python benchmarks/bench_core.py [--quick] [--output results.json] [--baseline old.json]
+
+bpy, mathutils and bpy_extras are replaced by the stand-ins of
+benchmarks/stubs, so the numbers cover the add-on code (xml generation,
+mesh extraction and encoding, texture staging) and not Blender itself. Use
+bench_blender.py to time real scenes.
+"""
+import os, sys, shutil, argparse, tempfile
+from xml.dom.minidom import Document
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import REPO_DIR, measure, dir_size, result_entry, save_results, compare_results, print_results
+import stub_scene # puts the stubs on sys.path
+
+sys.path.insert(0, REPO_DIR)
+from io_nori.xml_writer import StreamingDocument
+from io_nori.mesh_writer import extract_mesh_data, MESH_WRITERS
+from io_nori.nori_writer import NoriWriter
+
+######################
+# xml generation
+######################
+def build_xml(doc, root, elements):
+    for i in range(elements):
+        mesh = doc.createElement("mesh")
+        mesh.setAttribute("type", "obj")
+        entry = doc.createElement("string")
+        entry.setAttribute("name", "filename")
+        entry.setAttribute("value", "meshes/Object.%05d.obj" % i)
+        mesh.appendChild(entry)
+        bsdf = doc.createElement("bsdf")
+        bsdf.setAttribute("type", "diffuse")
+        color = doc.createElement("color")
+        color.setAttribute("name", "albedo")
+        color.setAttribute("value", "0.750000,0.750000,0.750000")
+        bsdf.appendChild(color)
+        mesh.appendChild(bsdf)
+        root.appendChild(mesh)
+
+def xml_dom(filepath, elements):
+    doc = Document()
+    root = doc.appendChild(doc.createElement("scene"))
+    build_xml(doc, root, elements)
+    with open(filepath, "w") as f:
+        doc.writexml(f, "", "\t", "\n")
+
+def xml_stream(filepath, elements):
+    doc = StreamingDocument.open(filepath)
+    root = doc.appendChild(doc.createElement("scene"))
+    build_xml(doc, root, elements)
+    doc.close()
+
+def bench_xml(directory, sizes, repeat):
+    results = []
+    for elements in sizes:
+        for name, func in (("xml_dom", xml_dom), ("xml_stream", xml_stream)):
+            filepath = os.path.join(directory, name + ".xml")
+            elapsed, peak, _ = measure(func, filepath, elements, repeat=repeat)
+            results.append(result_entry(name, {"elements": elements}, elapsed, peak, os.path.getsize(filepath)))
+    return results
+
+######################
+# mesh extraction and encoding
+######################
+def bench_meshes(directory, sizes, repeat):
+    results = []
+    for triangles in sizes:
+        ob = stub_scene.StubObject("Sphere", mesh=stub_scene.StubMesh(*stub_scene.uv_sphere(triangles)))
+        elapsed, peak, data = measure(extract_mesh_data, ob, repeat=repeat)
+        params = {"triangles": data.triangle_count}
+        results.append(result_entry("mesh_extract", params, elapsed, peak))
+        for fmt, writer in sorted(MESH_WRITERS.items()):
+            filepath = os.path.join(directory, "sphere." + fmt.lower())
+            elapsed, peak, _ = measure(writer, filepath, data, repeat=repeat)
+            results.append(result_entry("encode_" + fmt.lower(), params, elapsed, peak, os.path.getsize(filepath)))
+    return results
+
+######################
+# full export of synthetic scenes
+######################
+SCENES = [
+    {"objects": 100, "triangles": 1000, "materials": 8, "textures": 4, "instances": 0},
+    {"objects": 20, "triangles": 50000, "materials": 4, "textures": 2, "instances": 0},
+    {"objects": 10, "triangles": 1000, "materials": 4, "textures": 0, "instances": 1000},
+]
+QUICK_SCENES = [
+    {"objects": 10, "triangles": 500, "materials": 2, "textures": 1, "instances": 10},
+]
+CONFIGS = [
+    {"xml_backend": "STREAM", "mesh_format": "OBJ", "mesh_workers": 2},
+    {"xml_backend": "STREAM", "mesh_format": "PLY", "mesh_workers": 2},
+    {"xml_backend": "DOM", "mesh_format": "OBJ", "mesh_workers": 0},
+    {"xml_backend": "STREAM", "mesh_format": "OBJ", "mesh_workers": 2, "export_culling": True},
+    {"xml_backend": "STREAM", "mesh_format": "OBJ", "mesh_workers": 2, "export_lod": True},
+    {"xml_backend": "STREAM", "mesh_format": "PLY", "mesh_workers": 2, "optimize_meshes": True},
+    {"xml_backend": "STREAM", "mesh_format": "OBJ", "mesh_workers": 2, "export_textures": True, "texture_processing": True,
+     "texture_footprint": True, "texture_mip_levels": 4},
+]
+
+def export(context, filepath, config):
+    writer = NoriWriter(context, filepath)
+    writer.verbose = lambda text: None
+    writer.setExportMeshesWorld(True)
+    for key, value in config.items():
+        setattr(writer, key, value)
+    writer.write(True, True, 16)
+
+def bench_export(directory, scenes, repeat):
+    results = []
+    for scene in scenes:
+        scene_dir = os.path.join(directory, "scene")
+        context = stub_scene.build_scene(scene_dir, **scene)
+        for config in CONFIGS:
+            out_dir = os.path.join(directory, "export")
+            def run():
+                shutil.rmtree(out_dir, ignore_errors=True)
+                os.makedirs(out_dir)
+                export(context, os.path.join(out_dir, "scene.xml"), config)
+            elapsed, peak, _ = measure(run, repeat=repeat)
+            params = dict(scene, **config)
+            results.append(result_entry("export", params, elapsed, peak, dir_size(out_dir)))
+        shutil.rmtree(scene_dir, ignore_errors=True)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="small sizes, to check that everything runs")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best time is kept")
+    parser.add_argument("--output", default="bench_core.json", help="json file receiving the results")
+    parser.add_argument("--baseline", help="json of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative increase reported as a regression")
+    args = parser.parse_args(argv)
+
+    repeat = 1 if args.quick else args.repeat
+    directory = tempfile.mkdtemp(prefix="nori_bench_")
+    try:
+        results = bench_xml(directory, [1000] if args.quick else [1000, 100000], repeat)
+        results += bench_meshes(directory, [1000] if args.quick else [10000, 1000000], repeat)
+        results += bench_export(directory, QUICK_SCENES if args.quick else SCENES, repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print_results(results)
+    save_results(args.output, results, "core")
+    print("Results written to " + args.output)
+    if args.baseline:
+        regressions = compare_results(args.baseline, results, args.tolerance)
+        if regressions:
+            print("%d regressions above %d%%" % (len(regressions), 100 * args.tolerance))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
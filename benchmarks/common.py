@@ -0,0 +1,72 @@
+import os, sys, json, time, platform, tracemalloc
+
+# -----------------------------------------------------------------------------
+# Shared helpers of the benchmark scripts: measurement, json results and
+# regression check against a previous run.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(func, *args, repeat=1):
+    """Run func(*args) repeat times, returns (best time, peak traced memory, last result)"""
+    best, peak, result = None, 0, None
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+            elapsed = time.perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, peak, result
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def result_entry(name, params, elapsed, peak_memory, output_bytes=None, **extra):
+    entry = {"name": name, "params": params, "time": elapsed,
+             "peak_memory": peak_memory, "output_bytes": output_bytes}
+    entry.update(extra)
+    return entry
+
+def save_results(filepath, results, suite):
+    data = {
+        "suite": suite,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(filepath, "w") as f:
+        json.dump(data, f, indent=1)
+
+def compare_results(baseline_path, results, tolerance=0.2):
+    """Print the time/memory changes against a previous json, returns the regressions"""
+    with open(baseline_path) as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if old is None:
+            continue
+        for key in ("time", "peak_memory", "output_bytes"):
+            if not old.get(key) or r.get(key) is None:
+                continue
+            change = r[key] / old[key] - 1.0
+            flag = ""
+            if change > tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append((r["name"], r["params"], key, change))
+            print("%-16s %-48s %-12s %+7.1f%%%s" % (r["name"], json.dumps(r["params"], sort_keys=True), key, 100 * change, flag))
+    return regressions
+
+def print_results(results):
+    for r in results:
+        size = "%.2f MB" % (r["output_bytes"] / (1 << 20)) if r.get("output_bytes") is not None else ""
+        print("%-16s %-48s %9.4fs %9.2f MB %s" % (r["name"], json.dumps(r["params"], sort_keys=True),
+                                                r["time"], r["peak_memory"] / (1 << 20), size))
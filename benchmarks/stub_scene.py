@@ -0,0 +1,199 @@
+import os, sys
+from types import SimpleNamespace
+
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# Synthetic scenes for the stub bpy of benchmarks/stubs
+#
+# Only the attributes read by io_nori are provided. Meshes are backed by
+# numpy arrays served through foreach_get, like the real bpy collections,
+# so the extraction cost measured here is the one of the add-on code.
+
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+if STUBS_DIR not in sys.path:
+    sys.path.insert(0, STUBS_DIR)
+
+import bpy
+from mathutils import Matrix
+
+class Collection:
+    """bpy collection of n items whose properties are flat numpy arrays"""
+    def __init__(self, n, **arrays):
+        self.n = n
+        self.arrays = arrays
+
+    def __len__(self):
+        return self.n
+
+    def foreach_get(self, attr, out):
+        out[:] = self.arrays[attr].ravel()
+
+class StubMesh:
+    def __init__(self, positions, polygons, nb_materials=1):
+        """positions (V, 3), polygons (P, 4) quads"""
+        nb_polys = len(polygons)
+        loops = polygons.ravel()
+        self.vertices = Collection(len(positions), co=positions)
+        self.polygons = Collection(nb_polys,
+                                   material_index=np.arange(nb_polys, dtype=np.int32) % nb_materials,
+                                   loop_total=np.full(nb_polys, 4, np.int32))
+        self.loops = Collection(len(loops), vertex_index=loops)
+        starts = np.arange(nb_polys, dtype=np.int32)[:, None] * 4
+        triangles = np.concatenate([starts + [0, 1, 2], starts + [0, 2, 3]], axis=1).reshape(-1, 3)
+        self.loop_triangles = Collection(len(triangles), loops=triangles,
+                                         polygon_index=np.repeat(np.arange(nb_polys, dtype=np.int32), 2))
+        normals = positions[loops] / np.linalg.norm(positions[loops], axis=1, keepdims=True)
+        self.corner_normals = Collection(len(loops), vector=normals)
+        uv = SimpleNamespace(data=Collection(len(loops), uv=positions[loops, :2] * 0.5 + 0.5))
+        self.uv_layers = SimpleNamespace(active=uv)
+
+def uv_sphere(triangles):
+    """Closed sphere made of quads with about the given number of triangles"""
+    rings = max(2, int(np.sqrt(triangles / 4)))
+    segments = max(3, (triangles // 2) // rings)
+    theta = np.linspace(0.0, np.pi, rings + 1)
+    phi = np.linspace(0.0, 2 * np.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+    positions = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], axis=-1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(rings), np.arange(segments), indexing="ij")
+    a = i * segments + j
+    b = i * segments + (j + 1) % segments
+    polygons = np.stack([a, b, b + segments, a + segments], axis=-1).reshape(-1, 4).astype(np.int32)
+    return positions.astype(np.float32), polygons
+
+class StubObject:
+    def __init__(self, name, type="MESH", mesh=None, materials=(), matrix=None, data=None, visible=True):
+        self.name = self.name_full = name
+        self.type = type
+        self.mesh = mesh
+        self.data = data or SimpleNamespace(name=name + "_data", materials=list(materials))
+        self.material_slots = [SimpleNamespace(name=m.name, material=m, link="DATA") for m in materials]
+        self.matrix_world = Matrix(matrix) if matrix is not None else Matrix()
+        self.location = self.matrix_world.to_translation()
+        self.bound_box = [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]
+        self.modifiers = []
+        self.parent = None
+        self.hide_render = not visible
+        self.visible = visible
+        self.properties = {}
+        self.nori_cull_exempt = False
+
+    original = property(lambda self: self)
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def visible_get(self):
+        return self.visible
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.mesh
+
+    def to_mesh_clear(self):
+        pass
+
+    def select_set(self, state):
+        pass
+
+class ObjectList(list):
+    """scene.objects: a list with the name lookup of bpy collections"""
+    def get(self, name, default=None):
+        return next((ob for ob in self if ob.name == name), default)
+
+class NodeCollection(dict):
+    """node_tree.nodes, node.inputs: name lookup, iterating gives the items like bpy collections"""
+    def __iter__(self):
+        return iter(self.values())
+
+def _socket(name, value, links=()):
+    return SimpleNamespace(name=name, identifier=name, default_value=value, links=list(links))
+
+def _sockets(values):
+    return NodeCollection((name, _socket(name, value)) for name, value in values.items())
+
+def material(name, color, texture=None, emission=None):
+    inputs = {k: 0.5 for k in ("Metallic", "Subsurface Weight", "Specular IOR Level", "Roughness",
+                               "Anisotropic", "Sheen Weight", "Coat Weight", "Coat Roughness")}
+    inputs["Sheen Tint"] = (1.0, 1.0, 1.0, 1.0)
+    inputs["Specular Tint"] = (1.0, 1.0, 1.0, 1.0)
+    inputs["Base Color"] = tuple(color) + (1.0,)
+    inputs = _sockets(inputs)
+    nodes = NodeCollection({"Principled BSDF": SimpleNamespace(name="Principled BSDF", bl_idname="ShaderNodeBsdfPrincipled",
+                                                type="BSDF_PRINCIPLED", inputs=inputs)})
+    if texture is not None:
+        # the pixels Blender would decode from the file
+        pixels = SimpleNamespace(foreach_get=lambda buffer: buffer.__setitem__(slice(None), np.linspace(0.0, 1.0, len(buffer))))
+        image = SimpleNamespace(name=os.path.basename(texture), filepath=texture, filepath_raw=texture,
+                                size=(256, 256), channels=4, is_float=False, depth=32, pixels=pixels)
+        node = SimpleNamespace(name="Image Texture", bl_label="Image Texture", bl_idname="ShaderNodeTexImage",
+                               image=image, interpolation="Linear", extension="REPEAT", projection="FLAT", inputs=NodeCollection())
+        inputs["Base Color"].links = [SimpleNamespace(from_node=node)]
+        nodes["Image Texture"] = node
+    if emission is not None:
+        nodes["Emission"] = SimpleNamespace(name="Emission", bl_idname="ShaderNodeEmission",
+                                            inputs=_sockets({"Strength": emission, "Color": (1.0, 1.0, 1.0, 1.0)}))
+    return SimpleNamespace(name=name, name_full=name, diffuse_color=(0.8, 0.8, 0.8, 1.0),
+                           node_tree=SimpleNamespace(nodes=nodes, links=[]))
+
+def _translation(x, y, z):
+    return [[1, 0, 0, x], [0, 1, 0, y], [0, 0, 1, z], [0, 0, 0, 1]]
+
+def build_scene(directory, objects=10, triangles=1000, materials=4, textures=2, instances=0, seed=0):
+    """Fill the stub bpy.context with a synthetic scene, returns the context
+
+    objects spheres of about `triangles` triangles share `materials` materials,
+    the first `textures` of them use their own image file written in
+    directory. `instances` depsgraph instances of an extra hidden sphere are
+    scattered around."""
+    rng = np.random.default_rng(seed)
+    texture_dir = os.path.join(directory, "sources")
+    os.makedirs(texture_dir, exist_ok=True)
+    mats = []
+    for i in range(max(1, materials)):
+        texture = None
+        if i < textures:
+            texture = os.path.join(texture_dir, "texture_%03d.png" % i)
+            with open(texture, "wb") as f:
+                f.write(rng.bytes(64 * 1024))
+        mats.append(material("Material.%03d" % i, rng.random(3), texture))
+
+    mesh = StubMesh(*uv_sphere(triangles), nb_materials=2)
+    side = int(np.ceil(np.sqrt(max(1, objects))))
+    scene_objects = []
+    for i in range(objects):
+        slots = [mats[i % len(mats)], mats[(i + 1) % len(mats)]]
+        # every object has its own mesh data, the arrays are shared to keep the setup cheap
+        scene_objects.append(StubObject("Object.%05d" % i, mesh=mesh, materials=slots,
+                                        matrix=_translation(3 * (i % side), 3 * (i // side), 0)))
+
+    object_instances = []
+    if instances:
+        source = StubObject("InstanceSource", mesh=StubMesh(*uv_sphere(triangles)), materials=mats[:1], visible=False)
+        offsets = rng.uniform(-50, 50, (instances, 3))
+        for offset in offsets:
+            object_instances.append(SimpleNamespace(object=source, parent=scene_objects[0] if scene_objects else source,
+                                                    is_instance=True, matrix_world=Matrix(_translation(*offset))))
+
+    camera = StubObject("Camera", type="CAMERA", matrix=[[1, 0, 0, 0], [0, 0, -1, -10], [0, 1, 0, 0], [0, 0, 0, 1]],
+                        data=SimpleNamespace(name="Camera", type="PERSP", angle=0.69, clip_start=0.1, clip_end=1000.0, sensor_fit="AUTO",
+                                             dof=SimpleNamespace(use_dof=False, focus_distance=10.0, aperture_fstop=2.8)))
+    light = StubObject("Light", type="LIGHT", data=SimpleNamespace(name="Light", type="POINT", energy=1000.0, color=(1.0, 1.0, 1.0)),
+                       matrix=_translation(0, 0, 10))
+
+    all_objects = ObjectList([camera, light] + scene_objects)
+    scene = SimpleNamespace(name="Scene", objects=all_objects, camera=camera, timeline_markers=[],
+                            render=SimpleNamespace(resolution_x=640, resolution_y=480, resolution_percentage=100, fps=24,
+                                                   pixel_aspect_x=1.0, pixel_aspect_y=1.0),
+                            cycles=SimpleNamespace(samples=16),
+                            frame_current=1, frame_start=1, frame_end=1, frame_step=1)
+    scene.frame_set = lambda frame: setattr(scene, "frame_current", frame)
+    depsgraph = SimpleNamespace(scene=scene, object_instances=object_instances, updates=[])
+    bpy.data.cameras = {"Camera": camera.data}
+    bpy.context = SimpleNamespace(scene=scene, evaluated_depsgraph_get=lambda: depsgraph, window_manager=None,
+                                  view_layer=SimpleNamespace(objects=all_objects),
+                                  collection=SimpleNamespace(objects=SimpleNamespace(link=lambda ob: None)))
+    return bpy.context
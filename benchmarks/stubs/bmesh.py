@@ -0,0 +1,2 @@
+def new():
+    raise NotImplementedError("bmesh is not available outside Blender, use the 'REFERENCE' instance mode")
@@ -0,0 +1,17 @@
+import os
+from types import SimpleNamespace
+from . import props, types, utils, app
+
+class _Operator:
+    def __call__(self, **kwargs):
+        return {'FINISHED'}
+
+    def poll(self):
+        return False
+
+ops = SimpleNamespace(object=SimpleNamespace(mode_set=_Operator()),
+                      wm=SimpleNamespace(obj_export=_Operator(), ply_export=_Operator()))
+path = SimpleNamespace(abspath=os.path.abspath)
+data = SimpleNamespace(filepath="", worlds={"World": SimpleNamespace(node_tree=None)},
+                       cameras={}, materials=[], images=[], objects=[], meshes=[])
+context = None # set by stub_scene.make_context
@@ -0,0 +1,16 @@
+class handlers:
+    depsgraph_update_post = []
+    load_post = []
+
+class timers:
+    @staticmethod
+    def register(func, first_interval=0, persistent=False):
+        pass
+
+    @staticmethod
+    def is_registered(func):
+        return False
+
+    @staticmethod
+    def unregister(func):
+        pass
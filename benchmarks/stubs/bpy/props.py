@@ -0,0 +1,5 @@
+def _property(**kwargs):
+    return kwargs
+
+StringProperty = BoolProperty = IntProperty = FloatProperty = EnumProperty = _property
+PointerProperty = CollectionProperty = FloatVectorProperty = _property
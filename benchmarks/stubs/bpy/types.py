@@ -0,0 +1,24 @@
+class Operator:
+    def report(self, kind, message):
+        print(kind, message)
+
+class Panel:
+    pass
+
+class PropertyGroup:
+    pass
+
+class Object:
+    pass
+
+class Scene:
+    pass
+
+class TOPBAR_MT_file_export:
+    @staticmethod
+    def append(func):
+        pass
+
+    @staticmethod
+    def remove(func):
+        pass
@@ -0,0 +1,5 @@
+def register_class(cls):
+    pass
+
+def unregister_class(cls):
+    pass
@@ -0,0 +1,9 @@
+from mathutils import Matrix
+
+class ExportHelper:
+    pass
+
+def axis_conversion(from_forward='Y', from_up='Z', to_forward='Y', to_up='Z'):
+    if (from_forward, from_up) != (to_forward, to_up):
+        raise NotImplementedError("the stub only supports the identity conversion")
+    return Matrix([[1, 0, 0], [0, 1, 0], [0, 0, 1]])
@@ -0,0 +1,20 @@
+class ProgressReport:
+    def __init__(self, wm=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def enter_substeps(self, nbr, msg=""):
+        pass
+
+    def leave_substeps(self, msg=""):
+        pass
+
+    def step(self, msg="", nbr=1):
+        pass
+
+ProgressReportSubstep = ProgressReport
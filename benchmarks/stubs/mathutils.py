@@ -0,0 +1,94 @@
+import numpy as np
+
+class Matrix:
+    def __init__(self, rows=None):
+        self.m = np.identity(4) if rows is None else np.array(rows, float)
+
+    @classmethod
+    def Identity(cls, size):
+        return cls(np.identity(size))
+
+    @classmethod
+    def Translation(cls, vector):
+        m = np.identity(4)
+        m[:3, 3] = list(vector)
+        return cls(m)
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self.m @ other.m)
+        v = np.ones(len(self.m))
+        v[:len(other)] = list(other)
+        return Vector((self.m @ v)[:3])
+
+    def __getitem__(self, i):
+        return self.m[i]
+
+    def __len__(self):
+        return len(self.m)
+
+    def __iter__(self):
+        return iter(self.m)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.m if dtype is None else self.m.astype(dtype)
+
+    def copy(self):
+        return Matrix(self.m.copy())
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self.m))
+
+    inverted_safe = inverted
+
+    def to_4x4(self):
+        m = np.identity(4)
+        m[:len(self.m), :len(self.m)] = self.m
+        return Matrix(m)
+
+    def to_3x3(self):
+        return Matrix(self.m[:3, :3])
+
+    def to_translation(self):
+        return Vector(self.m[:3, 3])
+
+class Vector:
+    def __init__(self, v=(0.0, 0.0, 0.0)):
+        self.v = np.array(list(v), float)
+
+    x = property(lambda self: self.v[0])
+    y = property(lambda self: self.v[1])
+    z = property(lambda self: self.v[2])
+
+    def __getitem__(self, i):
+        return self.v[i]
+
+    def __len__(self):
+        return len(self.v)
+
+    def __iter__(self):
+        return iter(self.v)
+
+    def __add__(self, other):
+        return Vector(self.v + np.array(list(other)))
+
+    def __sub__(self, other):
+        return Vector(self.v - np.array(list(other)))
+
+    def __mul__(self, k):
+        return Vector(self.v * k)
+
+    def dot(self, other):
+        return float(self.v @ np.array(list(other)))
+
+    @property
+    def length(self):
+        return float(np.linalg.norm(self.v))
+
+    def normalized(self):
+        return Vector(self.v / np.linalg.norm(self.v))
+
+    def copy(self):
+        return Vector(self.v.copy())
+
+Color = Vector
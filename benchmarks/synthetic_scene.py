@@ -0,0 +1,89 @@
+import os
+import bpy
+
+# -----------------------------------------------------------------------------
+# Parametric scenes for bench_blender.py, built with the real bpy API
+#
+# objects UV spheres of about `triangles` triangles share `materials`
+# Principled materials, the first `textures` of them sample their own
+# generated image. `instances` vertices of a point cloud instance a hidden
+# sphere (instancing type VERTS), which shows up in the depsgraph as
+# object instances.
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+def _sphere_mesh(name, triangles):
+    rings = max(2, int((triangles / 4) ** 0.5))
+    segments = max(3, (triangles // 2) // rings)
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=segments, ring_count=rings)
+    ob = bpy.context.active_object
+    ob.data.name = name
+    mesh = ob.data
+    bpy.data.objects.remove(ob, do_unlink=True)
+    return mesh
+
+def _material(name, color, image=None):
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    principled = mat.node_tree.nodes["Principled BSDF"]
+    principled.inputs["Base Color"].default_value = tuple(color) + (1.0,)
+    if image is not None:
+        node = mat.node_tree.nodes.new("ShaderNodeTexImage")
+        node.image = image
+        mat.node_tree.links.new(node.outputs["Color"], principled.inputs["Base Color"])
+    return mat
+
+def _image(name, directory, size=256):
+    image = bpy.data.images.new(name, size, size)
+    image.generated_type = "UV_GRID"
+    image.filepath_raw = os.path.join(directory, name + ".png")
+    image.file_format = "PNG"
+    image.save()
+    return image
+
+def build_scene(directory, objects=10, triangles=1000, materials=4, textures=2, instances=0):
+    """Replace the current scene by a synthetic one, textures are saved in directory"""
+    reset_scene()
+    scene = bpy.context.scene
+    os.makedirs(directory, exist_ok=True)
+
+    mats = []
+    for i in range(max(1, materials)):
+        image = _image("texture_%03d" % i, directory) if i < textures else None
+        mats.append(_material("Material.%03d" % i, ((i * 0.37) % 1.0, (i * 0.61) % 1.0, (i * 0.83) % 1.0), image))
+
+    side = max(1, int(objects ** 0.5 + 0.999))
+    for i in range(objects):
+        # every object gets its own mesh datablock, like a scene of unique props
+        mesh = _sphere_mesh("Mesh.%05d" % i, triangles)
+        mesh.materials.append(mats[i % len(mats)])
+        ob = bpy.data.objects.new("Object.%05d" % i, mesh)
+        ob.location = (3.0 * (i % side), 3.0 * (i // side), 0.0)
+        scene.collection.objects.link(ob)
+
+    if instances:
+        source = bpy.data.objects.new("InstanceSource", _sphere_mesh("InstanceMesh", triangles))
+        source.data.materials.append(mats[0])
+        scene.collection.objects.link(source)
+        cloud = bpy.data.meshes.new("InstancePoints")
+        cloud.vertices.add(instances)
+        side = max(1, int(instances ** 0.5 + 0.999))
+        cloud.vertices.foreach_set("co", [c for i in range(instances)
+                                          for c in (3.0 * (i % side), -3.0 * (1 + i // side), 0.0)])
+        emitter = bpy.data.objects.new("InstanceEmitter", cloud)
+        emitter.instance_type = "VERTS"
+        scene.collection.objects.link(emitter)
+        source.parent = emitter
+
+    camera = bpy.data.objects.new("Camera", bpy.data.cameras.new("Camera"))
+    camera.location = (0.0, -20.0, 10.0)
+    camera.rotation_euler = (1.1, 0.0, 0.0)
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+    light = bpy.data.objects.new("Light", bpy.data.lights.new("Light", "POINT"))
+    light.location = (0.0, 0.0, 10.0)
+    scene.collection.objects.link(light)
+
+    bpy.context.view_layer.update()
+    return scene
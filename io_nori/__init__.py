@@ -9,7 +9,7 @@ bl_info = {
     "wiki_url": "",
     "category": "Export"}
 
-import bpy, os, math, shutil
+import bpy, os, math, shutil, time
 from mathutils import Matrix, Vector, Color
 from xml.dom.minidom import Document
 
@@ -28,6 +28,7 @@ from bpy_extras.wm_utils.progress_report import (
 
 from .nori_writer import *
 from .menu import *
+from . import live_sync
 
 ######################
 # blender code
@@ -75,6 +76,59 @@ class NoriExporter(Operator, ExportHelper):
                     description="Convert faces to triangles.",
                     default=True)
 
+    export_meshes_dedup : BoolProperty(
+                    name="Share identical meshes",
+                    description="Write identical geometry once and place every object with a toWorld transform. \
+                     Needs the native mesh writer.",
+                    default=False)
+
+    export_incremental : BoolProperty(
+                    name="Incremental export",
+                    description="Only rewrite meshes and textures that changed since the last export \
+                     (tracked in a manifest next to the xml) and remove stale files",
+                    default=False)
+
+    texture_transfer : EnumProperty(name="Texture transfer",
+                    description="How textures are placed in the textures folder",
+                    items=[("REFLINK", "Clone", "Copy-on-write clone where the file system supports it, copy otherwise"),
+                           ("HARDLINK", "Hard link", "Hard link to the source texture where possible, copy otherwise"),
+                           ("COPY", "Copy", "Always copy the texture files")],
+                    default="REFLINK")
+
+    texture_verify_hash : BoolProperty(name="Verify texture contents",
+                    description="Also compare the contents of textures whose size and modification time \
+                     did not change before skipping them (slower)",
+                    default=False)
+
+    mesh_workers : IntProperty(name="Mesh workers",
+                    description="Number of workers encoding and writing mesh files while Blender extracts \
+                     the next meshes (0 or 1: write them on the main thread)",
+                    default=2, min=0, max=64)
+
+    mesh_worker_mode : EnumProperty(name="Mesh worker type",
+                    description="Kind of workers used to encode mesh files",
+                    items=[("THREAD", "Threads", "Threads, cheap to start, overlap file I/O with the export"),
+                           ("PROCESS", "Processes", "Forked processes, also run the text encoding in parallel (Linux only, threads elsewhere)")],
+                    default="THREAD")
+
+    instance_mode : EnumProperty(name="Instances",
+                    description="How object instances (particles, geometry nodes, collections) are exported",
+                    items=[("REFERENCE", "Reference", "Write each source mesh once and reference it with one transform per instance"),
+                           ("MERGE", "Merge", "Join all the instances of a source into a single mesh")],
+                    default="REFERENCE")
+
+    export_animation : BoolProperty(
+                    name="Export animation",
+                    description="Write one xml per frame of the scene frame range (scene_0001.xml, ...). \
+                     Meshes that do not deform are written once and shared by all frames.",
+                    default=False)
+
+    export_profile : BoolProperty(
+                    name="Profile export",
+                    description="Record the time and memory spent in every export step and object, \
+                     write them to <scene>.profile.json and print a summary in the console",
+                    default=False)
+
     nb_samples : IntProperty(name="Numbers of camera rays",
                     description="Number of camera ray",
                     default=32)
@@ -87,23 +141,307 @@ class NoriExporter(Operator, ExportHelper):
                     description="Export thin-lens camera model parameters (1/f, focal distance) ",
                     default=False)
 
-    def execute(self, context):
+    xml_backend : EnumProperty(name="XML writer",
+                    description="How the scene description is serialized",
+                    items=[("STREAM", "Streaming", "Write entries to disk as they are created (flat memory use)"),
+                           ("DOM", "DOM", "Build the whole document in memory with minidom before writing it")],
+                    default="STREAM")
+
+    mesh_backend : EnumProperty(name="Mesh writer",
+                    description="How mesh geometry is written to the OBJ files",
+                    items=[("NATIVE", "Native", "Bulk-read evaluated meshes and write them with the built-in writer"),
+                           ("OPERATOR", "OBJ operator", "Call Blender's OBJ export operator once per object")],
+                    default="NATIVE")
+
+    mesh_format : EnumProperty(name="Mesh format",
+                    description="File format of the exported meshes",
+                    items=[("OBJ", "OBJ", "Wavefront OBJ text files"),
+                           ("PLY", "Binary PLY", "Little-endian binary PLY files, smaller and faster to load")],
+                    default="OBJ")
+
+    export_modal : BoolProperty(
+                    name="Keep UI responsive",
+                    description="Export a few objects at a time between UI events, with a progress report. \
+                     The scene cannot be edited meanwhile, press Esc to cancel",
+                    default=False)
+
+    export_staging : BoolProperty(
+                    name="Atomic output",
+                    description="Write the export to a hidden staging folder and move the files next to the xml \
+                     only once it succeeded, a failed or cancelled export leaves the previous one untouched",
+                    default=False)
+
+    export_culling : BoolProperty(
+                    name="Cull out of view objects",
+                    description="Skip the objects and instances whose bounds are outside of the camera view. \
+                     Objects with \"Always export\" set (shadow casters, emitters) are kept",
+                    default=False)
+
+    culling_margin : FloatProperty(name="Culling margin",
+                    description="Fraction of the view added on every side before culling",
+                    default=0.1, min=0.0, max=10.0)
+
+    culling_distance : FloatProperty(name="Culling distance",
+                    description="Objects farther from the camera are culled, 0 uses the camera clip end",
+                    default=0.0, min=0.0, subtype='DISTANCE')
+
+    export_lod : BoolProperty(
+                    name="Screen space level of detail",
+                    description="Decimate the meshes that cover few pixels in the camera view, Blender meshes are \
+                     not modified. Decimated meshes are cached next to the xml",
+                    default=False)
+
+    lod_triangles_per_pixel : FloatProperty(name="Triangles per pixel",
+                    description="Triangle budget of a mesh per pixel it covers",
+                    default=1.0, min=0.001, max=100.0)
+
+    export_env_importance : BoolProperty(
+                    name="Environment importance tables",
+                    description="Precompute the luminance sampling tables of the environment map in a sidecar file \
+                     next to the image, so the renderer does not build them at every load",
+                    default=False)
+
+    env_mip_levels : IntProperty(name="Environment mip levels",
+                    description="Downsampled luminance levels stored with the tables",
+                    default=0, min=0, max=16)
+
+    texture_processing : BoolProperty(
+                    name="Process textures",
+                    description="Convert 8-bit textures to PNG, downsized and with mip levels, on the texture workers. \
+                     Results are cached next to the xml",
+                    default=False)
+
+    texture_max_size : IntProperty(name="Maximum texture size",
+                    description="Largest side of a processed texture in pixels, 0 for no limit",
+                    default=0, min=0, max=65536)
+
+    texture_footprint : BoolProperty(
+                    name="Fit textures to screen size",
+                    description="Also downsize the textures of objects that are small in the camera view",
+                    default=False)
+
+    texture_mip_levels : IntProperty(name="Texture mip levels",
+                    description="Mip levels written next to each processed texture",
+                    default=0, min=0, max=16)
+
+    optimize_meshes : BoolProperty(
+                    name="Optimize meshes",
+                    description="Weld duplicate vertices, drop unused attributes and reorder faces and vertices \
+                     for memory locality before writing the mesh files",
+                    default=False)
+
+    farm_jobs : IntProperty(name="Render farm jobs",
+                    description="Also write this many job descriptions sharing the meshes and textures, \
+                     and a job manifest (0 or 1: none)",
+                    default=0, min=0, max=4096)
+
+    farm_split : EnumProperty(name="Split jobs by",
+                    items=(("TILES", "Tiles", "Each job renders a crop window of the image"),
+                           ("SAMPLES", "Samples", "Each job renders a slice of the samples with its own seed")),
+                    default="TILES")
+
+    camera_batch : EnumProperty(name="Camera batch",
+                    items=(("NONE", "None", "Only export the first camera"),
+                           ("CAMERAS", "All cameras", "Also write one xml per camera of the scene"),
+                           ("MARKERS", "Marker cameras", "Also write one xml per timeline marker bound to a camera")),
+                    description="Extra scene descriptions sharing the meshes and textures, only their camera differs",
+                    default="NONE")
+
+    memory_budget : IntProperty(name="Memory budget (MB)",
+                    description="Log the objects whose export grows the resident memory by more than this, \
+                     and limit the mesh data waiting for the workers to half of it (0: no budget)",
+                    default=0, min=0, max=1 << 20)
+
+    shared_assets : BoolProperty(name="Shared assets",
+                    description="Name mesh files after their content and only write the missing ones, \
+                     so several scenes exported to this folder share them",
+                    default=False)
+
+    cache_dir : StringProperty(name="Cache folder",
+                    description="Folder of the level of detail and texture caches, shared between exports \
+                     (empty: next to the xml)",
+                    default="", subtype='DIR_PATH')
+
+    export_report : BoolProperty(name="Render cost report",
+                    description="Write triangle counts, estimated memory, emitters and bsdf types of the scene \
+                     to a json file next to the xml, and flag the objects and textures that dominate",
+                    default=False)
+
+    report_max_triangles : IntProperty(name="Triangle budget",
+                    description="Warn when the scene has more triangles (0: no budget)",
+                    default=0, min=0)
+
+    report_max_memory : IntProperty(name="Memory budget of the renderer (MB)",
+                    description="Warn when the estimated geometry and texture memory is higher (0: no budget)",
+                    default=0, min=0)
+
+    time_slice = 0.1 # seconds of export work between two UI updates in modal mode
+
+    def create_writer(self, context):
         nori = NoriWriter(context, self.filepath)
+        nori.xml_backend = self.xml_backend
+        nori.mesh_backend = self.mesh_backend
+        nori.mesh_format = self.mesh_format
         nori.setExportMeshesWorld(self.export_meshes_in_world)
         nori.export_triangular = self.export_meshes_triangular
+        nori.export_meshes_dedup = self.export_meshes_dedup
+        nori.export_incremental = self.export_incremental
+        nori.texture_transfer = self.texture_transfer
+        nori.texture_verify_hash = self.texture_verify_hash
+        nori.mesh_workers = self.mesh_workers
+        nori.mesh_worker_mode = self.mesh_worker_mode
+        nori.instance_mode = self.instance_mode
+        nori.export_animation = self.export_animation
+        nori.export_profile = self.export_profile
+        nori.frame_start = context.scene.frame_start
+        nori.frame_end = context.scene.frame_end
+        nori.frame_step = context.scene.frame_step
         nori.export_textures = self.export_textures
         nori.export_thin_lens = self.export_thin_lens
+        nori.export_staging = self.export_staging
+        nori.export_culling = self.export_culling
+        nori.culling_margin = self.culling_margin
+        nori.culling_distance = self.culling_distance
+        nori.export_lod = self.export_lod
+        nori.lod_triangles_per_pixel = self.lod_triangles_per_pixel
+        nori.export_env_importance = self.export_env_importance
+        nori.env_mip_levels = self.env_mip_levels
+        nori.texture_processing = self.texture_processing
+        nori.texture_max_size = self.texture_max_size
+        nori.texture_footprint = self.texture_footprint
+        nori.texture_mip_levels = self.texture_mip_levels
+        nori.optimize_meshes = self.optimize_meshes
+        nori.farm_jobs = self.farm_jobs
+        nori.farm_split = self.farm_split
+        nori.camera_batch = self.camera_batch
+        nori.memory_budget = self.memory_budget
+        nori.shared_assets = self.shared_assets
+        nori.cache_dir = bpy.path.abspath(self.cache_dir) if self.cache_dir else ""
+        nori.export_report = self.export_report
+        nori.report_max_triangles = self.report_max_triangles
+        nori.report_max_memory = self.report_max_memory
+        return nori
+
+    def execute(self, context):
+        if self.export_modal and context.window is not None and not bpy.app.background:
+            # the operator context does not outlive execute, the writer keeps bpy.context
+            self.nori = self.create_writer(bpy.context)
+            self.steps = self.nori.write_steps(self.export_light, self.export_material_colors, bpy.context.scene.cycles.samples)
+            self.progress = 0.0
+            wm = context.window_manager
+            self.timer = wm.event_timer_add(0.01, window=context.window)
+            wm.modal_handler_add(self)
+            return {'RUNNING_MODAL'}
+
+        nori = self.create_writer(context)
         nori.write(self.export_light, self.export_material_colors, bpy.context.scene.cycles.samples)
+        self.report_done(nori)
         return {'FINISHED'}
 
-    def invoke(self, context, event):
-        #self.frame_start = context.scene.frame_start
-        #self.frame_end = context.scene.frame_end
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.steps.close() # stops the workers and removes the staged files
+            self.finish_modal(context)
+            self.report({'WARNING'}, "Nori export cancelled, " + self.kept_output())
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER' or event.timer is not self.timer:
+            # the scene must not change under the export, other input is swallowed
+            return {'RUNNING_MODAL'}
+
+        # export objects until the time slice is used, then give the UI back
+        deadline = time.perf_counter() + self.time_slice
+        try:
+            while time.perf_counter() < deadline:
+                self.progress = next(self.steps)
+        except StopIteration:
+            self.finish_modal(context)
+            self.report_done(self.nori)
+            return {'FINISHED'}
+        except Exception as e:
+            self.finish_modal(context)
+            self.report({'ERROR'}, "Nori export failed, %s: %s" % (self.kept_output(), e))
+            return {'CANCELLED'}
+
+        context.workspace.status_text_set("Nori export: %d%% (Esc to cancel)" % (100 * self.progress))
+        return {'RUNNING_MODAL'}
 
+    def kept_output(self):
+        """what an unfinished export left in the output folder"""
+        if self.export_staging:
+            return "nothing was written"
+        return "the previous xml is kept but some mesh and texture files were updated"
+
+    def finish_modal(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+
+    def report_done(self, nori):
+        if nori.manifest is not None:
+            self.report({'INFO'}, "Nori export: " + nori.manifest.summary())
+
+    def invoke(self, context, event):
         wm = context.window_manager
         wm.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
+class NoriLiveSync(Operator):
+    """Send the changes of the scene to a running renderer, run again to stop"""
+    bl_idname = "nori.live_sync"
+    bl_label = "Nori live sync"
+
+    directory : StringProperty(name="Sync folder",
+                    description="Folder receiving the mesh and texture files (default: nori_live next to the .blend)",
+                    subtype='DIR_PATH',
+                    default="")
+
+    transport : EnumProperty(name="Send updates to",
+                    description="How updates reach the renderer",
+                    items=[("SOCKET", "Socket", "Newline delimited json over a local TCP connection"),
+                           ("DIRECTORY", "Folder", "One json file per update in the 'updates' folder of the sync folder")],
+                    default="SOCKET")
+
+    host : StringProperty(name="Host", default="127.0.0.1")
+
+    port : IntProperty(name="Port", default=5555, min=1, max=65535)
+
+    interval : FloatProperty(name="Update interval",
+                    description="Changes made during this many seconds are merged into one update",
+                    default=0.25, min=0.02, max=10.0)
+
+    export_light : BoolProperty(name="Export Lights", default=True)
+
+    export_material_colors : BoolProperty(name="Export BSDF properties", default=True)
+
+    export_textures : BoolProperty(name="Export Textures", default=True)
+
+    mesh_format : EnumProperty(name="Mesh format",
+                    items=[("OBJ", "OBJ", "Wavefront OBJ text files"),
+                           ("PLY", "Binary PLY", "Little-endian binary PLY files, smaller and faster to load")],
+                    default="OBJ")
+
+    def execute(self, context):
+        if live_sync.session is not None:
+            live_sync.session.stop()
+            self.report({'INFO'}, "Nori live sync stopped")
+            return {'FINISHED'}
+
+        directory = bpy.path.abspath(self.directory) if self.directory else \
+            os.path.join(os.path.dirname(bpy.data.filepath) or os.getcwd(), "nori_live")
+        if self.transport == "DIRECTORY":
+            transport = live_sync.DirectoryTransport(os.path.join(directory, "updates"))
+        else:
+            transport = live_sync.SocketTransport(self.host, self.port)
+        live_sync.LiveSync(directory, transport, self.interval, self.export_light, self.export_material_colors,
+                           self.export_textures, self.mesh_format).start()
+        self.report({'INFO'}, "Nori live sync to %s started" % transport)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if live_sync.session is not None:
+            return self.execute(context)
+        return context.window_manager.invoke_props_dialog(self)
+
 def menu_export(self, context):
     import os
     default_path = os.path.splitext(bpy.data.filepath)[0] + ".xml"
@@ -113,12 +451,22 @@ def menu_export(self, context):
 # Register Nori exporter inside blender
 def register():
     bpy.utils.register_class(NoriExporter)
+    bpy.utils.register_class(NoriLiveSync)
     bpy.utils.register_class(NoriExporterPanel)
+    bpy.utils.register_class(NoriObjectPanel)
+    bpy.types.Object.nori_cull_exempt = BoolProperty(name="Always export",
+        description="Never cull this object, for shadow casters and emitters outside of the camera view",
+        default=False)
     bpy.types.TOPBAR_MT_file_export.append(menu_export)
 
 def unregister():
+    if live_sync.session is not None:
+        live_sync.session.stop()
     bpy.utils.unregister_class(NoriExporter)
+    bpy.utils.unregister_class(NoriLiveSync)
     bpy.utils.unregister_class(NoriExporterPanel)
+    bpy.utils.unregister_class(NoriObjectPanel)
+    del bpy.types.Object.nori_cull_exempt
     bpy.types.TOPBAR_MT_file_export.remove(menu_export)
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+import os
+
+# -----------------------------------------------------------------------------
+# Atomic file writes
+#
+# Every file read by someone else (a renderer watching the folder, another
+# export sharing it, the next export) is written under a temporary name next
+# to its destination and moved in place once complete, so a reader never
+# sees a partial file and a failed write keeps the previous one. The
+# temporary name carries the process id, exports sharing a folder run in
+# other processes. Only depends on the standard library, the scripts of
+# this folder import it too.
+
+def temporary_path(filepath):
+    return "%s.%d.tmp" % (filepath, os.getpid())
+
+def _remove(path):
+    if os.path.lexists(path):
+        os.remove(path)
+
+class AtomicFile:
+    """open(filepath, mode) under a temporary name. commit() moves the
+    complete file to filepath and discard() removes it; as a context manager
+    the file is committed when the block completes, discarded if it raises"""
+
+    def __init__(self, filepath, mode="w", **kwargs):
+        self.filepath = filepath
+        self.tmp_path = temporary_path(filepath)
+        self.file = open(self.tmp_path, mode, **kwargs)
+
+    def commit(self):
+        try:
+            self.file.close()
+            os.replace(self.tmp_path, self.filepath)
+        finally:
+            _remove(self.tmp_path)
+
+    def discard(self):
+        self.file.close()
+        _remove(self.tmp_path)
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+def write_atomic(write, filepath, *args):
+    """write(temporary path, *args) then move the file to filepath, returns
+    the result of write (for writers that need a path, not a file)"""
+    tmp_path = temporary_path(filepath)
+    _remove(tmp_path)
+    try:
+        result = write(tmp_path, *args)
+        os.replace(tmp_path, filepath)
+    finally:
+        _remove(tmp_path)
+    return result
@@ -0,0 +1,170 @@
+"""Export many .blend files to Nori scenes with Blender in background mode
+
+    python batch_export.py shots/*.blend --output-dir export \\
+        [--blender blender] [--workers 4] [--retries 1] [--timeout 3600] \\
+        [--set mesh_format=PLY --set export_lod=true ...] [--options options.json] \\
+        [--summary export/batch_summary.json]
+
+Every .blend file is exported by its own "blender -b" process, at most
+--workers of them at a time, to <output-dir>/<file name>.xml. The options
+are properties of the Nori export operator (see the add-on), given as
+name=value pairs (JSON values, plain text otherwise) or as a JSON object.
+
+The scenes share the meshes and textures folders of the output folder:
+mesh and texture files are named after their content and only written when missing
+(shared_assets), and the level of detail and texture caches live in
+<output-dir>/.nori_cache (cache_dir), so the assets common to several
+shots are written once. A failed export is tried again up to --retries
+times. The output of every attempt goes to <output-dir>/logs/<name>.log,
+and the status, attempts and time of every file to the JSON summary.
+
+Blender runs this same script for every file, with --worker.
+"""
+import os, sys, json, time, shlex, hashlib, argparse, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+SUMMARY_VERSION = 1
+CACHE_DIR = ".nori_cache"
+
+######################
+# worker, inside Blender
+######################
+def export_blend(output, options):
+    """Export the opened .blend file to output with the add-on of this folder"""
+    import bpy
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import io_nori
+    if not hasattr(bpy.types, "EXPORT_OT_nori"):
+        io_nori.register()
+    result = bpy.ops.export.nori(filepath=output, **options)
+    if "FINISHED" not in result:
+        raise RuntimeError("the export of %s ended with %s" % (bpy.data.filepath, ", ".join(result)))
+
+######################
+# driver
+######################
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text # enum values and paths
+
+def output_names(blend_files):
+    """.blend path -> xml file name, files of the same name in different folders get a suffix"""
+    stems = {}
+    for path in blend_files:
+        stems.setdefault(os.path.splitext(os.path.basename(path))[0], []).append(path)
+    names = {}
+    for stem, paths in stems.items():
+        for path in paths:
+            if len(paths) > 1:
+                suffix = hashlib.blake2b(os.path.dirname(os.path.abspath(path)).encode("utf-8"), digest_size=4).hexdigest()
+                names[path] = "%s_%s.xml" % (stem, suffix)
+            else:
+                names[path] = stem + ".xml"
+    return names
+
+def export_files(blend_files, output_dir, blender="blender", options=None, workers=1, retries=1, timeout=0, log=print):
+    """Export every .blend file, returns the summary of the run"""
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(os.path.join(output_dir, "logs"), exist_ok=True)
+    options = dict({"shared_assets": True, "cache_dir": os.path.join(output_dir, CACHE_DIR)}, **(options or {}))
+    names = output_names(blend_files)
+    command = shlex.split(blender)
+    start = time.perf_counter()
+    done = [0]
+
+    def export(blend_file):
+        xml_file = os.path.join(output_dir, names[blend_file])
+        log_file = os.path.join(output_dir, "logs", os.path.splitext(names[blend_file])[0] + ".log")
+        args = command + ["-b", "--factory-startup", os.path.abspath(blend_file), "--python-exit-code", "1",
+                          "--python", os.path.abspath(__file__), "--",
+                          "--worker", "--output", xml_file, "--options", json.dumps(options)]
+        entry = {"blend": blend_file, "xml": xml_file, "log": log_file, "status": "failed", "attempts": 0, "time": 0.0}
+        with open(log_file, "w") as f:
+            for attempt in range(1 + max(retries, 0)):
+                entry["attempts"] = attempt + 1
+                f.write("# attempt %d: %s\n" % (attempt + 1, " ".join(shlex.quote(a) for a in args)))
+                f.flush()
+                attempt_start = time.perf_counter()
+                try:
+                    process = subprocess.run(args, stdout=f, stderr=subprocess.STDOUT, timeout=timeout or None)
+                    entry["returncode"] = process.returncode
+                    ok = process.returncode == 0 and os.path.exists(xml_file)
+                except subprocess.TimeoutExpired:
+                    entry["returncode"] = None
+                    f.write("\n# timed out after %ds\n" % timeout)
+                    ok = False
+                except OSError as e:
+                    # Blender could not be started, trying again does not help
+                    entry["returncode"] = None
+                    f.write("\n# %s\n" % e)
+                    entry["time"] += time.perf_counter() - attempt_start
+                    break
+                entry["time"] += time.perf_counter() - attempt_start
+                if ok:
+                    entry["status"] = "done"
+                    entry["size"] = os.path.getsize(xml_file)
+                    break
+        done[0] += 1
+        log("[%d/%d] %s: %s in %.1fs (%d attempt%s)" % (done[0], len(blend_files), blend_file, entry["status"], entry["time"],
+                                                         entry["attempts"], "s" if entry["attempts"] > 1 else ""))
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        files = list(pool.map(export, blend_files))
+    return {"version": SUMMARY_VERSION, "blender": blender, "output_dir": output_dir, "options": options,
+            "workers": workers, "time": time.perf_counter() - start,
+            "done": sum(1 for entry in files if entry["status"] == "done"),
+            "failed": sum(1 for entry in files if entry["status"] != "done"),
+            "files": files}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("blend_files", nargs="*")
+    parser.add_argument("--output-dir", help="folder receiving the scenes")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender command ($BLENDER by default)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--retries", type=int, default=1, help="attempts after a failure")
+    parser.add_argument("--timeout", type=int, default=0, help="seconds per attempt, 0 for no limit")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="export option")
+    parser.add_argument("--options", help="JSON file (or object, for --worker) of export options")
+    parser.add_argument("--summary", help="JSON run summary, <output-dir>/batch_summary.json by default")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        export_blend(args.output, json.loads(args.options) if args.options else {})
+        return 0
+
+    # not imported by the worker: Blender runs this file without its folder on sys.path
+    try:
+        from .atomic import AtomicFile
+    except ImportError: # run as a script
+        from atomic import AtomicFile
+
+    if not args.blend_files or not args.output_dir:
+        parser.error("the .blend files and --output-dir are required")
+    options = {}
+    if args.options:
+        with open(args.options) as f:
+            options.update(json.load(f))
+    for item in args.set:
+        name, sep, value = item.partition("=")
+        if not sep:
+            parser.error("--set expects NAME=VALUE, got %s" % item)
+        options[name.strip()] = parse_value(value.strip())
+
+    summary = export_files(args.blend_files, args.output_dir, args.blender, options,
+                           args.workers, args.retries, args.timeout)
+    summary_file = args.summary or os.path.join(summary["output_dir"], "batch_summary.json")
+    with AtomicFile(summary_file) as f:
+        json.dump(summary, f, indent=1)
+    print("%d exported, %d failed in %.1fs, summary written to %s" % (summary["done"], summary["failed"], summary["time"], summary_file))
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    # inside Blender, our arguments follow "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,68 @@
+import math
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# Camera culling
+#
+# Objects whose world space bounding box lies entirely outside the view
+# frustum of the exported camera (widened by a margin) or beyond a far
+# distance are left out of the export. The test is conservative: a box is
+# only culled when all of its 8 corners are on the outer side of the same
+# frustum plane, so nothing visible is ever dropped. Shadow casters and
+# emitters outside of the view still light the image, the user exempts
+# them with the "Always export" object option.
+
+def placed_corners(bound_boxes, matrices):
+    """World space corners (N, 8, 3) of local bounding boxes, (N, 8, 3) or a
+    single (8, 3) box shared by all, placed by N 4x4 matrices"""
+    matrices = np.asarray(matrices, np.float64).reshape(-1, 4, 4)
+    boxes = np.asarray(bound_boxes, np.float64)
+    return boxes @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, None, :3, 3]
+
+def triangle_count(ob_eval):
+    """Triangles of an evaluated object, without copying its mesh when possible"""
+    mesh = ob_eval.data if ob_eval.type == "MESH" else None
+    if mesh is not None and hasattr(mesh, "loop_triangles"):
+        return len(mesh.loop_triangles)
+    mesh = ob_eval.to_mesh()
+    try:
+        if mesh is None:
+            return 0
+        if hasattr(mesh, "calc_loop_triangles"):
+            mesh.calc_loop_triangles()
+        return len(mesh.loop_triangles)
+    finally:
+        ob_eval.to_mesh_clear()
+
+class FrustumCuller:
+    def __init__(self, camera, render, margin=0.1, far_distance=0.0):
+        """camera object and scene render settings. margin widens the view by
+        this fraction on every side, far_distance (0: the camera clip end)
+        limits the depth"""
+        self.world_to_camera = np.linalg.inv(np.asarray(camera.matrix_world, np.float64))
+        data = camera.data
+        width = render.resolution_x * render.pixel_aspect_x
+        height = render.resolution_y * render.pixel_aspect_y
+        fit = data.sensor_fit
+        if fit == "AUTO":
+            fit = "HORIZONTAL" if width >= height else "VERTICAL"
+        self.ortho = data.type == "ORTHO"
+        # half extent of the view at unit depth (perspective) or in scene units (orthographic)
+        half = data.ortho_scale / 2 if self.ortho else math.tan(data.angle / 2)
+        if fit == "HORIZONTAL":
+            self.half_x, self.half_y = half, half * height / width
+        else:
+            self.half_x, self.half_y = half * width / height, half
+        self.half_x *= 1.0 + margin
+        self.half_y *= 1.0 + margin
+        self.far = far_distance if far_distance > 0.0 else data.clip_end
+
+    def visible(self, corners):
+        """(N,) bool array, False for the boxes (N, 8, 3 world space corners) that are out of view"""
+        local = corners @ self.world_to_camera[:3, :3].T + self.world_to_camera[:3, 3]
+        x, y, depth = local[..., 0], local[..., 1], -local[..., 2] # cameras look down -Z
+        extent = 1.0 if self.ortho else depth
+        outside = np.all(depth < 0.0, axis=1) | np.all(depth > self.far, axis=1)
+        outside |= np.all(x > self.half_x * extent, axis=1) | np.all(x < -self.half_x * extent, axis=1)
+        outside |= np.all(y > self.half_y * extent, axis=1) | np.all(y < -self.half_y * extent, axis=1)
+        return ~outside
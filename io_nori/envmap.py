@@ -0,0 +1,105 @@
+import os, json, hashlib
+import numpy as np
+
+from .atomic import AtomicFile
+
+# -----------------------------------------------------------------------------
+# Environment map importance sampling tables
+#
+# The sampling distribution of a lat-long environment map is its luminance
+# weighted by sin(theta), the solid angle of each row. The tables are
+# written next to the copied image as a binary sidecar (little-endian):
+#   8 bytes       magic "NORIENV1"
+#   16 bytes      cache key (env_tables_key)
+#   3 x uint32    width, height, number of mip levels
+#   float32       marginal CDF of the rows, height + 1 values from 0 to 1
+#   float32       conditional CDF of each row, height x (width + 1) values
+#   each mip level: 2 x uint32 width, height then the float32 luminance,
+#   row major, every level half the size of the previous one (level 1 is
+#   half the size of the image)
+# Rows go from the top of the image (theta = 0) to the bottom. The CDFs are
+# normalized, so the emitter strength does not change them.
+
+TABLES_MAGIC = b"NORIENV1"
+TABLES_VERSION = 1
+LUMINANCE = (0.2126, 0.7152, 0.0722) # Rec. 709, also used by report.py
+ROWS_PER_CHUNK = 256 # even, mip levels are reduced chunk by chunk
+
+def env_tables_path(env_file):
+    """textures/sky.exr -> textures/sky.envcdf"""
+    return os.path.splitext(env_file)[0] + ".envcdf"
+
+def env_tables_key(stamp, rotation, mip_levels):
+    """16 bytes identifying the tables of a source file (see manifest.source_stamp)"""
+    text = json.dumps([TABLES_VERSION, stamp, rotation, mip_levels], sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def read_tables_key(filepath):
+    """cache key of an existing sidecar, None if missing or not a sidecar"""
+    try:
+        with open(filepath, "rb") as f:
+            header = f.read(len(TABLES_MAGIC) + 16)
+    except OSError:
+        return None
+    if len(header) != len(TABLES_MAGIC) + 16 or not header.startswith(TABLES_MAGIC):
+        return None
+    return header[len(TABLES_MAGIC):]
+
+def _conditional_cdf(weights):
+    # (rows, width) -> (rows, width + 1) normalized cumulative sums, uniform for black rows
+    cdf = np.zeros((weights.shape[0], weights.shape[1] + 1), np.float64)
+    np.cumsum(weights, axis=1, dtype=np.float64, out=cdf[:, 1:])
+    totals = cdf[:, -1:]
+    uniform = np.linspace(0.0, 1.0, weights.shape[1] + 1)
+    return np.where(totals > 0.0, cdf / np.where(totals > 0.0, totals, 1.0), uniform), totals[:, 0]
+
+def _downsample(luminance):
+    # 2x2 box filter, an odd last row or column is dropped
+    h, w = luminance.shape[0] // 2, luminance.shape[1] // 2
+    return luminance[:2 * h, :2 * w].reshape(h, 2, w, 2).mean(axis=(1, 3), dtype=np.float32)
+
+def write_env_tables(filepath, key, pixels, width, height, channels, mip_levels=0):
+    """Write the sidecar of an image (pixels: flat float32 array in Blender's
+    order, bottom row first). Rows are processed in chunks, only the mip
+    levels are kept in memory"""
+    image = pixels.reshape(height, width, channels)[::-1] # top row first
+    sin_theta = np.sin(np.pi * (np.arange(height) + 0.5) / height)
+    row_weights = np.empty(height, np.float64)
+    mips = []
+    mip_levels = min(mip_levels, int(np.log2(min(width, height)))) # the last level is at least 1 pixel high
+    with AtomicFile(filepath, "wb") as f:
+        f.write(TABLES_MAGIC)
+        f.write(key)
+        f.write(np.array([width, height, mip_levels], "<u4").tobytes())
+        marginal_offset = f.tell()
+        f.write(bytes(4 * (height + 1))) # written once every row is known
+        for start in range(0, height, ROWS_PER_CHUNK):
+            rows = image[start:start + ROWS_PER_CHUNK]
+            if channels >= 3:
+                luminance = rows[..., :3] @ np.array(LUMINANCE, np.float32)
+            else:
+                luminance = rows[..., 0].astype(np.float32)
+            np.maximum(luminance, 0.0, out=luminance)
+            cdf, totals = _conditional_cdf(luminance)
+            row_weights[start:start + len(rows)] = totals * sin_theta[start:start + len(rows)]
+            f.write(cdf.astype("<f4").tobytes())
+            if mip_levels > 0 and len(rows) >= 2:
+                mips.append(_downsample(luminance))
+        levels = []
+        if mip_levels > 0:
+            level = np.concatenate(mips)
+            for _ in range(mip_levels):
+                levels.append(level)
+                level = _downsample(level)
+            for level in levels:
+                f.write(np.array([level.shape[1], level.shape[0]], "<u4").tobytes())
+                f.write(level.astype("<f4").tobytes())
+
+        marginal = np.zeros(height + 1, np.float64)
+        np.cumsum(row_weights, out=marginal[1:])
+        if marginal[-1] > 0.0:
+            marginal /= marginal[-1]
+        else:
+            marginal = np.linspace(0.0, 1.0, height + 1)
+        f.seek(marginal_offset)
+        f.write(marginal.astype("<f4").tobytes())
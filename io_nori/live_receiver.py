@@ -0,0 +1,140 @@
+"""Stand-in consumer for the live sync of the Nori exporter (see live_sync.py)
+
+    python live_receiver.py --port 5555 --output /path/to/sync/scene.xml
+    python live_receiver.py --directory /path/to/batches --output /path/to/sync/scene.xml
+
+Receives the update batches over a socket or from a watched directory,
+applies them to its own copy of the scene and rewrites --output, a complete
+Nori scene description, after each batch. The output should be in the
+directory the exporter syncs to, mesh files are referenced relative to it.
+Runs without Blender.
+"""
+import os, sys, glob, json, time, socket, argparse
+import xml.etree.ElementTree as ET
+
+try:
+    from .atomic import AtomicFile
+except ImportError: # run as a script
+    from atomic import AtomicFile
+
+def _fragment(text):
+    """xml fragment of a message -> list of elements"""
+    if not text:
+        return []
+    return list(ET.fromstring("<entries>%s</entries>" % text))
+
+class SceneState:
+    def __init__(self):
+        self.settings = []
+        self.camera = None
+        self.lights = {}    # object name -> emitter
+        self.objects = {}   # object name -> mesh entries
+
+    def apply(self, message):
+        kind = message["type"]
+        if kind == "settings":
+            self.settings = _fragment(message["entries"])
+        elif kind == "camera":
+            self.camera = _fragment(message["entry"])[0]
+        elif kind == "light":
+            if message["entry"] is None:
+                self.lights.pop(message["object"], None)
+            else:
+                self.lights[message["object"]] = _fragment(message["entry"])[0]
+        elif kind == "object":
+            self.objects[message["object"]] = _fragment(message["entries"])
+        elif kind == "remove":
+            self.objects.pop(message["object"], None)
+        elif kind == "transform":
+            value = ",".join(repr(v) for v in message["matrix"])
+            for mesh in self.objects.get(message["object"], []):
+                matrix = mesh.find("transform[@name='toWorld']/matrix")
+                if matrix is None:
+                    transform = ET.SubElement(mesh, "transform", {"name": "toWorld"})
+                    matrix = ET.SubElement(transform, "matrix")
+                matrix.set("value", value)
+        elif kind == "material":
+            bsdf = _fragment(message["bsdf"])[0]
+            emitter = _fragment(message["emitter"])
+            for entries in self.objects.values():
+                for mesh in entries:
+                    old = mesh.find("bsdf")
+                    if old is None or old.get("name") != message["material"]:
+                        continue
+                    for child in mesh.findall("emitter"):
+                        mesh.remove(child)
+                    mesh.remove(old)
+                    mesh.append(ET.fromstring(ET.tostring(bsdf)))
+                    for child in emitter:
+                        mesh.append(ET.fromstring(ET.tostring(child)))
+        else:
+            print("WARN: unknown message type %s" % kind)
+
+    def write(self, filepath):
+        scene = ET.Element("scene")
+        scene.extend(self.settings)
+        if self.camera is not None:
+            scene.append(self.camera)
+        for name in sorted(self.lights):
+            scene.append(self.lights[name])
+        for name in sorted(self.objects):
+            scene.extend(self.objects[name])
+        ET.indent(scene, "\t")
+        with AtomicFile(filepath) as f: # a renderer watching the file never reads it half-written
+            f.write('<?xml version="1.0" ?>\n')
+            f.write(ET.tostring(scene, encoding="unicode"))
+            f.write("\n")
+
+def handle(state, batch, output):
+    for message in batch["messages"]:
+        state.apply(message)
+    if output:
+        state.write(output)
+    kinds = {}
+    for message in batch["messages"]:
+        kinds[message["type"]] = kinds.get(message["type"], 0) + 1
+    print("batch %d: %s, %d objects, latency %.0f ms" % (
+        batch["batch"], ", ".join("%d %s" % (n, k) for k, n in sorted(kinds.items())),
+        len(state.objects), 1000 * (time.time() - batch["time"])))
+    sys.stdout.flush()
+
+def serve_socket(state, host, port, output):
+    server = socket.create_server((host, port))
+    print("Listening on %s:%d" % (host, port))
+    while True:
+        connection, address = server.accept()
+        print("Exporter connected from %s:%d" % address)
+        with connection, connection.makefile("r", encoding="utf-8") as stream:
+            for line in stream:
+                handle(state, json.loads(line), output)
+        print("Exporter disconnected")
+
+def watch_directory(state, directory, output, poll=0.1):
+    print("Watching %s" % directory)
+    while True:
+        for path in sorted(glob.glob(os.path.join(directory, "batch_*.json"))):
+            with open(path) as f:
+                batch = json.load(f)
+            os.remove(path)
+            handle(state, batch, output)
+        time.sleep(poll)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--directory", help="watch this directory instead of listening on a socket")
+    parser.add_argument("--output", help="scene xml rewritten after every batch")
+    args = parser.parse_args(argv)
+
+    state = SceneState()
+    try:
+        if args.directory:
+            watch_directory(state, args.directory, args.output)
+        else:
+            serve_socket(state, args.host, args.port, args.output)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import bpy, os, io, json, time, socket
+
+from .nori_writer import NoriWriter, watched_objects, index_instances, SUPPORTED_OBJECT_TYPES
+from .mesh_writer import MESH_EXTENSIONS
+from .xml_writer import StreamingDocument
+from .atomic import AtomicFile
+
+# -----------------------------------------------------------------------------
+# Live sync
+#
+# A depsgraph_update_post handler records which objects, materials, lights
+# and cameras changed. A timer sends the changes gathered during the last
+# `interval` seconds as one batch, and several changes to the same item
+# are merged. Dragging an object therefore sends at most one transform per
+# interval. A batch is a json object {"batch", "time", "messages"}, and
+# each message has one of these types:
+#   settings   integrator and sampler entries
+#   camera     camera entry
+#   light      emitter entry of a light object (entry null once removed)
+#   object     every <mesh> entry of an object (mesh files are rewritten)
+#   transform  new object to world matrix (16 floats, row major)
+#   material   bsdf (and area emitter) entry named after the material
+#   remove     the object is gone or hidden
+# Entries are xml fragments in the scene format. Mesh files are written in
+# object space under a new name each time the geometry changes, so the
+# consumer never reads a half-written file. watched_objects maps every
+# synced object to its current mesh files.
+#
+# io_nori/live_receiver.py is a stand-in consumer that rebuilds the scene
+# xml from the batches.
+
+session = None # running LiveSync
+
+def _xml(element):
+    if element is None:
+        return None
+    buffer = io.StringIO()
+    element.writexml(buffer, "", "\t", "\n")
+    return buffer.getvalue()
+
+def _matrix(matrix):
+    return [float(matrix[j][i]) for j in range(4) for i in range(4)]
+
+class SocketTransport:
+    """Sends each batch as one line of json over a TCP connection"""
+
+    def __init__(self, host="127.0.0.1", port=5555, log=print):
+        self.host = host
+        self.port = port
+        self.log = log
+        self.sock = None
+        self.warned = False
+
+    def send(self, batch):
+        data = (json.dumps(batch) + "\n").encode("utf-8")
+        try:
+            if self.sock is None:
+                self.sock = socket.create_connection((self.host, self.port), timeout=1.0)
+            self.sock.sendall(data)
+        except OSError as e:
+            if not self.warned:
+                self.log("WARN: Live sync consumer %s:%d unreachable (%s), retrying" % (self.host, self.port, e))
+                self.warned = True
+            self.close()
+            return False
+        self.warned = False
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __str__(self):
+        return "%s:%d" % (self.host, self.port)
+
+class DirectoryTransport:
+    """Writes each batch to its own json file (batch_000001.json, ...) in a watched directory"""
+
+    def __init__(self, directory, log=print):
+        self.directory = directory
+        self.log = log
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, batch):
+        path = os.path.join(self.directory, "batch_%06d.json" % batch["batch"])
+        try:
+            with AtomicFile(path) as f: # the consumer only sees complete files
+                json.dump(batch, f)
+        except OSError as e:
+            self.log("WARN: Could not write live sync batch %s: %s" % (path, e))
+            return False
+        return True
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return self.directory
+
+class LiveSync:
+    def __init__(self, working_dir, transport, interval=0.25,
+                 exportLight=True, exportMaterialColor=True, export_textures=True, mesh_format="OBJ", log=print):
+        # bpy.context is read at every update, an operator context does not outlive the operator
+        self.working_dir = working_dir
+        self.transport = transport
+        self.interval = interval
+        self.exportLight = exportLight
+        self.exportMaterialColor = exportMaterialColor
+        self.export_textures = export_textures
+        self.mesh_format = mesh_format
+        self.log = log
+        self.batch = 0
+        self.version = 0
+        # changes seen since the last flush: object name -> {"transform", "geometry", ...}
+        self.changed_objects = {}
+        self.changed_materials = set()
+        self.changed_camera = False
+        self.changed_settings = False
+        self.scan = False
+        self.lights = set() # lights known by the consumer
+        # mesh files to delete once the consumer knows about their replacement
+        self.stale_files = []
+        # messages not delivered yet, keyed so that a newer message replaces an older one
+        self.outbox = {}
+        self.writer = None # shared by the updates of the session, with its texture and mesh workers
+        self._timer = None
+
+    ######################
+    # session
+    ######################
+    def start(self):
+        global session
+        if session is not None:
+            session.stop()
+        session = self
+        watched_objects.clear()
+        self.lights.clear()
+        # the first batch is a full snapshot of the scene
+        self.changed_settings = True
+        self.changed_camera = True
+        self.scan = True
+        self.writer = self.new_writer()
+        self.flush()
+        bpy.app.handlers.depsgraph_update_post.append(self.on_depsgraph_update)
+        # timers are matched by identity, and every self.tick is a new bound method
+        self._timer = self.tick
+        bpy.app.timers.register(self._timer, first_interval=self.interval)
+        self.log("LIVE SYNC: sending updates to %s" % self.transport)
+
+    def stop(self):
+        global session
+        if self.on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.remove(self.on_depsgraph_update)
+        if self._timer is not None and bpy.app.timers.is_registered(self._timer):
+            bpy.app.timers.unregister(self._timer)
+        self._timer = None
+        if self.writer is not None:
+            self.writer.pipeline.close()
+            self.writer.textures.wait(self.log)
+            self.writer = None
+        self.transport.close()
+        if session is self:
+            session = None
+        self.log("LIVE SYNC: stopped after %d batches" % self.batch)
+
+    def on_depsgraph_update(self, scene, depsgraph):
+        """depsgraph_update_post handler, only records what changed"""
+        for update in depsgraph.updates:
+            item = update.id.original
+            if isinstance(item, bpy.types.Object):
+                flags = self.changed_objects.setdefault(item.name, set())
+                if update.is_updated_transform:
+                    flags.add("transform")
+                if update.is_updated_geometry:
+                    flags.add("geometry")
+                if not (update.is_updated_transform or update.is_updated_geometry):
+                    flags.add("other") # visibility, material slots, ...
+            elif isinstance(item, bpy.types.Material):
+                self.changed_materials.add(item.name)
+            elif isinstance(item, bpy.types.Camera):
+                self.changed_camera = True
+            elif isinstance(item, bpy.types.Light):
+                for ob in scene.objects:
+                    if ob.data == item:
+                        self.changed_objects.setdefault(ob.name, set()).add("other")
+            elif isinstance(item, bpy.types.Scene):
+                self.changed_settings = True
+                self.scan = True # objects may have been added or removed
+            elif isinstance(item, bpy.types.Collection):
+                self.scan = True
+
+    def tick(self):
+        """timer callback, sends the merged changes at most once per interval"""
+        if self.changed_objects or self.changed_materials or self.changed_camera or self.changed_settings \
+                or self.scan or self.outbox:
+            try:
+                self.flush()
+            except Exception as e:
+                # keep the timer alive, the next changes are sent anyway
+                self.log("WARN: Live sync update failed: %s" % e)
+        return self.interval
+
+    ######################
+    # deltas
+    ######################
+    def new_writer(self):
+        """writer of the session, updated with the scene state by update_writer"""
+        writer = NoriWriter(bpy.context, os.path.join(self.working_dir, "scene.xml"))
+        writer.verbose = self.writer_log
+        writer.setExportMeshesWorld(False) # object space, so a move only sends a transform
+        writer.export_textures = self.export_textures
+        writer.mesh_format = self.mesh_format
+        writer.mesh_workers = 0
+        writer.texture_workers = 1
+        writer.doc = StreamingDocument(None)
+        writer.reference_instances = True
+        writer.start_export()
+        os.makedirs(os.path.join(self.working_dir, writer.mesh_dir), exist_ok=True)
+        os.makedirs(os.path.join(self.working_dir, writer.texture_dir), exist_ok=True)
+        return writer
+
+    def update_writer(self):
+        writer = self.writer
+        writer.context = bpy.context
+        writer.scene = bpy.context.scene
+        writer.depsgraph = bpy.context.evaluated_depsgraph_get()
+        writer.instances = index_instances(writer.depsgraph)
+        writer.material_cache = {} # edited materials are converted again
+        writer.textures.staged.clear() # and edited images sent again
+        return writer
+
+    def writer_log(self, text):
+        # only the warnings of the writer are worth showing on every update
+        if text.startswith("WARN"):
+            self.log(text)
+
+    def flush(self):
+        changed_objects, self.changed_objects = self.changed_objects, {}
+        changed_materials, self.changed_materials = self.changed_materials, set()
+        changed_camera, self.changed_camera = self.changed_camera, False
+        changed_settings, self.changed_settings = self.changed_settings, False
+        scan, self.scan = self.scan, False
+
+        scene = bpy.context.scene
+        writer = self.update_writer()
+        try:
+            if changed_settings:
+                self.outbox[("settings", None)] = {"type": "settings",
+                                                   "entries": "".join(_xml(e) for e in writer.write_settings(self.exportLight))}
+
+            exported = {ob.name: ob for ob in scene.objects
+                        if ob.visible_get() and ob.type in SUPPORTED_OBJECT_TYPES and ob.type != "EMPTY"}
+            exported.update((ob.name, ob) for ob in writer.instances if ob.type in SUPPORTED_OBJECT_TYPES)
+            names = set(changed_objects)
+            if scan:
+                names |= set(exported) | set(watched_objects) | self.lights
+                names |= {ob.name for ob in scene.objects if ob.type == "LIGHT"}
+            if any(getattr(scene.objects.get(name), "instance_type", "NONE") != "NONE" for name in changed_objects):
+                # an instancer changed, the placements of the instance sources may have moved
+                for ob in writer.instances:
+                    changed_objects.setdefault(ob.name, set()).add("instances")
+                    names.add(ob.name)
+            for name in sorted(names):
+                ob = exported.get(name) or scene.objects.get(name)
+                flags = changed_objects.get(name, set())
+                if ob is not None and ob.type == "CAMERA":
+                    changed_camera = True
+                elif (ob is not None and ob.type == "LIGHT") or name in self.lights:
+                    light = None
+                    if self.exportLight and ob is not None and ob.type == "LIGHT" and ob.visible_get():
+                        light = writer.write_light(ob)
+                    if light is not None or name in self.lights:
+                        self.outbox[("light", name)] = {"type": "light", "object": name, "entry": _xml(light)}
+                    if light is not None:
+                        self.lights.add(name)
+                    else:
+                        self.lights.discard(name)
+                elif name not in exported:
+                    if name in watched_objects:
+                        self.stale_files += watched_objects.pop(name)
+                        self.outbox.pop(("transform", name), None)
+                        self.outbox[("object", name)] = {"type": "remove", "object": name}
+                elif name not in watched_objects or flags - {"transform"} or ob in writer.instances:
+                    self.stale_files += self.send_object(writer, ob)
+                elif "transform" in flags and ("object", name) not in self.outbox:
+                    self.outbox[("transform", name)] = {"type": "transform", "object": name,
+                                                        "matrix": _matrix(ob.matrix_world)}
+
+            if changed_camera:
+                cameras = [ob for ob in scene.objects if ob.type == "CAMERA"]
+                camera = scene.camera if scene.camera is not None else (cameras[0] if cameras else None)
+                if camera is not None:
+                    self.outbox[("camera", None)] = {"type": "camera",
+                                                     "entry": _xml(writer.write_camera(camera, writer.export_thin_lens))}
+
+            for name in sorted(changed_materials):
+                material = bpy.data.materials.get(name)
+                if material is None:
+                    continue
+                bsdf, emitter = writer.convert_material(material, self.exportLight, self.exportMaterialColor)
+                self.outbox[("material", name)] = {"type": "material", "material": name,
+                                                   "bsdf": _xml(bsdf), "emitter": _xml(emitter)}
+            writer.pipeline.drain()
+        finally:
+            writer.textures.collect(self.log)
+
+        if self.outbox:
+            self.batch += 1
+            batch = {"batch": self.batch, "time": time.time(), "messages": list(self.outbox.values())}
+            if not self.transport.send(batch):
+                self.batch -= 1
+                return # kept in the outbox, merged with the next changes
+            self.outbox.clear()
+        for path in self.stale_files:
+            # the consumer was told about the new files, or the object is gone
+            try:
+                os.remove(os.path.join(self.working_dir, path))
+            except OSError:
+                pass
+        self.stale_files = []
+
+    def send_object(self, writer, ob):
+        """queue every entry of the object with freshly written mesh files, returns the files it replaces"""
+        self.version += 1
+        mesh_path = "%s/%s_v%d%s" % (writer.mesh_dir, ob.name, self.version, MESH_EXTENSIONS[writer.mesh_format])
+        entries = writer.write_mesh_info(ob, mesh_path, self.exportLight, self.exportMaterialColor, None)
+        files = []
+        for entry in entries:
+            for child in entry.childNodes:
+                if child.tagName == "string" and child.getAttribute("name") == "filename":
+                    files.append(child.getAttribute("value"))
+        previous = watched_objects.get(ob.name, [])
+        watched_objects[ob.name] = files
+        self.outbox.pop(("transform", ob.name), None) # the entries hold the current transform
+        self.outbox[("object", ob.name)] = {"type": "object", "object": ob.name,
+                                            "entries": "".join(_xml(e) for e in entries)}
+        return [path for path in previous if path not in files]
@@ -0,0 +1,106 @@
+import os, math
+import numpy as np
+
+from .mesh_writer import MeshData, decimate, mesh_digest
+from .atomic import AtomicFile
+
+# -----------------------------------------------------------------------------
+# Screen space level of detail
+#
+# The triangle budget of an object is proportional to the number of pixels
+# its bounding sphere covers in the exported camera's image (capped to the
+# whole image). Meshes above their budget are decimated by vertex
+# clustering (mesh_writer.decimate) before they are written, the Blender
+# mesh is never modified. Budgets are rounded up to a power of two so that
+# small camera moves give the same decimated mesh, which is cached on disk
+# between exports.
+
+def lod_cache_path(xml_filepath):
+    """scene.xml -> scene.lod_cache folder"""
+    return os.path.splitext(xml_filepath)[0] + ".lod_cache"
+
+def coverage_pixels(camera, render, corners):
+    """Screen area in pixels of the bounding spheres of boxes (N, 8, 3 world
+    space corners) seen by the camera object, a conservative estimate"""
+    center = corners.mean(axis=1)
+    radius = np.linalg.norm(corners - center[:, None], axis=2).max(axis=1)
+    scale = render.resolution_percentage / 100
+    width, height = render.resolution_x * scale, render.resolution_y * scale
+    data = camera.data
+    fit = data.sensor_fit
+    if fit == "AUTO":
+        fit = "HORIZONTAL" if width >= height else "VERTICAL"
+    fit_pixels = width if fit == "HORIZONTAL" else height
+    if data.type == "ORTHO":
+        radius_pixels = radius * fit_pixels / data.ortho_scale
+    else:
+        distance = np.linalg.norm(center - np.asarray(camera.matrix_world, np.float64)[:3, 3], axis=1)
+        # measured at the nearest point of the sphere, a camera inside it sees the whole image
+        with np.errstate(divide="ignore"):
+            radius_pixels = np.where(distance > radius,
+                                     radius * fit_pixels / 2 / (np.maximum(distance - radius, 0.0) * math.tan(data.angle / 2)),
+                                     np.inf)
+    return np.minimum(np.pi * radius_pixels ** 2, width * height)
+
+def lod_budget(pixels, triangles_per_pixel, min_triangles):
+    """triangle budget of a coverage, rounded up to a power of two"""
+    budget = max(pixels * triangles_per_pixel, min_triangles, 1)
+    return 1 << int(math.ceil(math.log2(budget)))
+
+class LodCache:
+    """Decimated meshes keyed by the digest of the full mesh and the budget,
+    kept in memory for the export and in directory between exports"""
+
+    def __init__(self, directory, prune=True):
+        self.directory = directory
+        self.prune = prune # False for a cache shared with other exports
+        self.memory = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def decimate(self, data, target_triangles):
+        key = "%s_%d" % (mesh_digest(data), target_triangles)
+        self.used.add(key)
+        if key in self.memory:
+            self.hits += 1
+            return self.memory[key]
+        path = os.path.join(self.directory, key + ".npz")
+        result = None
+        if os.path.exists(path):
+            try:
+                with np.load(path) as arrays:
+                    result = MeshData(data.name, **{name: arrays[name] for name in arrays.files})
+                self.hits += 1
+            except (OSError, ValueError, KeyError):
+                result = None # unreadable, decimated again
+        if result is None:
+            self.misses += 1
+            result = decimate(data, target_triangles)
+            self.save(path, result)
+        self.memory[key] = result
+        return result
+
+    def save(self, path, data):
+        arrays = {name: getattr(data, name) for name in MeshData.__slots__
+                  if name != "name" and getattr(data, name) is not None}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with AtomicFile(path, "wb") as f:
+                np.savez(f, **arrays)
+        except OSError:
+            pass # only a cache
+
+    def finish(self):
+        """drop the cached meshes this export did not use"""
+        if not self.prune or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if os.path.splitext(name)[0] not in self.used:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def summary(self):
+        return "%d decimated, %d from cache" % (self.misses, self.hits)
@@ -0,0 +1,90 @@
+import os, json
+
+from .atomic import AtomicFile
+
+# -----------------------------------------------------------------------------
+# Export manifest
+#
+# Stored next to the scene xml, it records a stamp for every file written by
+# an export: the content digest for meshes, the source size and mtime for
+# textures. The next export skips files whose stamp did not change and
+# removes the files that are no longer referenced (unless they may be used
+# by other exports sharing the folder).
+
+MANIFEST_VERSION = 1
+KINDS = ("meshes", "textures")
+
+def manifest_path(xml_filepath):
+    return os.path.splitext(xml_filepath)[0] + ".manifest.json"
+
+def source_stamp(source):
+    """Cheap stamp of a source file on disk"""
+    st = os.stat(source)
+    return {"source": source, "size": st.st_size, "mtime": st.st_mtime_ns}
+
+class ExportManifest:
+    def __init__(self, filepath, working_dir, remove_stale=True):
+        self.filepath = filepath
+        self.working_dir = working_dir
+        self.remove_stale = remove_stale
+        self.previous = {kind: {} for kind in KINDS}
+        self.current = {kind: {} for kind in KINDS}
+        self.skipped = 0
+        self.written = 0
+        self.removed = 0
+        try:
+            with open(filepath) as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                for kind in KINDS:
+                    self.previous[kind] = data.get(kind, {})
+        except (OSError, ValueError):
+            pass # first export, or unreadable manifest: rewrite everything
+
+    def __file_size(self, relpath):
+        try:
+            return os.path.getsize(os.path.join(self.working_dir, relpath))
+        except OSError:
+            return None
+
+    def is_current(self, kind, relpath, stamp):
+        """True if relpath was written by the previous export with the same stamp
+        and is still on disk untouched"""
+        entry = self.previous[kind].get(relpath)
+        if entry is None or entry["stamp"] != stamp:
+            return False
+        return self.__file_size(relpath) == entry["size"]
+
+    def record(self, kind, relpath, stamp, skipped=False):
+        """Register relpath as part of this export (written or skipped)"""
+        if relpath in self.current[kind]:
+            return
+        # sizes are read by finish, once the files are in place
+        self.current[kind][relpath] = {"stamp": stamp, "size": None}
+        if skipped:
+            self.skipped += 1
+        else:
+            self.written += 1
+
+    def finish(self):
+        """Delete stale files of the previous export and save the manifest"""
+        for kind in KINDS if self.remove_stale else ():
+            for relpath in self.previous[kind]:
+                if relpath in self.current[kind]:
+                    continue
+                path = os.path.join(self.working_dir, relpath)
+                if os.path.isfile(path):
+                    os.remove(path)
+                    self.removed += 1
+
+        for kind in KINDS:
+            for relpath, entry in self.current[kind].items():
+                entry["size"] = self.__file_size(relpath)
+
+        data = {"version": MANIFEST_VERSION}
+        data.update(self.current)
+        with AtomicFile(self.filepath) as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    def summary(self):
+        return "%d files skipped, %d rewritten, %d stale files removed" % (self.skipped, self.written, self.removed)
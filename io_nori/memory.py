@@ -0,0 +1,79 @@
+import os, tracemalloc
+
+from .profiler import max_rss
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# -----------------------------------------------------------------------------
+# Memory budget
+#
+# Resident memory of the Blender process is sampled around every exported
+# object (psutil when installed, /proc on Linux). What the object costs is
+# the growth between the samples, or between the first sample and a new
+# process peak reached meanwhile, or the peak of the Python allocations
+# when tracemalloc is tracing, whichever is largest. An object costing more
+# than the budget is reported, so the heavy meshes of a scene can be found
+# without a profiler. The same budget bounds the mesh snapshots waiting for
+# the mesh workers (see pipeline.py).
+
+def current_rss():
+    """Resident memory of the process in bytes, None if unknown"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class MemoryBudget:
+    def __init__(self, budget_mb, log=print):
+        self.budget = int(budget_mb * (1 << 20))
+        self.log = log
+        self.objects = 0
+        self.over_budget = []   # (object name, bytes)
+        self.peak = 0           # most used by one object
+        self.peak_name = None
+        self._start = None
+
+    def begin(self):
+        """sample before exporting an object"""
+        traced = None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        self._start = (current_rss(), max_rss(), traced)
+
+    def end(self, name, triangles=None):
+        """sample after exporting the object name, logs it when over budget"""
+        if self._start is None:
+            return
+        rss_before, peak_before, traced_before = self._start
+        rss_after, peak_after = current_rss(), max_rss()
+        self._start = None
+        growth = []
+        if rss_before is not None and rss_after is not None:
+            growth.append(rss_after - rss_before)
+        if peak_after is not None and peak_before is not None and peak_after > peak_before:
+            # the process reached a new peak while this object was exported
+            growth.append(peak_after - (rss_before if rss_before is not None else peak_before))
+        if traced_before is not None and tracemalloc.is_tracing():
+            growth.append(tracemalloc.get_traced_memory()[1] - traced_before)
+        if not growth:
+            return
+        used = max(max(growth), 0)
+        self.objects += 1
+        if used > self.peak:
+            self.peak, self.peak_name = used, name
+        if self.budget and used > self.budget:
+            self.over_budget.append((name, used))
+            self.log("MEMORY: %s used %.1f MB, over the %.1f MB budget%s" % (
+                name, used / (1 << 20), self.budget / (1 << 20),
+                " (%d triangles)" % triangles if triangles is not None else ""))
+
+    def summary(self):
+        return "at most %.1f MB for one object (%s) over %d objects, %d over the %.1f MB budget" % (
+            self.peak / (1 << 20), self.peak_name or "n/a", self.objects, len(self.over_budget), self.budget / (1 << 20))
@@ -15,6 +15,8 @@ from bpy_extras.wm_utils.progress_report import (
     ProgressReportSubstep,
 )
 
+from . import live_sync
+
 class NoriExporterPanel(bpy.types.Panel):
     """Creates a Panel in the scene context of the properties editor"""
     bl_label = "Nori Export Options"
@@ -28,48 +30,35 @@ class NoriExporterPanel(bpy.types.Panel):
 
         scene = context.scene
 
-        # Create a simple row.
-        layout.label(text=" Simple Row:")
-
-        row = layout.row()
-        row.prop(scene, "frame_start")
-        row.prop(scene, "frame_end")
-
-        # Create an row where the buttons are aligned to each other.
-        layout.label(text=" Aligned Row:")
+        # Frame range used by the animation export (one xml per frame)
+        layout.label(text="Animation frame range:")
 
         row = layout.row(align=True)
         row.prop(scene, "frame_start")
         row.prop(scene, "frame_end")
+        row.prop(scene, "frame_step")
 
-        # Create two columns, by using a split layout.
-        split = layout.split()
-
-        # First column
-        col = split.column()
-        col.label(text="Column One:")
-        col.prop(scene, "frame_end")
-        col.prop(scene, "frame_start")
-
-        # Second column, aligned
-        col = split.column(align=True)
-        col.label(text="Column Two:")
-        col.prop(scene, "frame_start")
-        col.prop(scene, "frame_end")
-
-        # Big render button
-        layout.label(text="Big Button:")
+        # Export the scene with the default options
         row = layout.row()
-        row.scale_y = 3.0
-        row.operator("render.render")
-
-        # Different sizes in a row
-        layout.label(text="Different button sizes:")
-        row = layout.row(align=True)
-        row.operator("render.render")
+        row.scale_y = 2.0
+        op = row.operator("export.nori", text="Export Nori scene...")
+        op.filepath = os.path.splitext(bpy.data.filepath)[0] + ".xml"
 
-        sub = row.row()
-        sub.scale_x = 2.0
-        sub.operator("render.render")
+        # Send the scene changes to a running renderer
+        row = layout.row()
+        if live_sync.session is None:
+            row.operator("nori.live_sync", text="Start live sync...", icon='PLAY')
+        else:
+            row.operator("nori.live_sync", text="Stop live sync", icon='PAUSE')
+
+class NoriObjectPanel(bpy.types.Panel):
+    """Nori options of the active object in the properties editor"""
+    bl_label = "Nori Export"
+    bl_idname = "OBJECT_PT_nori"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "object"
 
-        row.operator("render.render")
\ No newline at end of file
+    def draw(self, context):
+        # kept even when the camera culling would skip it
+        self.layout.prop(context.object, "nori_cull_exempt")
@@ -0,0 +1,658 @@
+import os, hashlib
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# Native mesh writer
+#
+# Geometry is pulled out of evaluated meshes with foreach_get into flat NumPy
+# arrays (MeshData) and encoded with vectorized formatting. Only
+# extract_mesh_data touches Blender data, everything else works on plain
+# arrays. The per corner attributes are gathered, transformed and deduped
+# CHUNK_ROWS faces at a time, so no full size temporary copy of them is
+# made on top of the loop arrays and the snapshot itself.
+
+class MeshData:
+    """Array snapshot of an evaluated mesh
+
+    positions (V,3), normals (N,3) and uvs (T,2) are float32 attribute pools,
+    the face_* arrays index them per face corner (0-based). face_sizes holds
+    the corner count of each face and face_materials its material slot."""
+    __slots__ = ("name", "positions", "normals", "uvs",
+                 "face_sizes", "face_vertices", "face_normals", "face_uvs", "face_materials")
+
+    def __init__(self, name, positions, face_sizes, face_vertices,
+                 normals=None, face_normals=None, uvs=None, face_uvs=None, face_materials=None):
+        self.name = name
+        self.positions = positions
+        self.normals = normals
+        self.uvs = uvs
+        self.face_sizes = face_sizes
+        self.face_vertices = face_vertices
+        self.face_normals = face_normals
+        self.face_uvs = face_uvs
+        if face_materials is None:
+            face_materials = np.zeros(len(face_sizes), np.int32)
+        self.face_materials = face_materials
+
+    @property
+    def is_triangular(self):
+        return bool(np.all(self.face_sizes == 3))
+
+    @property
+    def triangle_count(self):
+        return int(np.sum(self.face_sizes - 2))
+
+    @property
+    def nbytes(self):
+        """memory held by the arrays of the snapshot"""
+        return sum(getattr(self, name).nbytes for name in self.__slots__[1:] if getattr(self, name) is not None)
+
+def _unique_rows(values, decimals):
+    # dedupe attributes at the precision they are written with
+    pool, index = np.unique(np.round(values, decimals), axis=0, return_inverse=True)
+    return pool.astype(np.float32), index.reshape(-1).astype(np.int32)
+
+class _UniqueRows:
+    """_unique_rows of rows given chunk by chunk, the indices go to out"""
+    def __init__(self, decimals, width, out):
+        self.decimals = decimals
+        self.width = width
+        self.out = out
+        self.pools = []
+        self.size = 0
+
+    def add(self, start, values):
+        pool, index = np.unique(np.round(values, self.decimals), axis=0, return_inverse=True)
+        self.out[start:start + len(values)] = index.reshape(-1) + self.size
+        self.pools.append(pool)
+        self.size += len(pool)
+
+    def finish(self):
+        if not self.pools:
+            return np.zeros((0, self.width), np.float32), self.out
+        # the chunk pools are rounded already, their union sorts like the whole rows would
+        pool, inverse = np.unique(np.concatenate(self.pools), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1).astype(np.int32)
+        for start in range(0, len(self.out), CHUNK_ROWS):
+            self.out[start:start + CHUNK_ROWS] = inverse[self.out[start:start + CHUNK_ROWS]]
+        return pool.astype(np.float32), self.out
+
+def _face_chunks(face_sizes):
+    # (first face, end face, first corner, end corner) of CHUNK_ROWS faces at a time
+    corner_ends = np.cumsum(face_sizes)
+    for start in range(0, len(face_sizes), CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, len(face_sizes))
+        yield start, end, int(corner_ends[start] - face_sizes[start]), int(corner_ends[end - 1])
+
+def _reversed_corners(face_sizes):
+    # index permutation that flips the winding of every face
+    starts = np.repeat(np.cumsum(face_sizes) - face_sizes, face_sizes)
+    ends = np.repeat(np.cumsum(face_sizes) - 1, face_sizes)
+    corners = np.arange(len(starts))
+    return starts + ends - corners
+
+def extract_mesh_data(ob_eval, matrix=None, triangulate=True):
+    """Snapshot the evaluated object (modifiers applied) into a MeshData
+
+    matrix is an optional 4x4 array applied to positions and normals"""
+    me = ob_eval.to_mesh()
+    try:
+        if me is None:
+            empty = np.zeros(0, np.int32)
+            return MeshData(ob_eval.name, np.zeros((0, 3), np.float32), empty, empty)
+
+        positions = np.empty(len(me.vertices) * 3, np.float32)
+        me.vertices.foreach_get("co", positions)
+        positions = positions.reshape(-1, 3)
+
+        loop_vertices = np.empty(len(me.loops), np.int32)
+        me.loops.foreach_get("vertex_index", loop_vertices)
+
+        poly_materials = np.empty(len(me.polygons), np.int32)
+        me.polygons.foreach_get("material_index", poly_materials)
+
+        # face corners, as indices into the loop arrays
+        if triangulate:
+            if hasattr(me, "calc_loop_triangles"):
+                me.calc_loop_triangles()
+            corners = np.empty(len(me.loop_triangles) * 3, np.int32)
+            me.loop_triangles.foreach_get("loops", corners)
+            tri_polys = np.empty(len(me.loop_triangles), np.int32)
+            me.loop_triangles.foreach_get("polygon_index", tri_polys)
+            face_sizes = np.full(len(tri_polys), 3, np.int32)
+            face_materials = poly_materials[tri_polys]
+        else:
+            face_sizes = np.empty(len(me.polygons), np.int32)
+            me.polygons.foreach_get("loop_total", face_sizes)
+            corners = np.arange(len(me.loops), dtype=np.int32)
+            face_materials = poly_materials
+
+        # corner normals (Blender >= 4.1 exposes them directly)
+        if hasattr(me, "corner_normals"):
+            loop_normals = np.empty(len(me.corner_normals) * 3, np.float32)
+            me.corner_normals.foreach_get("vector", loop_normals)
+        else:
+            me.calc_normals_split()
+            loop_normals = np.empty(len(me.loops) * 3, np.float32)
+            me.loops.foreach_get("normal", loop_normals)
+        loop_normals = loop_normals.reshape(-1, 3)
+
+        loop_uvs = None
+        if me.uv_layers.active is not None:
+            loop_uvs = np.empty(len(me.loops) * 2, np.float32)
+            me.uv_layers.active.data.foreach_get("uv", loop_uvs)
+            loop_uvs = loop_uvs.reshape(-1, 2)
+    finally:
+        ob_eval.to_mesh_clear()
+
+    flip = False
+    if matrix is not None:
+        matrix = np.asarray(matrix, np.float64)
+        m3 = matrix[:3, :3]
+        positions = (positions @ m3.T + matrix[:3, 3]).astype(np.float32)
+        normal_matrix = np.linalg.inv(m3)
+        # mirrored transforms flip the winding order
+        flip = np.linalg.det(m3) < 0.0
+
+    face_vertices = np.empty(len(corners), np.int32)
+    normal_rows = _UniqueRows(4, 3, np.empty(len(corners), np.int32))
+    uv_rows = _UniqueRows(6, 2, np.empty(len(corners), np.int32)) if loop_uvs is not None else None
+    for start, end, first_corner, end_corner in _face_chunks(face_sizes):
+        chunk = corners[first_corner:end_corner]
+        if flip:
+            chunk = chunk[_reversed_corners(face_sizes[start:end])]
+        face_vertices[first_corner:end_corner] = loop_vertices[chunk]
+        normals = loop_normals[chunk]
+        if matrix is not None:
+            normals = normals @ normal_matrix
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            normals = normals / np.where(lengths > 0.0, lengths, 1.0)
+        normal_rows.add(first_corner, normals)
+        if uv_rows is not None:
+            uv_rows.add(first_corner, loop_uvs[chunk])
+    del loop_vertices, loop_normals, loop_uvs, corners
+
+    normal_pool, face_normals = normal_rows.finish()
+    uv_pool, face_uvs = uv_rows.finish() if uv_rows is not None else (None, None)
+
+    return MeshData(ob_eval.name, positions, face_sizes, face_vertices,
+                    normals=normal_pool, face_normals=face_normals,
+                    uvs=uv_pool, face_uvs=face_uvs, face_materials=face_materials)
+
+def _compact(pool, indices):
+    # keep the pool entries used by indices, renumbered in order
+    if pool is None:
+        return None, None
+    used = np.zeros(len(pool), bool)
+    used[indices] = True
+    renumber = np.cumsum(used, dtype=np.int32) - 1
+    return pool[used], renumber[indices]
+
+def split_by_material(data, nb_slots):
+    """Partition the faces of data by material slot, returns [(slot, MeshData)]
+    for the slots used by at least one face, each with only its own faces and
+    attributes. Indices past the last slot use the last one, like Blender."""
+    materials = np.clip(data.face_materials, 0, max(nb_slots - 1, 0))
+    slots = np.unique(materials)
+    if len(slots) <= 1:
+        slot = int(slots[0]) if len(slots) else 0
+        return [(slot, MeshData(data.name, data.positions, data.face_sizes, data.face_vertices,
+                                data.normals, data.face_normals, data.uvs, data.face_uvs))]
+
+    # the faces (and their corners) of one slot at a time, in their order
+    face_starts = np.cumsum(data.face_sizes) - data.face_sizes
+    parts = []
+    for slot in slots.tolist():
+        faces = np.flatnonzero(materials == slot)
+        face_sizes = data.face_sizes[faces]
+        slot_starts = np.cumsum(face_sizes) - face_sizes
+        part = np.repeat(face_starts[faces] - slot_starts, face_sizes) + np.arange(int(face_sizes.sum()))
+        positions, face_vertices = _compact(data.positions, data.face_vertices[part])
+        normals, face_normals = _compact(data.normals, None if data.face_normals is None else data.face_normals[part])
+        uvs, face_uvs = _compact(data.uvs, None if data.face_uvs is None else data.face_uvs[part])
+        parts.append((slot, MeshData(data.name, positions, face_sizes, face_vertices,
+                                     normals, face_normals, uvs, face_uvs)))
+    return parts
+
+def _first_use(pool, indices):
+    # keep the pool entries used by indices, renumbered in order of first use
+    if pool is None:
+        return None, None
+    used, first, inverse = np.unique(indices, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    return pool[used[order]], rank[inverse.reshape(-1)]
+
+def _morton_codes(points, bits=10):
+    # 3D Morton (Z-order) code of points quantized to 2**bits cells per axis of their bounds
+    low, high = points.min(axis=0), points.max(axis=0)
+    cells = ((points - low) / np.where(high > low, high - low, 1.0) * ((1 << bits) - 1)).astype(np.uint64)
+    codes = np.zeros(len(points), np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return codes
+
+def optimize_mesh(data):
+    """Weld duplicate positions (at the precision they are written with), drop
+    unused attributes and reorder faces along a Morton curve of their centers,
+    attributes being renumbered in order of first use so that neighbouring
+    faces reference neighbouring vertices. Returns (MeshData, stats) where
+    stats maps each attribute pool to its size (before, after)"""
+    stats = {"positions": len(data.positions),
+             "normals": 0 if data.normals is None else len(data.normals),
+             "uvs": 0 if data.uvs is None else len(data.uvs)}
+    if len(data.face_sizes) == 0:
+        return data, {name: (n, n) for name, n in stats.items()}
+
+    positions, welded = _unique_rows(data.positions, 6)
+    face_vertices = welded.reshape(-1)[data.face_vertices]
+
+    # faces (and their corners) sorted by the Morton code of their center
+    face_starts = np.cumsum(data.face_sizes) - data.face_sizes
+    centers = np.add.reduceat(positions[face_vertices].astype(np.float64), face_starts, axis=0) / data.face_sizes[:, None]
+    order = np.argsort(_morton_codes(centers), kind="stable")
+    face_sizes = data.face_sizes[order]
+    sorted_starts = np.cumsum(face_sizes) - face_sizes
+    corners = np.repeat(face_starts[order] - sorted_starts, face_sizes) + np.arange(int(face_sizes.sum()))
+
+    positions, face_vertices = _first_use(positions, face_vertices[corners])
+    normals, face_normals = _first_use(data.normals, None if data.face_normals is None else data.face_normals[corners])
+    uvs, face_uvs = _first_use(data.uvs, None if data.face_uvs is None else data.face_uvs[corners])
+    result = MeshData(data.name, positions, face_sizes, face_vertices, normals, face_normals, uvs, face_uvs,
+                      data.face_materials[order])
+    stats["positions"] = (stats["positions"], len(positions))
+    stats["normals"] = (stats["normals"], 0 if normals is None else len(normals))
+    stats["uvs"] = (stats["uvs"], 0 if uvs is None else len(uvs))
+    return result, stats
+
+def optimize_and_write(mesh_format, filepath, data):
+    """optimize_mesh then write data in mesh_format, returns (bytes written,
+    bytes the mesh would take unoptimized, stats)"""
+    unoptimized = MESH_SIZES[mesh_format](data) # measured, not encoded
+    data, stats = optimize_mesh(data)
+    return MESH_WRITERS[mesh_format](filepath, data), unoptimized, stats
+
+def _fan_triangles(face_sizes):
+    # corners (T, 3) of a fan triangulation of every face, and the face of each triangle
+    starts = np.cumsum(face_sizes) - face_sizes
+    counts = face_sizes - 2
+    faces = np.repeat(np.arange(len(face_sizes)), counts)
+    k = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    first = starts[faces]
+    return np.stack((first, first + k, first + k + 1), axis=1), faces
+
+def surface_area(data):
+    """Total area of the faces of data"""
+    if len(data.face_sizes) == 0:
+        return 0.0
+    corners, _ = _fan_triangles(data.face_sizes)
+    triangles = data.face_vertices[corners]
+    positions = data.positions.astype(np.float64)
+    a, b, c = positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]]
+    return float(0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1).sum())
+
+def _cluster(positions, cell):
+    # grid cell of every position -> (cluster index per position, cluster centers)
+    cells = np.floor((positions - positions.min(axis=0)) / cell).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+    cluster = cluster.reshape(-1)
+    counts = np.bincount(cluster)
+    centers = np.stack([np.bincount(cluster, positions[:, i]) for i in range(3)], axis=1) / counts[:, None]
+    return cluster, centers
+
+def decimate(data, target_triangles, max_passes=4):
+    """Simplify data by vertex clustering to about target_triangles triangles
+
+    The vertices falling in the same cell of a regular grid are merged into
+    their mean, the triangles that collapse are dropped. The cell size is
+    first estimated from the surface area, then corrected from the triangle
+    count of the previous pass. Corner normals and uvs are kept from the
+    original corners. Returns a triangulated MeshData, or data itself when
+    it is already small enough."""
+    if data.triangle_count <= target_triangles or len(data.face_sizes) == 0:
+        return data
+    corners, faces = _fan_triangles(data.face_sizes)
+    triangles = data.face_vertices[corners]
+    positions = data.positions.astype(np.float64)
+    a, b, c = positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]]
+    area = 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1).sum()
+    if area <= 0.0:
+        return data
+
+    # on a surface, each occupied cell gives about one vertex and two triangles
+    cell = np.sqrt(2.0 * area / target_triangles)
+    for _ in range(max_passes):
+        cluster, centers = _cluster(positions, cell)
+        clustered = cluster[triangles]
+        keep = np.flatnonzero((clustered[:, 0] != clustered[:, 1]) & (clustered[:, 1] != clustered[:, 2])
+                              & (clustered[:, 0] != clustered[:, 2]))
+        # triangles collapsing onto the same three clusters are kept once
+        _, first = np.unique(np.sort(clustered[keep], axis=1), axis=0, return_index=True)
+        keep = keep[np.sort(first)]
+        if len(keep) <= 1.25 * target_triangles:
+            break
+        cell *= np.sqrt(len(keep) / target_triangles)
+    if len(keep) == 0:
+        return data
+
+    kept_corners = corners[keep].reshape(-1)
+    positions, face_vertices = _compact(centers.astype(np.float32), clustered[keep].reshape(-1))
+    normals, face_normals = _compact(data.normals, None if data.face_normals is None else data.face_normals[kept_corners])
+    uvs, face_uvs = _compact(data.uvs, None if data.face_uvs is None else data.face_uvs[kept_corners])
+    return MeshData(data.name, positions, np.full(len(keep), 3, np.int32), face_vertices,
+                    normals, face_normals, uvs, face_uvs, data.face_materials[faces[keep]])
+
+######################
+# OBJ encoding
+######################
+# Files are encoded and written CHUNK_ROWS rows (vertices, faces) at a
+# time, so the text of a huge mesh is never held in memory at once.
+CHUNK_ROWS = 1 << 16
+
+def _format_rows(fmt, values):
+    # one % operation for the whole array is much faster than a loop
+    if len(values) == 0:
+        return ""
+    return (fmt * len(values)) % tuple(values.ravel().tolist())
+
+def _write_rows(f, fmt, values):
+    written = 0
+    for start in range(0, len(values), CHUNK_ROWS):
+        written += f.write(_format_rows(fmt, values[start:start + CHUNK_ROWS]))
+    return written
+
+def _corner_format(data):
+    if data.face_uvs is not None and data.face_normals is not None:
+        return "%d/%d/%d", (data.face_vertices, data.face_uvs, data.face_normals)
+    if data.face_normals is not None:
+        return "%d//%d", (data.face_vertices, data.face_normals)
+    if data.face_uvs is not None:
+        return "%d/%d", (data.face_vertices, data.face_uvs)
+    return "%d", (data.face_vertices,)
+
+def _obj_face_chunks(data):
+    # "f ..." lines of CHUNK_ROWS faces at a time
+    corner, columns = _corner_format(data)
+    nb_faces = len(data.face_sizes)
+    corner_ends = np.cumsum(data.face_sizes)
+    if data.is_triangular:
+        face_format = "f " + " ".join([corner] * 3) + "\n"
+    else:
+        templates = {}
+        for size in np.unique(data.face_sizes).tolist():
+            templates[size] = "f " + " ".join([corner] * size) + "\n"
+    for start in range(0, nb_faces, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, nb_faces)
+        first_corner = corner_ends[start] - data.face_sizes[start]
+        indices = np.stack([c[first_corner:corner_ends[end - 1]] for c in columns], axis=1) + 1
+        if data.is_triangular:
+            yield _format_rows(face_format, indices.reshape(end - start, -1))
+        else:
+            face_format = "".join([templates[size] for size in data.face_sizes[start:end].tolist()])
+            yield face_format % tuple(indices.ravel().tolist())
+
+# characters of the formatted numbers, to size a file without encoding it
+_POWERS_OF_TEN = 10.0 ** np.arange(1, 20)
+
+def _int_lengths(values):
+    # characters of "%d" for every non negative value
+    return np.searchsorted(_POWERS_OF_TEN, values, side="right") + 1
+
+def _fixed_lengths(values, decimals):
+    # characters of "%.<decimals>f" for every value, "-" included for -0.0
+    rounded = np.round(np.abs(values.astype(np.float64)), decimals)
+    return np.signbit(values) + _int_lengths(np.floor(rounded)) + 1 + decimals
+
+def _text_length(values, lengths):
+    # total characters of the formatted values, CHUNK_ROWS rows at a time
+    return sum(int(lengths(values[start:start + CHUNK_ROWS]).sum()) for start in range(0, len(values), CHUNK_ROWS))
+
+def obj_size(data):
+    """Number of characters write_obj writes for data, without encoding it"""
+    size = len("# Nori exporter\no %s\n" % data.name) + len("s 0\n")
+    # fixed characters of every line: "v " + 2 separators + newline, ...
+    size += _text_length(data.positions, lambda v: _fixed_lengths(v, 6)) + 5 * len(data.positions)
+    if data.uvs is not None:
+        size += _text_length(data.uvs, lambda v: _fixed_lengths(v, 6)) + 5 * len(data.uvs)
+    if data.normals is not None:
+        size += _text_length(data.normals, lambda v: _fixed_lengths(v, 4)) + 6 * len(data.normals)
+    # "f " + a separator between corners + newline, and the slashes of every corner
+    corner, columns = _corner_format(data)
+    size += len(data.face_vertices) + 2 * len(data.face_sizes)
+    size += (len(corner) - 2 * len(columns)) * len(data.face_vertices)
+    size += sum(_text_length(column, lambda i: _int_lengths(i + 1)) for column in columns)
+    return size
+
+def encode_obj_faces(data):
+    return "".join(_obj_face_chunks(data))
+
+def write_obj(filepath, data):
+    """Write a MeshData as a Wavefront OBJ file, returns the number of bytes written"""
+    with open(filepath, "w", buffering=1 << 20) as f:
+        written = f.write("# Nori exporter\no %s\n" % data.name)
+        written += _write_rows(f, "v %.6f %.6f %.6f\n", data.positions)
+        if data.uvs is not None:
+            written += _write_rows(f, "vt %.6f %.6f\n", data.uvs)
+        if data.normals is not None:
+            written += _write_rows(f, "vn %.4f %.4f %.4f\n", data.normals)
+        written += f.write("s 0\n")
+        for chunk in _obj_face_chunks(data):
+            written += f.write(chunk)
+    return written
+
+######################
+# binary PLY encoding
+######################
+# Layout written by write_ply (all little-endian):
+#   element vertex N : float x y z [nx ny nz] [u v]
+#   element face F   : list uchar uint vertex_indices
+#                      (list uint uint when a face has more than 255 corners)
+# Every face corner references a single vertex, so attribute tuples are
+# unified first. For triangle meshes the face block is a fixed stride
+# (1 + 3*4 bytes) and can be memory-mapped directly.
+
+# PLY type and NumPy type of the corner count of every face
+PLY_COUNT_TYPES = {"uchar": "u1", "uint": "<u4"}
+
+def ply_count_type(face_sizes):
+    """uchar, or uint when a face has more corners than a byte can count"""
+    return "uint" if len(face_sizes) and int(face_sizes.max()) > 255 else "uchar"
+
+def _corner_columns(data):
+    # (attribute pool, corner indices) of every attribute, and the pool sizes
+    columns = [(data.positions, data.face_vertices)]
+    if data.face_normals is not None:
+        columns.append((data.normals, data.face_normals))
+    if data.face_uvs is not None:
+        columns.append((data.uvs, data.face_uvs))
+    return columns, [max(len(pool), 1) for pool, _ in columns]
+
+def _corner_keys(columns, sizes):
+    # one int64 key per corner, ordered like the index tuples, None if it could overflow
+    if np.prod(sizes, dtype=np.float64) >= 2.0 ** 62:
+        return None
+    keys = columns[0][1].astype(np.int64)
+    for (_, column), size in zip(columns[1:], sizes[1:]):
+        keys *= size
+        keys += column
+    return keys
+
+def unify_corners(data):
+    """Merge the per corner (position, normal, uv) index tuples into single
+    vertices, returns (positions, normals, uvs, corner_indices)"""
+    if len(data.face_vertices) == 0:
+        return np.zeros((0, 3), np.float32), None, None, np.zeros(0, np.uint32)
+    columns, sizes = _corner_columns(data)
+    keys = _corner_keys(columns, sizes)
+    if keys is not None:
+        unique_keys, corner_indices = np.unique(keys, return_inverse=True)
+        del keys
+        indices = []
+        for size in reversed(sizes[1:]):
+            indices.append(unique_keys % size)
+            unique_keys //= size
+        indices.append(unique_keys)
+        indices.reverse()
+    else:
+        unique_keys, corner_indices = np.unique(np.stack([c for _, c in columns], axis=1), axis=0, return_inverse=True)
+        indices = list(unique_keys.T)
+    positions = data.positions[indices[0]]
+    normals = data.normals[indices[1]] if data.face_normals is not None else None
+    uvs = data.uvs[indices[-1]] if data.face_uvs is not None else None
+    return positions, normals, uvs, corner_indices.reshape(-1).astype(np.uint32)
+
+def _ply_vertex_dtype(has_normals, has_uvs):
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if has_normals:
+        fields += [("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4")]
+    if has_uvs:
+        fields += [("u", "<f4"), ("v", "<f4")]
+    return np.dtype(fields)
+
+def _ply_face_block(face_sizes, indices, count_type="uchar"):
+    count = np.dtype(PLY_COUNT_TYPES[count_type])
+    if len(face_sizes) and np.all(face_sizes == 3):
+        block = np.empty(len(face_sizes), np.dtype([("n", count), ("i", "<u4", (3,))]))
+        block["n"] = 3
+        block["i"] = indices.reshape(-1, 3)
+        return block.tobytes()
+    # variable face sizes: scatter the count bytes and the index bytes
+    record_sizes = count.itemsize + 4 * face_sizes.astype(np.int64)
+    offsets = np.cumsum(record_sizes) - record_sizes
+    count_bytes = (offsets[:, None] + np.arange(count.itemsize)).reshape(-1)
+    block = np.empty(int(record_sizes.sum()), np.uint8)
+    is_count = np.zeros(len(block), bool)
+    is_count[count_bytes] = True
+    block[count_bytes] = np.frombuffer(face_sizes.astype(count).tobytes(), np.uint8)
+    block[~is_count] = np.frombuffer(indices.astype("<u4").tobytes(), np.uint8)
+    return block.tobytes()
+
+def _ply_header(data, dtype, nb_vertices):
+    header = ["ply", "format binary_little_endian 1.0", "comment Nori exporter",
+              "obj_info %s" % data.name,
+              "element vertex %d" % nb_vertices]
+    header += ["property float %s" % name for name in dtype.names]
+    header += ["element face %d" % len(data.face_sizes),
+               "property list %s uint vertex_indices" % ply_count_type(data.face_sizes), "end_header", ""]
+    return "\n".join(header).encode("ascii")
+
+def ply_size(data):
+    """Number of bytes write_ply writes for data, without encoding it"""
+    if len(data.face_vertices) == 0:
+        nb_vertices, dtype = 0, _ply_vertex_dtype(False, False)
+    else:
+        # the vertex count of unify_corners, without the inverse indices
+        columns, sizes = _corner_columns(data)
+        keys = _corner_keys(columns, sizes)
+        if keys is None:
+            keys = np.stack([c for _, c in columns], axis=1)
+        nb_vertices = len(np.unique(keys, axis=0 if keys.ndim > 1 else None))
+        dtype = _ply_vertex_dtype(data.face_normals is not None, data.face_uvs is not None)
+    # a count per face, 4 bytes per corner
+    count = np.dtype(PLY_COUNT_TYPES[ply_count_type(data.face_sizes)])
+    face_block = count.itemsize * len(data.face_sizes) + 4 * len(data.face_vertices)
+    return len(_ply_header(data, dtype, nb_vertices)) + nb_vertices * dtype.itemsize + face_block
+
+def write_ply(filepath, data):
+    """Write a MeshData as a little-endian binary PLY file, returns the number of bytes written"""
+    positions, normals, uvs, indices = unify_corners(data)
+    dtype = _ply_vertex_dtype(normals is not None, uvs is not None)
+
+    with open(filepath, "wb", buffering=1 << 20) as f:
+        written = f.write(_ply_header(data, dtype, len(positions)))
+        # vertex records and face blocks are built CHUNK_ROWS rows at a time
+        for start in range(0, len(positions), CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, len(positions))
+            vertices = np.empty(end - start, dtype)
+            vertices["x"], vertices["y"], vertices["z"] = positions[start:end].T
+            if normals is not None:
+                vertices["nx"], vertices["ny"], vertices["nz"] = normals[start:end].T
+            if uvs is not None:
+                vertices["u"], vertices["v"] = uvs[start:end].T
+            written += f.write(vertices.tobytes())
+        count_type = ply_count_type(data.face_sizes)
+        corner_ends = np.cumsum(data.face_sizes)
+        for start in range(0, len(data.face_sizes), CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, len(data.face_sizes))
+            first_corner = corner_ends[start] - data.face_sizes[start]
+            written += f.write(_ply_face_block(data.face_sizes[start:end], indices[first_corner:corner_ends[end - 1]],
+                                               count_type))
+    return written
+
+def read_ply(filepath):
+    """Read back a binary PLY written by write_ply into a MeshData
+
+    Attribute pools are per vertex, so face_vertices, face_normals and
+    face_uvs share the same indices."""
+    with open(filepath, "rb") as f:
+        content = f.read()
+    end = content.index(b"end_header\n") + len(b"end_header\n")
+    header = content[:end].decode("ascii").splitlines()
+    if header[0] != "ply" or header[1] != "format binary_little_endian 1.0":
+        raise ValueError("%s is not a binary little-endian PLY file" % filepath)
+
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    vertex_count, face_count, properties, count = 0, 0, [], np.dtype("u1")
+    for line in header:
+        tokens = line.split()
+        if tokens[0] == "obj_info":
+            name = line[len("obj_info "):]
+        elif tokens[0] == "element" and tokens[1] == "vertex":
+            vertex_count = int(tokens[2])
+        elif tokens[0] == "element" and tokens[1] == "face":
+            face_count = int(tokens[2])
+        elif tokens[0] == "property" and tokens[1] == "float":
+            properties.append(tokens[2])
+        elif tokens[0] == "property" and tokens[1] == "list":
+            count = np.dtype(PLY_COUNT_TYPES[tokens[2]])
+
+    dtype = np.dtype([(p, "<f4") for p in properties])
+    vertices = np.frombuffer(content, dtype, vertex_count, end)
+    faces = memoryview(content)[end + vertex_count * dtype.itemsize:]
+
+    face_sizes = np.empty(face_count, np.int32)
+    indices = []
+    offset = 0
+    if face_count and np.frombuffer(faces, count, 1)[0] == 3 and len(faces) == face_count * (count.itemsize + 12):
+        block = np.frombuffer(faces, np.dtype([("n", count), ("i", "<u4", (3,))]), face_count)
+        face_sizes[:] = block["n"]
+        indices = block["i"].reshape(-1)
+    else:
+        for f_id in range(face_count):
+            size = int(np.frombuffer(faces, count, 1, offset)[0])
+            face_sizes[f_id] = size
+            indices.append(np.frombuffer(faces, "<u4", size, offset + count.itemsize))
+            offset += count.itemsize + 4 * size
+        indices = np.concatenate(indices) if indices else np.zeros(0, np.uint32)
+    indices = indices.astype(np.int32)
+
+    positions = np.stack((vertices["x"], vertices["y"], vertices["z"]), axis=1)
+    normals, uvs = None, None
+    if "nx" in properties:
+        normals = np.stack((vertices["nx"], vertices["ny"], vertices["nz"]), axis=1)
+    if "u" in properties:
+        uvs = np.stack((vertices["u"], vertices["v"]), axis=1)
+    return MeshData(name, positions, face_sizes, indices,
+                    normals=normals, face_normals=indices if normals is not None else None,
+                    uvs=uvs, face_uvs=indices if uvs is not None else None)
+
+MESH_WRITERS = {"OBJ": write_obj, "PLY": write_ply}
+MESH_EXTENSIONS = {"OBJ": ".obj", "PLY": ".ply"}
+MESH_SIZES = {"OBJ": obj_size, "PLY": ply_size}
+
+def mesh_digest(data):
+    """Content hash of the geometry, identical meshes give identical digests"""
+    h = hashlib.blake2b(digest_size=16)
+    for array in (data.positions, data.normals, data.uvs, data.face_sizes,
+                  data.face_vertices, data.face_normals, data.face_uvs, data.face_materials):
+        if array is None:
+            h.update(b"-")
+            continue
+        array = np.ascontiguousarray(array)
+        h.update(("%s%s" % (array.dtype.str, array.shape)).encode("ascii"))
+        h.update(array.tobytes())
+    return h.hexdigest()
@@ -1,10 +1,27 @@
-import bpy, os, math, shutil
+import bpy, os, io, re, math, shutil, functools
+import numpy as np
 from mathutils import Matrix, Vector, Color
 from xml.dom.minidom import Document
+from .xml_writer import StreamingDocument
+from .mesh_writer import extract_mesh_data, split_by_material, mesh_digest, optimize_and_write, surface_area, \
+    MESH_WRITERS, MESH_EXTENSIONS
+from .manifest import ExportManifest, manifest_path, source_stamp
+from .textures import TextureStager
+from .pipeline import MeshPipeline
+from .profiler import ExportProfiler, profile_path, timed_call
+from .staging import staging_path, create_staging, commit_staging
+from .atomic import AtomicFile, write_atomic
+from .culling import FrustumCuller, placed_corners, triangle_count
+from .lod import LodCache, lod_cache_path, coverage_pixels, lod_budget
+from .envmap import env_tables_path, env_tables_key, read_tables_key, write_env_tables
+from .texture_processing import TextureCache, texture_cache_path, processed_size
+from .render_farm import split_scene, jobs_path, read_jobs, remove_stale_jobs
+from .memory import MemoryBudget
+from .report import SceneReport, report_path
 
 # ExportHelper is a helper class, defines filename and
 # invoke() function which calls the file selector.
-from bpy_extras.io_utils import ExportHelper
+from bpy_extras.io_utils import ExportHelper, axis_conversion
 from bpy.props import StringProperty, BoolProperty, EnumProperty
 from bpy.types import Operator
 
@@ -18,7 +35,7 @@ from bpy_extras.wm_utils.progress_report import (
 # -----------------------------------------------------------------------------
 # Module-level Shared State
 
-watched_objects = {}  # used to trigger compositor updates on scene updates
+watched_objects = {}  # object name -> mesh files known by the live sync consumer (see live_sync.py)
 
 SUPPORTED_OBJECT_TYPES = {"MESH", "CURVE", "FONT", "META", "EMPTY", "SURFACE"} #Formats we can save as .obj
 
@@ -29,37 +46,75 @@ def copy_materials(ob_src, ob_target):
         ob_target.data.materials.append(mat)
     ob_target.active_material = ob_src.active_material
 
+# An object deleted since it was collected raises on any access
+def is_valid(ob):
+    try:
+        ob.name
+    except ReferenceError:
+        return False
+    return True
+
+def _hashable(value):
+    # socket values are floats, strings or bpy arrays
+    try:
+        return tuple(value)
+    except TypeError:
+        return value
+
+# Everything the conversion of a material reads: its viewport color and the
+# type, input values, image settings and links of every node of its tree
+def material_fingerprint(material):
+    node_tree = material.node_tree
+    parts = [_hashable(material.diffuse_color)]
+    if node_tree is not None:
+        for node in node_tree.nodes:
+            image = getattr(node, "image", None)
+            parts.append((node.name, node.bl_idname,
+                          tuple((socket.name, _hashable(getattr(socket, "default_value", None))) for socket in node.inputs),
+                          image and (image.name, image.filepath),
+                          tuple(getattr(node, attr, None) for attr in ("interpolation", "extension", "projection"))))
+        for link in node_tree.links:
+            parts.append((link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier))
+    return tuple(parts)
+
+# Group the depsgraph instances by source object in a single pass
+def index_instances(dg):
+    instances = {}
+    for ob_inst in dg.object_instances:
+        if ob_inst.parent and ob_inst.is_instance:
+            # the instance struct is temporary, keep a copy of its matrix
+            instances.setdefault(ob_inst.object.original, []).append(ob_inst.matrix_world.copy())
+    return instances
+
 # Function to temporarily join all instances of an object into a single mesh for exports
-def join_instances(context, ob):
+def join_instances(context, ob, matrices):
     mwi = ob.matrix_world.inverted()
     dg = context.evaluated_depsgraph_get()
 
     bm = bmesh.new()
 
-    is_instance = False
-    for ob_inst in dg.object_instances:
-        if ob_inst.parent and ob_inst.object.original == ob:
-            is_instance = True
-            me = ob_inst.instance_object.to_mesh()
-            bm.from_mesh(me)
-            # transform to match instance
-            bmesh.ops.transform(bm,
-                    matrix=mwi @ ob_inst.matrix_world,
-                    verts=bm.verts[-len(me.vertices):]
-                    )
+    ob_eval = ob.evaluated_get(dg)
+    me = ob_eval.to_mesh()
+    for matrix in matrices:
+        bm.from_mesh(me)
+        # transform to match instance
+        bmesh.ops.transform(bm,
+                matrix=mwi @ matrix,
+                verts=bm.verts[-len(me.vertices):]
+                )
+    ob_eval.to_mesh_clear()
 
     # link an object with the instanced mesh
-    if (not is_instance):
-        return ob, is_instance
     me = bpy.data.meshes.new(f"{ob.data.name}_InstanceMesh")
     bm.to_mesh(me)
+    bm.free()
     ob_ev = bpy.data.objects.new(f"{ob.name}_InstancedObject", me) 
     ob_ev.matrix_world = ob.matrix_world
 
     copy_materials(ob, ob_ev)
 
     context.collection.objects.link(ob_ev)
-    return ob_ev, is_instance
+    return ob_ev
 
 # Main class exporter
 class NoriWriter:
@@ -72,11 +127,66 @@ class NoriWriter:
         self.scene = context.scene
         self.filepath = filepath
         self.workingDir = os.path.dirname(self.filepath)
+        # final location of the export, workingDir is a staging folder while export_staging writes
+        self.target_filepath = self.filepath
+        self.targetDir = self.workingDir
         self.export_textures = False
         self.mesh_dir = "meshes"
         self.texture_dir = "textures"
         self.support_disney = False
         self.export_thin_lens = False
+        self.xml_backend = "STREAM" # "STREAM" writes entries as they are created, "DOM" keeps the whole document
+        self.mesh_backend = "NATIVE" # "NATIVE" uses the built-in writer, "OPERATOR" calls bpy.ops.wm.obj_export
+        self.mesh_format = "OBJ" # "OBJ" text meshes, "PLY" little-endian binary meshes
+        self.export_triangular = True
+        self.export_meshes_dedup = False # write identical geometry once and reference it with per-object transforms
+        self.export_incremental = False # only rewrite meshes and textures that changed since the last export
+        self.manifest = None
+        self.texture_transfer = "REFLINK" # "COPY", "REFLINK" (copy-on-write clone) or "HARDLINK"
+        self.texture_workers = 4
+        self.texture_verify_hash = False # also compare the contents of up to date looking textures
+        self.mesh_workers = 2 # workers encoding and writing mesh files, <= 1 writes them on the main thread
+        self.mesh_worker_mode = "THREAD" # "THREAD" or "PROCESS"
+        self.max_in_flight = 0 # mesh snapshots queued at a time, 0 for twice the number of workers
+        self.instance_mode = "REFERENCE" # "REFERENCE" writes instance sources once, "MERGE" joins every instance into one mesh
+        self.instances = {}
+        self.export_animation = False # one xml per frame of [frame_start, frame_end]
+        self.frame_start = 1
+        self.frame_end = 1
+        self.frame_step = 1
+        self.export_profile = False # write a json timing/memory report next to the xml
+        self.export_staging = False # write to a staging folder, moved in place only if the export succeeds
+        self.export_culling = False # skip the objects outside of the camera view (see culling.py)
+        self.culling_margin = 0.1 # fraction of the view added on every side before culling
+        self.culling_distance = 0.0 # objects farther than this are culled, 0 for the camera clip end
+        self.camera_object = None
+        self.export_lod = False # decimate meshes to the screen area they cover (see lod.py)
+        self.lod_triangles_per_pixel = 1.0
+        self.lod_min_triangles = 64
+        self.export_env_importance = False # precompute the sampling tables of the environment map (see envmap.py)
+        self.env_mip_levels = 0
+        self.texture_processing = False # convert 8-bit textures to resized PNGs with mip levels (see texture_processing.py)
+        self.texture_max_size = 0 # largest side of a processed texture, 0 for no limit
+        self.texture_footprint = False # also limit textures to the screen size of the objects using them
+        self.texture_mip_levels = 0
+        self.texture_footprints = {}
+        self.optimize_meshes = False # weld attributes and reorder faces for locality before writing
+        self.farm_jobs = 0 # > 1 also writes that many render farm jobs of every xml (see render_farm.py)
+        self.farm_split = "TILES" # "TILES" (crop windows) or "SAMPLES" (sample slices with their own seed)
+        self.camera_batch = "NONE" # "CAMERAS" or "MARKERS" also writes one xml per camera, sharing the meshes and textures
+        self.view_cameras = []
+        self.view_entries = []
+        self.memory_budget = 0 # MB, objects exceeding it are logged and queued mesh snapshots use at most half of it
+        self.object_triangles = 0
+        self.shared_assets = False # mesh and texture files named after their content and only written when missing, for exports sharing a folder
+        self.cache_dir = "" # folder of the level of detail and texture caches shared between exports, "" keeps them next to the xml
+        self.export_report = False # write a render cost report next to every xml (see report.py)
+        self.report_max_triangles = 0 # scene budgets flagged by the report, 0 for none
+        self.report_max_memory = 0 # MB
+        self.scene_report = None
+        self.profiler = ExportProfiler(False)
+        self.mesh_forward_axis = "Y"
+        self.mesh_up_axis = "Z"
         
     ######################
     # tools private methods
@@ -102,15 +212,31 @@ class NoriWriter:
             if len(linked_nodes)> 0 and self.export_textures:
                 if (linked_nodes[0].from_node.bl_label == "Image Texture"):
                     # get path
-                    texture_path = os.path.realpath(bpy.path.abspath(linked_nodes[0].from_node.image.filepath.strip()))
-                    texture_file = self.texture_dir + "/" + os.path.basename(texture_path)
-                    texture_destination = self.workingDir + "/" + texture_file
-                    print(texture_path)
-
-                    # copy texture to textures folder
-                    shutil.copy(texture_path, texture_destination)
+                    image = linked_nodes[0].from_node.image
+                    texture_path = os.path.realpath(bpy.path.abspath(image.filepath.strip()))
+                    self.verbose("TEXTURE: " + texture_path)
+
+                    # copy texture to textures folder (in the background, once per export)
+                    nb_mips = 0
+                    texture_file = None
+                    if self.texture_processing and not image.is_float:
+                        try:
+                            texture_file, nb_mips = self.textures.stage_processed(image, texture_path,
+                                                                                  self.texture_size_limit(image), self.texture_mip_levels)
+                        except OSError as e:
+                            self.verbose("WARN: Could not process texture %s (%s), it is copied" % (texture_path, e))
+                    if texture_file is None:
+                        texture_file = self.textures.stage(texture_path)
+                        if self.scene_report is not None:
+                            self.scene_report.texture(texture_file, *image.size)
+                    elif self.scene_report is not None:
+                        self.scene_report.texture(texture_file, *processed_size(*image.size, self.texture_size_limit(image)),
+                                                  mip_levels=nb_mips)
                     texture = self.__createElement("texture",{"type":"textmap", "name":name})
                     texture.appendChild(self.__createEntry("string","filename", texture_file))
+                    if nb_mips:
+                        # <name>_mip1.png, <name>_mip2.png, ... next to filename
+                        texture.appendChild(self.__createEntry("integer","mipLevels", str(nb_mips)))
                     texture.appendChild(self.__createEntry("string","interpolation", linked_nodes[0].from_node.interpolation))
                     texture.appendChild(self.__createEntry("string","extension", linked_nodes[0].from_node.extension))
                     texture.appendChild(self.__createEntry("string","projection", linked_nodes[0].from_node.projection))
@@ -137,40 +263,324 @@ class NoriWriter:
     def setExportMeshesWorld(self, export_meshes_world):
         self.export_meshes_world = export_meshes_world
 
+    def meshes_in_local_space(self):
+        """True when mesh files are written in object space and placed with a toWorld transform"""
+        if (self.export_meshes_dedup or self.export_animation) and self.mesh_backend == "NATIVE":
+            return True
+        return not self.export_meshes_world
+
     def write(self, exportLight, exportMaterialColor, nbSamples):
         """Main method to write the blender scene into Nori format
+        (see write_steps)"""
+        for _ in self.write_steps(exportLight, exportMaterialColor, nbSamples):
+            pass
+
+    def write_steps(self, exportLight, exportMaterialColor, nbSamples):
+        """Write the blender scene into Nori format, one object at a time.
+        Yields the progress of the export (0 to 1) after every object, so
+        the caller can spread the export over several UI events. Closing
+        the generator cancels the export.
         It will export as follows:
          1) write integrator configuration
          2) write samples information (number, distribution)
          3) export one camera
          4) export all light sources
-         5) export all meshes (+bsdf) (+ area emitter)"""
+         5) export all meshes (+bsdf) (+ area emitter)
+         6) export the environment map
+         7) write the xml file (entries are streamed while
+            they are created unless xml_backend is "DOM")"""
+
+        self.profiler = ExportProfiler(self.export_profile)
+        self.profiler.start()
+        try:
+            yield from self.__export_steps(exportLight, exportMaterialColor, nbSamples)
+        finally:
+            # also after a failed or cancelled export, tracing slows down every later allocation
+            self.profiler.stop_tracing()
+
+    def __export_steps(self, exportLight, exportMaterialColor, nbSamples):
+        self.profiler.step("setup")
 
         if bpy.ops.object.mode_set.poll():
             bpy.ops.object.mode_set(mode='OBJECT')
 
+        # files are written to a staging folder and moved next to the xml once complete
+        if self.export_staging:
+            self.workingDir = staging_path(self.target_filepath)
+            self.filepath = os.path.join(self.workingDir, os.path.basename(self.target_filepath))
+            create_staging(self.workingDir)
+        self.staged_jobs = [] # (job manifest in the target folder, its jobs before this export)
+        try:
+            self.start_export()
+            try:
+                if self.export_animation:
+                    # one scene description per frame, meshes are shared between frames
+                    scene = self.context.scene
+                    current_frame = scene.frame_current
+                    frames = range(self.frame_start, self.frame_end + 1, self.frame_step)
+                    try:
+                        for id_frame, frame in enumerate(frames):
+                            scene.frame_set(frame)
+                            for done in self.write_xml(self.frame_filepath(frame), exportLight, exportMaterialColor, nbSamples):
+                                yield (id_frame + done) / len(frames)
+                    finally:
+                        scene.frame_set(current_frame)
+                    self.verbose("ANIMATION: %d frames share %d mesh files" % (len(frames), len(self.shared_meshes)))
+                else:
+                    yield from self.write_xml(self.filepath, exportLight, exportMaterialColor, nbSamples)
+                self.profiler.step("wait mesh workers")
+                self.pipeline.finish()
+            finally:
+                self.pipeline.close()
+                self.profiler.step("wait textures")
+                self.textures.wait(self.verbose)
+
+            if self.export_staging:
+                self.profiler.step("move staged files")
+                self.verbose("STAGING: %d files moved to %s" % (commit_staging(self.workingDir, self.targetDir), self.targetDir))
+                # the jobs were split in the empty staging folder, the stale ones are in the target folder
+                for jobs, previous in self.staged_jobs:
+                    remove_stale_jobs(jobs, previous)
+        finally:
+            if self.export_staging:
+                # nothing is left behind by a failed or cancelled export
+                shutil.rmtree(self.workingDir, ignore_errors=True)
+                self.workingDir = self.targetDir
+                self.filepath = self.target_filepath
+
+        for texture_file, nbytes in self.textures.files:
+            self.profiler.add_file(texture_file, nbytes)
+        self.verbose("TEXTURES: " + self.textures.summary())
+        self.verbose("MATERIALS: %(misses)d conversions, %(hits)d cache hits" % self.material_stats)
+
+        if self.export_culling:
+            self.verbose("CULLING: " + self.culling_summary())
+        if self.optimize_meshes:
+            before = sum(b for name, (b, _) in self.optimize_stats.items() if name != "bytes")
+            after = sum(a for name, (_, a) in self.optimize_stats.items() if name != "bytes")
+            bytes_before, bytes_after = self.optimize_stats["bytes"]
+            self.verbose("OPTIMIZE: %d attributes -> %d, %d bytes -> %d in every optimized mesh file (-%.1f%%)" % (
+                before, after, bytes_before, bytes_after, 100.0 * (bytes_before - bytes_after) / max(bytes_before, 1)))
+        if self.memory is not None:
+            self.verbose("MEMORY: " + self.memory.summary())
+        if self.textures.cache is not None:
+            self.textures.cache.finish()
+        if self.lod_cache is not None:
+            self.lod_cache.finish()
+            self.verbose("LOD: %(decimated)d of %(objects)d meshes over budget, %(before)d -> %(after)d triangles" %
+                         self.lod_stats + " (%s)" % self.lod_cache.summary())
+
+        if self.shared_assets:
+            self.verbose("SHARED: %(written)d mesh files written, %(existing)d already in the folder" % self.shared_stats)
+        if self.manifest is not None:
+            self.profiler.step("manifest")
+            self.manifest.finish()
+            self.verbose("INCREMENTAL: " + self.manifest.summary())
+
+        self.profiler.finish()
+        if self.profiler.enabled:
+            self.profiler.write_json(profile_path(self.filepath))
+            self.verbose(self.profiler.summary())
+
+    def start_export(self):
+        """set up the caches, the manifest and the texture and mesh workers of an export"""
+        # content hash -> mesh file, for export_meshes_dedup and export_animation
+        self.shared_meshes = {}
+        self.written_objects = set()
+        # (material name, node tree fingerprint) -> converted (bsdf, emitter), reset for every scene description
+        self.material_cache = {}
+        self.material_stats = {"hits": 0, "misses": 0}
+        # written mesh files, to estimate the size of the culled geometry
+        self.mesh_stats = {"triangles": 0, "bytes": 0}
+        self.culling_stats = {"objects": 0, "culled_objects": 0, "instances": 0, "culled_instances": 0, "triangles": 0}
+        if self.export_meshes_dedup and self.mesh_backend != "NATIVE":
+            self.verbose("WARN: Mesh deduplication needs the native mesh writer, it is disabled")
+        # decimated meshes, kept next to the xml between exports
+        self.lod_cache = None
+        self.lod_stats = {"objects": 0, "decimated": 0, "before": 0, "after": 0}
+        # attribute pool -> [entries before, after] over every optimized mesh file
+        self.optimize_stats = {name: [0, 0] for name in ("positions", "normals", "uvs", "bytes")}
+        if self.optimize_meshes and self.mesh_backend != "NATIVE":
+            self.verbose("WARN: Mesh optimization needs the native mesh writer, meshes are written as exported")
+        # sidecar file -> key of the environment tables written by this export
+        self.env_tables = {}
+        if self.export_lod:
+            if self.mesh_backend != "NATIVE":
+                self.verbose("WARN: Level of detail needs the native mesh writer, meshes are exported at full resolution")
+            if self.cache_dir:
+                self.lod_cache = LodCache(os.path.join(self.cache_dir, "lod"), prune=False)
+            else:
+                self.lod_cache = LodCache(lod_cache_path(self.target_filepath))
+
+        # files of the previous export, for export_incremental
+        self.manifest = None
+        if self.export_incremental:
+            if self.mesh_backend != "NATIVE":
+                self.verbose("WARN: Incremental export needs the native mesh writer, meshes are always rewritten")
+            # shared files may be used by the other exports of the folder, they are never removed
+            self.manifest = ExportManifest(manifest_path(self.target_filepath), self.targetDir,
+                                           remove_stale=not self.shared_assets)
+        # mesh files written by this export, or already written by another one, for shared_assets
+        self.shared_stats = {"written": 0, "existing": 0}
+
+        # mesh files are encoded and written by workers, the main thread only extracts the data.
+        # Created before the textures: process workers are forked before the texture threads start.
+        self.pipeline = MeshPipeline(self.mesh_workers, self.mesh_worker_mode, self.max_in_flight, self.verbose,
+                                     max_bytes=self.memory_budget * (1 << 20) // 2)
+
+        # texture transfers run on a thread pool while the meshes are exported
+        # processed textures, kept next to the xml between exports
+        texture_cache = None
+        if self.texture_processing:
+            if self.cache_dir:
+                texture_cache = TextureCache(os.path.join(self.cache_dir, "textures"), prune=False)
+            else:
+                texture_cache = TextureCache(texture_cache_path(self.target_filepath))
+        self.textures = TextureStager(self.workingDir, self.texture_dir, self.manifest,
+                                      self.texture_transfer, self.texture_workers, self.texture_verify_hash,
+                                      target_dir=self.targetDir,
+                                      cache=texture_cache, by_content=self.shared_assets)
+        # render cost of every scene description, for export_report
+        self.scene_report = SceneReport() if self.export_report else None
+        # resident memory sampled around every object, for memory_budget
+        self.memory = MemoryBudget(self.memory_budget, self.verbose) if self.memory_budget > 0 else None
+
+    def frame_filepath(self, frame):
+        """scene.xml -> scene_0001.xml"""
+        return "%s_%04d.xml" % (os.path.splitext(self.filepath)[0], frame)
+
+    def write_xml(self, filepath, exportLight, exportMaterialColor, nbSamples):
+        """write the current frame of the scene into a xml file, yields the
+        fraction of exported objects"""
         # create xml document
-        self.doc = Document()
-        self.scene = self.doc.createElement("scene")
-        self.doc.appendChild(self.scene)
-        
+        if self.xml_backend == "DOM":
+            self.doc = Document()
+        else:
+            self.doc = StreamingDocument.open(filepath)
+        # materials can be animated, and entries cannot be shared between documents
+        self.material_cache = {}
+        if self.scene_report is not None:
+            self.scene_report.reset()
+        try:
+            self.scene = self.doc.appendChild(self.doc.createElement("scene"))
+            yield from self.write_scene(exportLight, exportMaterialColor, nbSamples)
+        except BaseException:
+            # failed or cancelled (GeneratorExit), the previous xml stays in place
+            if self.xml_backend != "DOM":
+                self.doc.discard()
+            raise
+
         ######################
-        # 1) write integrator configuration
+        # 7) write the xml file
         ######################
-        if(not exportLight):
-            self.scene.appendChild(self.__createElement("integrator", {"type" : "normals" }))
+        self.profiler.step("7) xml")
+        if self.xml_backend == "DOM":
+            with AtomicFile(filepath) as f:
+                self.doc.writexml(f, "", "\t","\n")
         else:
-            self.scene.appendChild(self.__createElement("integrator", {"type" : "path_mis" }))
-
+            self.doc.close()
+        self.profiler.add_file(os.path.relpath(filepath, self.workingDir), os.path.getsize(filepath))
+        if self.scene_report is not None:
+            report = self.scene_report.to_dict(self.report_max_triangles, self.report_max_memory)
+            self.scene_report.write_json(report_path(filepath), report)
+            for line in self.scene_report.summary(report):
+                self.verbose(line)
+        view_files = self.write_views(filepath)
+
+        # jobs share the mesh and texture files of the scene
+        if self.farm_jobs > 1:
+            for path in [filepath] + view_files:
+                if self.export_staging:
+                    target_jobs = os.path.join(self.targetDir, os.path.relpath(jobs_path(path), self.workingDir))
+                    self.staged_jobs.append((target_jobs, read_jobs(target_jobs)))
+                try:
+                    jobs = split_scene(path, self.farm_jobs, self.farm_split)
+                    self.verbose("FARM: %d %s jobs, manifest %s" % (self.farm_jobs, self.farm_split.lower(), os.path.basename(jobs)))
+                except ValueError as e:
+                    self.verbose("WARN: No render farm jobs: %s" % e)
+
+    def exported_cameras(self):
+        """camera objects of every written xml, culling and level of detail
+        keep what any of them sees"""
+        cameras = [self.camera_object] if self.camera_object is not None else []
+        for _, cam in self.view_cameras:
+            if cam not in cameras:
+                cameras.append(cam)
+        return cameras
+
+    def screen_coverage(self, corners):
+        """largest screen area in pixels of boxes (N, 8, 3) over the exported cameras"""
+        render = self.context.scene.render
+        return np.max([coverage_pixels(cam, render, corners) for cam in self.exported_cameras()], axis=0)
+
+    def view_filepath(self, filepath, name):
+        """scene.xml, Camera.001 -> scene_Camera.001.xml"""
+        return "%s_%s.xml" % (os.path.splitext(filepath)[0], name)
+
+    def batch_cameras(self, cameras):
+        """[(view name, camera object)] of the xml files written besides the
+        main one: every other camera, or the cameras bound to timeline markers
+        (in the marker order, named after the marker)"""
+        if self.camera_batch == "CAMERAS":
+            # the first camera is the one of the main xml
+            views = [(cam.name, cam) for cam in cameras[1:]]
+        elif self.camera_batch == "MARKERS":
+            markers = sorted(self.context.scene.timeline_markers, key=lambda m: m.frame)
+            views = [(m.name, m.camera) for m in markers if m.camera is not None]
+            if not views:
+                self.verbose("WARN: No timeline marker is bound to a camera, only the main xml is written")
+        else:
+            return []
+        # file names must be unique
+        names, unique = set(), []
+        for name, cam in views:
+            base, id_name = re.sub(r"[^\w.-]", "_", name), 1
+            name = base
+            while name in names:
+                id_name += 1
+                name = "%s_%d" % (base, id_name)
+            names.add(name)
+            unique.append((name, cam))
+        return unique
+
+    def write_views(self, filepath):
+        """copy the xml file once per batch camera with its camera entry
+        replaced, returns the written files"""
+        if not self.view_entries:
+            return []
+        with open(filepath) as f:
+            text = f.read()
+        start = text.find("<camera")
+        end = text.find("</camera>", start) + len("</camera>")
+        if start < 0 or end < len("</camera>"):
+            return []
+        files = []
+        for name, camera in self.view_entries:
+            entry = io.StringIO()
+            camera.writexml(entry, "", "\t", "\n")
+            # the entry is indented once in the main xml
+            body = entry.getvalue().rstrip("\n").replace("\n", "\n\t")
+            path = self.view_filepath(filepath, name)
+            with AtomicFile(path) as f:
+                f.write(text[:start])
+                f.write(body)
+                f.write(text[end:])
+            self.profiler.add_file(os.path.relpath(path, self.workingDir), os.path.getsize(path))
+            files.append(path)
+        self.verbose("VIEWS: %d xml files share the meshes and textures of %s" % (len(files), os.path.basename(filepath)))
+        return files
+
+    def write_scene(self, exportLight, exportMaterialColor, nbSamples):
+        """Append every scene entry (steps 1-6 of write) to the xml root,
+        yields the fraction of exported objects after each one"""
         ######################
+        # 1) write integrator configuration
         # 2) write the number of samples
         # and which distribution we will use
         ######################
-        sampler = self.__createElement("sampler", {"type" : "independent" })
-
-        print("samples : ", bpy.context.scene.cycles.samples)
-        sampler.appendChild(self.__createElement("integer", {"name":"sampleCount", "value": str(bpy.context.scene.cycles.samples)}))
-        self.scene.appendChild(sampler)
+        self.profiler.step("1-3) integrator, sampler, camera")
+        for entry in self.write_settings(exportLight):
+            self.scene.appendChild(entry)
 
         ######################
         # 3) export one camera
@@ -178,36 +588,34 @@ class NoriWriter:
         # note that we only support one camera
         cameras = [cam for cam in self.context.scene.objects
                        if cam.type in {'CAMERA'}]
+        self.camera_object = cameras[0] if cameras else None
+        # the other views only differ by their camera entry, written next to the xml
+        self.view_cameras = self.batch_cameras(cameras)
+        self.view_entries = [(name, self.write_camera(cam, self.export_thin_lens)) for name, cam in self.view_cameras]
         if(len(cameras) == 0):
             self.verbose("WARN: No camera to export")
         else:
-            if(len(cameras) > 1):
+            if(len(cameras) > 1 and self.camera_batch == "NONE"):
                 self.verbose("WARN: Does not handle multiple camera, only export the first one")
             self.scene.appendChild(self.write_camera(cameras[0], self.export_thin_lens)) # export the first one
         ######################
         # 4) export all light sources
         ######################
+        self.profiler.step("4) lights")
         if(exportLight):
             sources = [obj for obj in self.context.scene.objects
                           if obj.type in {'LIGHT'} and obj.visible_get()]
             for source in sources:
-                if(source.data.type == "POINT"):
-                    pointLight = self.__createElement("emitter", {"type" : "pointlight" })
-                    pos = source.location
-                    pointLight.appendChild(self.__createEntry("point", "position", "%f,%f,%f"%(pos.x,pos.y,pos.z)))
-                    power = source.data.energy
-                    color = list(source.data.color).copy()
-                    color[0] *=power
-                    color[1] *=power
-                    color[2] *=power
-                    pointLight.appendChild(self.__createEntry("color", "radiance", "%f,%f,%f"%(color[0], color[1], color[2])))
+                pointLight = self.write_light(source)
+                if pointLight is not None:
                     self.scene.appendChild(pointLight)
-                else:
-                    self.verbose("WARN: Light source type (%s) is not supported" % source.data.type)
+                    if self.scene_report is not None:
+                        self.scene_report.point_light(source.name, pointLight)
 
         ######################
         # 5) export all meshes
         ######################
+        self.profiler.step("5) meshes")
         # create the directory for store the meshes
         if not os.path.exists(self.workingDir + "/" + self.mesh_dir):
             os.makedirs(self.workingDir + "/" + self.mesh_dir)
@@ -220,55 +628,283 @@ class NoriWriter:
         # export all of them
         meshes = [obj for obj in bpy.context.scene.objects
                       if obj.visible_get() and obj.type in SUPPORTED_OBJECT_TYPES]
+
+        # depsgraph instances grouped by their source object
+        with self.profiler.timer("index instances"):
+            self.instances = index_instances(self.depsgraph)
+        self.reference_instances = self.instance_mode == "REFERENCE" and self.mesh_backend == "NATIVE"
+        if self.instance_mode == "REFERENCE" and not self.reference_instances:
+            self.verbose("WARN: Instance references need the native mesh writer, instances are merged instead")
+        if self.reference_instances:
+            # sources are often hidden, their instances are still exported
+            exported = set(meshes)
+            meshes += [obj for obj in self.instances
+                           if obj not in exported and obj.type in SUPPORTED_OBJECT_TYPES]
+            self.verbose("INSTANCES: %d instances of %d source objects" %
+                         (sum(len(m) for m in self.instances.values()), len(self.instances)))
+        if self.export_culling:
+            with self.profiler.timer("culling"):
+                meshes = self.cull(meshes)
+        if self.export_lod and self.camera_object is None:
+            self.verbose("WARN: Level of detail needs a camera, meshes are exported at full resolution")
+        if self.texture_processing and self.texture_footprint:
+            with self.profiler.timer("texture footprints"):
+                self.texture_footprints = self.estimate_texture_footprints(meshes)
         
+        mesh_names = [mesh.name for mesh in meshes]
         with ProgressReport(self.context.window_manager) as progress:
             progress.enter_substeps(len(meshes))
-            for mesh in meshes:
-                obj_path = os.path.join(self.mesh_dir, mesh.name + '.obj')
-                self.write_mesh(mesh, obj_path.replace("\\", "/"), exportLight, exportMaterialColor, progress)
-
-                mesh.select_set(True)
-                # export selected object
-                bpy.ops.wm.obj_export(
-                    filepath=os.path.join(self.workingDir, obj_path),
-                    export_selected_objects=True,
-                    forward_axis="Y",
-                    up_axis="Z",
-                    apply_modifiers=True
-                )
-                mesh.select_set(False)
+            for id_mesh, mesh in enumerate(meshes):
+                if not is_valid(mesh):
+                    # removed between two steps of a modal export
+                    self.verbose("WARN: %s was removed during the export, it is skipped" % mesh_names[id_mesh])
+                    progress.step()
+                    yield (id_mesh + 1) / len(meshes)
+                    continue
+                if self.memory is not None:
+                    self.object_triangles = 0
+                    self.memory.begin()
+                with self.profiler.object(mesh.name):
+                    self.export_object(mesh, exportLight, exportMaterialColor, progress)
+                if self.memory is not None:
+                    self.memory.end(mesh.name, self.object_triangles)
+                progress.step()
+                yield (id_mesh + 1) / len(meshes)
 
             progress.leave_substeps()
 
+        if self.export_meshes_dedup and self.mesh_backend == "NATIVE":
+            self.verbose("MESHES: %d objects share %d unique mesh files" % (len(meshes), len(self.shared_meshes)))
+
         ######################
         # 6) check if it has an environment map
+        self.profiler.step("6) environment")
         if bpy.data.worlds["World"].node_tree:
             if "Environment Texture" in bpy.data.worlds["World"].node_tree.nodes:
                 env_name = bpy.data.worlds["World"].node_tree.nodes["Environment Texture"]
                 # get basename, copy and add entry
                 env_source = os.path.realpath(bpy.path.abspath(env_name.image.filepath.strip()))
 
-                env_file = self.texture_dir + "/" + os.path.basename(env_source)
-                env_destination = self.workingDir + "/" + env_file
-
-                shutil.copy(env_source, env_destination)
-
-                # write data
-                strength = bpy.data.worlds["World"].node_tree.nodes["Background"].inputs[1].default_value * 50
-
-                env_element = self.__createElement("emitter", {"type" : "environment" })
-                env_element.appendChild(self.__createEntry("string", "filename", env_file))
-                env_element.appendChild(self.__createEntry("float", "rotate", "180"))
-                env_element.appendChild(self.__createEntry("color","radiance", f"{strength}, {strength}, {strength}"))
-
-                self.scene.appendChild(env_element)
-
-        ######################
+                try:
+                    env_file = self.textures.stage(env_source)
+                except OSError as e:
+                    # the scene is still usable without its environment
+                    self.verbose("WARN: Could not transfer environment map %s (%s), it is not exported" % (env_source, e))
+                    env_file = None
+
+                if env_file is not None:
+                    # write data
+                    strength = bpy.data.worlds["World"].node_tree.nodes["Background"].inputs[1].default_value * 50
+
+                    rotate = 180
+
+                    env_element = self.__createElement("emitter", {"type" : "environment" })
+                    env_element.appendChild(self.__createEntry("string", "filename", env_file))
+                    env_element.appendChild(self.__createEntry("float", "rotate", str(rotate)))
+                    env_element.appendChild(self.__createEntry("color","radiance", f"{strength}, {strength}, {strength}"))
+                    if self.export_env_importance:
+                        with self.profiler.timer("environment importance"):
+                            tables_file = self.write_env_importance(env_name.image, env_source, env_file, rotate)
+                        if tables_file is not None:
+                            env_element.appendChild(self.__createEntry("string", "importance", tables_file))
+                    if self.scene_report is not None:
+                        self.scene_report.texture(env_file, *env_name.image.size)
+                        self.scene_report.environment(env_file, strength)
+
+                    self.scene.appendChild(env_element)
+
+    def write_env_importance(self, image, env_source, env_file, rotate):
+        """write the importance sampling tables of the environment image next to
+        its copy, unless the ones of a previous export are still valid.
+        Returns the sidecar path to reference, None if the image has no pixels"""
+        tables_file = env_tables_path(env_file)
+        key = env_tables_key(source_stamp(env_source), rotate, self.env_mip_levels)
+        if self.env_tables.get(tables_file) == key:
+            return tables_file # already written for a previous frame
+        self.env_tables[tables_file] = key
+        stamp = {"key": key.hex()}
+        # the tables do not change with the strength, they are normalized
+        if read_tables_key(os.path.join(self.targetDir, tables_file)) == key:
+            self.verbose("ENVMAP: importance tables %s up to date" % tables_file)
+            if self.manifest is not None:
+                self.manifest.record("textures", tables_file, stamp, skipped=True)
+            return tables_file
+
+        width, height = image.size
+        if width == 0 or height == 0:
+            self.verbose("WARN: Environment image %s could not be loaded, no importance tables" % image.name)
+            return None
+        pixels = np.empty(width * height * image.channels, np.float32)
+        image.pixels.foreach_get(pixels)
+        path = os.path.join(self.workingDir, tables_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_env_tables(path, key, pixels, width, height, image.channels, self.env_mip_levels)
+        del pixels
+        self.profiler.add_file(tables_file, os.path.getsize(path))
+        if self.manifest is not None:
+            self.manifest.record("textures", tables_file, stamp)
+        self.verbose("ENVMAP: importance tables of %dx%d pixels written to %s" % (width, height, tables_file))
+        return tables_file
+
+    def estimate_texture_footprints(self, meshes):
+        """image name -> texture size (power of two) needed by the largest on
+        screen object using it, two texels per pixel of its screen extent"""
+        if self.camera_object is None:
+            self.verbose("WARN: Texture footprints need a camera, only the maximum size limits textures")
+            return {}
+        footprints = {}
+        for ob in meshes:
+            if ob.type == "EMPTY":
+                continue
+            ob_eval = ob.evaluated_get(self.depsgraph)
+            placements = self.instances.get(ob.original) if self.reference_instances else None
+            if placements is None:
+                placements = [ob_eval.matrix_world]
+            pixels = self.screen_coverage(placed_corners(ob_eval.bound_box, placements)).max()
+            size = 1 << max(int(math.ceil(math.log2(max(2.0 * math.sqrt(pixels), 1.0)))), 0)
+            for slot in ob_eval.material_slots:
+                if slot.material is None or slot.material.node_tree is None:
+                    continue
+                for node in slot.material.node_tree.nodes.values():
+                    if node.bl_idname == "ShaderNodeTexImage" and node.image is not None:
+                        footprints[node.image.name] = max(footprints.get(node.image.name, 0), size)
+        return footprints
+
+    def texture_size_limit(self, image):
+        """largest side of the processed image, 0 for no limit"""
+        limits = [size for size in (self.texture_max_size, self.texture_footprints.get(image.name, 0)) if size > 0]
+        return min(limits) if limits else 0
+
+    def cull(self, meshes):
+        """drop the objects, and the instances of referenced sources, that are
+        out of view of the exported cameras. Objects marked "Always export"
+        are kept"""
+        if self.camera_object is None:
+            self.verbose("WARN: Culling needs a camera, every object is exported")
+            return meshes
+        cullers = [FrustumCuller(cam, self.context.scene.render, self.culling_margin, self.culling_distance)
+                   for cam in self.exported_cameras()]
+        # with a camera batch, an object is kept if any view sees it
+        visible_boxes = lambda corners: np.logical_or.reduce([c.visible(corners) for c in cullers])
+        stats = self.culling_stats
+        kept = []
+        boxes, matrices, candidates = [], [], []
+        for ob in meshes:
+            matrices_of_instances = self.instances.get(ob.original)
+            if ob.nori_cull_exempt or ob.type == "EMPTY":
+                kept.append(ob)
+            elif matrices_of_instances is None:
+                ob_eval = ob.evaluated_get(self.depsgraph)
+                boxes.append(ob_eval.bound_box)
+                matrices.append(ob_eval.matrix_world)
+                candidates.append(ob)
+            elif not self.reference_instances:
+                # merged into one object with all its instances, the box of the source does not cover them
+                kept.append(ob)
+            else:
+                # each instance is tested on its own, the source is skipped if none is visible
+                ob_eval = ob.evaluated_get(self.depsgraph)
+                visible = visible_boxes(placed_corners(ob_eval.bound_box, matrices_of_instances))
+                nb_culled = len(visible) - int(visible.sum())
+                stats["instances"] += len(visible)
+                stats["culled_instances"] += nb_culled
+                if nb_culled:
+                    stats["triangles"] += nb_culled * triangle_count(ob_eval)
+                    self.instances[ob.original] = [m for m, v in zip(matrices_of_instances, visible) if v]
+                if nb_culled < len(visible):
+                    kept.append(ob)
+
+        # every regular object in one pass
+        stats["objects"] += len(candidates)
+        if candidates:
+            visible = visible_boxes(placed_corners(boxes, matrices))
+            for ob, v in zip(candidates, visible):
+                if v:
+                    kept.append(ob)
+                else:
+                    stats["culled_objects"] += 1
+                    stats["triangles"] += triangle_count(ob.evaluated_get(self.depsgraph))
+        # keep the scene order, the xml does not change when nothing is culled
+        kept = set(kept)
+        return [ob for ob in meshes if ob in kept]
+
+    def culling_summary(self):
+        stats = self.culling_stats
+        text = "%d of %d objects and %d of %d instances culled, %d triangles skipped" % (
+            stats["culled_objects"], stats["objects"], stats["culled_instances"], stats["instances"], stats["triangles"])
+        if self.mesh_stats["triangles"]:
+            # measured on the mesh files written by this export
+            saved = stats["triangles"] * self.mesh_stats["bytes"] / self.mesh_stats["triangles"]
+            text += " (~%.1f MB of mesh files)" % (saved / 1e6)
+        return text
+
+    def export_object(self, mesh, exportLight, exportMaterialColor, progress):
+        """export the geometry and the xml entries of one object"""
+        obj_path = os.path.join(self.mesh_dir, mesh.name + MESH_EXTENSIONS[self.mesh_format])
+        if self.export_animation and self.mesh_backend == "OPERATOR":
+            # the operator always writes world space geometry, keep one file per frame
+            obj_path = os.path.join(self.mesh_dir, "%s_%04d%s" % (mesh.name, self.context.scene.frame_current,
+                                                                  MESH_EXTENSIONS[self.mesh_format]))
+        self.write_mesh(mesh, obj_path.replace("\\", "/"), exportLight, exportMaterialColor, progress)
+
+        if self.mesh_backend == "OPERATOR":
+            with self.profiler.timer("export operator"):
+                self.write_mesh_operator(mesh, obj_path)
+            if self.manifest is not None:
+                # always rewritten, recorded so the next export does not remove it as stale
+                self.manifest.record("meshes", obj_path.replace("\\", "/"), "%s:operator" % self.mesh_format)
+
+    def write_mesh_operator(self, mesh, obj_path):
+        """write the geometry of the object (mesh) with Blender's export operators"""
+        mesh.select_set(True)
+        # export selected object
+        if self.mesh_format == "PLY":
+            bpy.ops.wm.ply_export(
+                filepath=os.path.join(self.workingDir, obj_path),
+                export_selected_objects=True,
+                forward_axis=self.mesh_forward_axis,
+                up_axis=self.mesh_up_axis,
+                apply_modifiers=True,
+                export_triangulated_mesh=self.export_triangular,
+                ascii_format=False
+            )
+        else:
+            bpy.ops.wm.obj_export(
+                filepath=os.path.join(self.workingDir, obj_path),
+                export_selected_objects=True,
+                forward_axis=self.mesh_forward_axis,
+                up_axis=self.mesh_up_axis,
+                apply_modifiers=True,
+                export_triangulated_mesh=self.export_triangular
+            )
+        mesh.select_set(False)
+
+    def write_settings(self, exportLight):
+        """integrator and sampler entries"""
+        if(not exportLight):
+            integrator = self.__createElement("integrator", {"type" : "normals" })
+        else:
+            integrator = self.__createElement("integrator", {"type" : "path_mis" })
 
-        ######################
-        # 6) write the xml file
-        ######################
-        self.doc.writexml(open(self.filepath, "w"), "", "\t","\n")
+        sampler = self.__createElement("sampler", {"type" : "independent" })
+        sampler.appendChild(self.__createElement("integer", {"name":"sampleCount", "value": str(bpy.context.scene.cycles.samples)}))
+        return [integrator, sampler]
+
+    def write_light(self, source):
+        """convert a light object into an emitter entry, None if its type is not supported"""
+        if(source.data.type == "POINT"):
+            pointLight = self.__createElement("emitter", {"type" : "pointlight" })
+            pos = source.location
+            pointLight.appendChild(self.__createEntry("point", "position", "%f,%f,%f"%(pos.x,pos.y,pos.z)))
+            power = source.data.energy
+            color = list(source.data.color).copy()
+            color[0] *=power
+            color[1] *=power
+            color[2] *=power
+            pointLight.appendChild(self.__createEntry("color", "radiance", "%f,%f,%f"%(color[0], color[1], color[2])))
+            return pointLight
+        self.verbose("WARN: Light source type (%s) is not supported" % source.data.type)
+        return None
 
     def write_camera(self, cam, thin_lens : bool = False):
         """convert the selected camera (cam) into xml format"""
@@ -288,8 +924,16 @@ class NoriWriter:
 
         # export thin-lens camera behaviour
         if thin_lens:
-            camera.appendChild(self.__createEntry("float","focalDist", str(bpy.data.cameras["Camera"].dof.focus_distance)))
-            camera.appendChild(self.__createEntry("float","fstop", str(1.0 / bpy.data.cameras["Camera"].dof.aperture_fstop)))
+            dof = cam.data.dof
+            focus_distance = dof.focus_distance
+            if getattr(dof, "focus_object", None) is not None:
+                # distance along the view axis, as Blender measures it
+                cam_matrix = np.asarray(cam.matrix_world, np.float64)
+                offset = np.asarray(dof.focus_object.matrix_world, np.float64)[:3, 3] - cam_matrix[:3, 3]
+                view_axis = -cam_matrix[:3, 2] / max(np.linalg.norm(cam_matrix[:3, 2]), 1e-12)
+                focus_distance = max(float(offset @ view_axis), 0.0)
+            camera.appendChild(self.__createEntry("float","focalDist", str(focus_distance)))
+            camera.appendChild(self.__createEntry("float","fstop", str(1.0 / dof.aperture_fstop)))
 
         return camera
 
@@ -297,22 +941,22 @@ class NoriWriter:
     # meshes related methods
     ######################
     def __createMeshEntry(self, filename, matrix):
-        meshElement = self.__createElement("mesh", {"type" : "obj"})
+        meshElement = self.__createElement("mesh", {"type" : self.mesh_format.lower()})
         meshElement.appendChild(self.__createElement("string", {"name":"filename","value":filename}))
-        if not self.export_meshes_world:
+        if matrix is not None:
             meshElement.appendChild(self.__createTransform(matrix))
         return meshElement
 
-    def __createBSDFEntry(self, slot, exportMaterialColor):
+    def __createBSDFEntry(self, material, exportMaterialColor):
         """method responsible to the auto-conversion
         between Blender internal BSDF (not Cycles!) and Nori BSDF
         """
 
-        node_tree = slot.material.node_tree
+        node_tree = material.node_tree
 
         if (node_tree is None):
-            c = slot.material.diffuse_color
-            bsdfElement = self.__createElement("bsdf", {"type":"diffuse", "name" : slot.material.name})
+            c = material.diffuse_color
+            bsdfElement = self.__createElement("bsdf", {"type":"diffuse", "name" : material.name})
             bsdfElement.appendChild(self.__createEntry("color", "albedo","%f,%f,%f" %(c[0],c[1],c[2])))
             return bsdfElement
         nodes = node_tree.nodes
@@ -325,18 +969,18 @@ class NoriWriter:
 
         if (glass and exportMaterialColor):
             ior = glass.inputs["IOR"].default_value
-            bsdfElement = self.__createElement("bsdf", {"type":"dielectric", "name" : slot.material.name}) # For compatibility reasons this is not called roughdielectric
+            bsdfElement = self.__createElement("bsdf", {"type":"dielectric", "name" : material.name}) # For compatibility reasons this is not called roughdielectric
             bsdfElement.appendChild(self.__createColorOrTexture("color", glass.inputs["Color"]))
             bsdfElement.appendChild(self.__createEntry("float", "IOR","%f" % ior))
             bsdfElement.appendChild(self.__createEntry("float", "roughness","%f" % glass.inputs["Roughness"].default_value))
         elif (glossy and exportMaterialColor):
             alpha = glossy.inputs["Roughness"].default_value
             # TODO: roughsubstrate is a specific microfacet model, allow changing material names
-            bsdfElement = self.__createElement("bsdf", {"type":"roughconductor", "name" : slot.material.name})
+            bsdfElement = self.__createElement("bsdf", {"type":"roughconductor", "name" : material.name})
             bsdfElement.appendChild(self.__createColorOrTexture("R0", glossy.inputs["Color"]))
             bsdfElement.appendChild(self.__createEntry("float", "alpha","%f" % alpha))
         elif (diffuse and exportMaterialColor):
-            bsdfElement = self.__createElement("bsdf", {"type":"diffuse", "name" : slot.material.name})
+            bsdfElement = self.__createElement("bsdf", {"type":"diffuse", "name" : material.name})
             bsdfElement.appendChild(self.__createColorOrTexture("albedo", diffuse.inputs["Color"]))
 
         elif (principled and exportMaterialColor):
@@ -346,7 +990,7 @@ class NoriWriter:
 
             if self.support_disney:
                 # TODO: Based on the properties modified, infer which bsdf should it use
-                bsdfElement = self.__createElement("bsdf", {"type":"disney", "name" : slot.material.name})
+                bsdfElement = self.__createElement("bsdf", {"type":"disney", "name" : material.name})
                 bsdfElement.appendChild(self.__createColorOrTexture("baseColor", principled.inputs["Base Color"]))
                 bsdfElement.appendChild(self.__createEntry("float", "metallic","%f" %(principled.inputs["Metallic"].default_value)))
                 bsdfElement.appendChild(self.__createEntry("float", "subsurface","%f" %(principled.inputs["Subsurface Weight"].default_value)))
@@ -360,19 +1004,192 @@ class NoriWriter:
                 bsdfElement.appendChild(self.__createEntry("float", "clearcoatGloss","%f" %(principled.inputs["Coat Roughness"].default_value)))
             else:
                 # TODO: Based on the properties modified, infer which bsdf should it use
-                bsdfElement = self.__createElement("bsdf", {"type":"roughsubstrate", "name" : slot.material.name})
+                bsdfElement = self.__createElement("bsdf", {"type":"roughsubstrate", "name" : material.name})
                 bsdfElement.appendChild(self.__createColorOrTexture("kd", principled.inputs["Base Color"]))
                 bsdfElement.appendChild(self.__createEntry("float", "alpha","%f" %(principled.inputs["Roughness"].default_value)))
 
         elif (specular and exportMaterialColor):
-            bsdfElement = self.__createElement("bsdf", {"type":"mirror", "name" : slot.material.name})
+            bsdfElement = self.__createElement("bsdf", {"type":"mirror", "name" : material.name})
         else:
-            c = slot.material.diffuse_color
-            bsdfElement = self.__createElement("bsdf", {"type":"diffuse", "name" : slot.material.name})
+            c = material.diffuse_color
+            bsdfElement = self.__createElement("bsdf", {"type":"diffuse", "name" : material.name})
             bsdfElement.appendChild(self.__createEntry("color", "albedo","%f,%f,%f" %(c[0],c[1],c[2])))
 
         return bsdfElement
 
+    def convert_material(self, material, exportMeshLights, exportMaterialColor):
+        """(bsdf, area emitter or None) entries of a material.
+        Each material is converted once per scene description, later slots
+        get a copy of the cached entries. The cache is keyed on the material
+        and the fingerprint of its node tree, an edited material is converted again"""
+        key = (material.name_full, material_fingerprint(material))
+        cached = self.material_cache.get(key)
+        if cached is not None:
+            self.material_stats["hits"] += 1
+            bsdfElement, areaLight = cached
+            return bsdfElement.cloneNode(True), areaLight and areaLight.cloneNode(True)
+        self.material_stats["misses"] += 1
+
+        # We create xml related entry
+        bsdfElement = self.__createBSDFEntry(material, exportMaterialColor)
+
+        # Check for emissive surfaces
+        node_tree = material.node_tree
+
+        areaLight = None
+        emission = node_tree.nodes.get("Emission") if node_tree is not None else None
+        if (emission and exportMeshLights):
+            strength = emission.inputs["Strength"].default_value
+            color = emission.inputs["Color"].default_value
+            vec = [0,0,0]
+            vec[0] = color[0] * strength
+            vec[1] = color[1] * strength 
+            vec[2] = color[2] * strength 
+
+            areaLight = self.__createElement("emitter", {"type" : "area" })
+            areaLight.appendChild(self.__createEntry("color", "radiance", "%f,%f,%f"%(vec[0],vec[1],vec[2])))
+
+        # the returned entries are added to the scene, the cache keeps them to copy them
+        self.material_cache[key] = (bsdfElement, areaLight)
+        return bsdfElement, areaLight
+
+    def write_mesh_file(self, mesh, mesh_path, local=False):
+        """write the geometry of the evaluated object (mesh) with the native writer,
+        in object space if local is set. Faces are split by material slot, returns
+        [(slot index, mesh file)] for the slots used by the mesh"""
+        matrix = axis_conversion(to_forward=self.mesh_forward_axis, to_up=self.mesh_up_axis).to_4x4()
+        if not (local or self.meshes_in_local_space()):
+            matrix = matrix @ mesh.matrix_world
+        with self.profiler.timer("extract mesh data"):
+            data = extract_mesh_data(mesh, matrix, self.export_triangular)
+        self.profiler.annotate(triangles=data.triangle_count, vertices=len(data.positions))
+        self.object_triangles += data.triangle_count
+        if self.lod_cache is not None and self.camera_object is not None:
+            with self.profiler.timer("level of detail"):
+                data = self.apply_lod(mesh, data)
+
+        # one file per material slot, so every face is only rendered with its own bsdf
+        with self.profiler.timer("split materials"):
+            parts = split_by_material(data, len(mesh.material_slots))
+        del data
+        stem, ext = os.path.splitext(mesh_path)
+        files = []
+        split = len(parts) > 1
+        while parts:
+            # the pipeline holds the only reference to a submitted part, it is freed once written
+            slot, part = parts.pop(0)
+            if split:
+                files.append((slot, self.write_mesh_data(mesh, part, "%s_m%d%s" % (stem, slot, ext), "_m%d" % slot)))
+            else:
+                files.append((slot, self.write_mesh_data(mesh, part, mesh_path, "")))
+            if self.scene_report is not None:
+                self.scene_report.mesh_file(files[-1][1], part, surface_area(part))
+            del part
+        self.profiler.annotate(files=[path for _, path in files])
+        return files
+
+    def apply_lod(self, mesh, data):
+        """decimate the geometry (data) of the evaluated object (mesh) to the
+        triangle budget of the screen area it covers. A referenced instance
+        source gets the budget of its largest instance on screen"""
+        placements = self.instances.get(mesh.original) if self.reference_instances else None
+        if placements is None:
+            placements = [mesh.matrix_world]
+        pixels = self.screen_coverage(placed_corners(mesh.bound_box, placements)).max()
+        target = lod_budget(pixels, self.lod_triangles_per_pixel, self.lod_min_triangles)
+        self.lod_stats["objects"] += 1
+        self.lod_stats["before"] += data.triangle_count
+        if data.triangle_count > target:
+            self.lod_stats["decimated"] += 1
+            data = self.lod_cache.decimate(data, target)
+            self.profiler.annotate(lod_triangles=data.triangle_count)
+        self.lod_stats["after"] += data.triangle_count
+        return data
+
+    def write_mesh_data(self, mesh, data, mesh_path, suffix):
+        """write one (sub)mesh of the object, suffix tells the submeshes
+        of an object apart, returns the path of the mesh file to reference"""
+        digest = None
+        by_content = self.export_meshes_dedup or self.shared_assets
+        if by_content or self.export_animation or self.manifest is not None:
+            with self.profiler.timer("mesh digest"):
+                digest = mesh_digest(data)
+
+        if by_content or self.export_animation:
+            # identical local geometry is written once: shared by all objects with
+            # export_meshes_dedup, by all the frames of an object with export_animation
+            name = mesh.name + suffix
+            key = digest if by_content else (name, digest)
+            if key in self.shared_meshes:
+                return self.shared_meshes[key]
+            ext = MESH_EXTENSIONS[self.mesh_format]
+            if self.shared_assets:
+                # named after the content only, the same geometry in other exports gets the same file
+                mesh_path = "%s/%s%s%s" % (self.mesh_dir, digest, "_opt" if self.optimize_meshes else "", ext)
+            elif by_content:
+                # named after its first user
+                mesh_path = "%s/%s%s_%s%s" % (self.mesh_dir, mesh.data.name, suffix, digest[:12], ext)
+            elif name in self.written_objects:
+                # the object deforms, this frame gets its own file
+                mesh_path = "%s/%s_%04d%s" % (self.mesh_dir, name, self.context.scene.frame_current, ext)
+            self.written_objects.add(name)
+            self.shared_meshes[key] = mesh_path
+
+        if self.shared_assets:
+            # named after its content, an existing file is this geometry
+            if os.path.exists(os.path.join(self.targetDir, mesh_path)):
+                self.shared_stats["existing"] += 1
+                return mesh_path
+            self.shared_stats["written"] += 1
+
+        # the digest covers the evaluated geometry (so modifiers)
+        stamp = None
+        manifest = self.manifest if not self.shared_assets else None
+        if manifest is not None:
+            stamp = "%s:%s" % (self.mesh_format, digest)
+            if self.optimize_meshes:
+                stamp += ":optimized"
+            if manifest.is_current("meshes", mesh_path, stamp):
+                manifest.record("meshes", mesh_path, stamp, skipped=True)
+                return mesh_path
+
+        self.mesh_stats["triangles"] += data.triangle_count
+        def written(result):
+            nbytes, elapsed = result
+            if self.optimize_meshes:
+                nbytes, unoptimized, stats = nbytes
+                self.report_optimization(mesh_path, stats, unoptimized, nbytes)
+            self.mesh_stats["bytes"] += nbytes
+            self.profiler.add_time("encode + write (workers)", elapsed)
+            self.profiler.add_file(mesh_path, nbytes)
+            if manifest is not None:
+                manifest.record("meshes", mesh_path, stamp)
+        filepath = os.path.join(self.workingDir, mesh_path)
+        write = MESH_WRITERS[self.mesh_format]
+        if self.optimize_meshes:
+            # welded and reordered by the worker, before encoding
+            write = functools.partial(optimize_and_write, self.mesh_format)
+        if self.shared_assets:
+            # other exports may read the folder while the file is written
+            self.pipeline.submit(timed_call, write_atomic, write, filepath, data, callback=written, nbytes=data.nbytes)
+        else:
+            self.pipeline.submit(timed_call, write, filepath, data, callback=written, nbytes=data.nbytes)
+        return mesh_path
+
+    def report_optimization(self, mesh_path, stats, unoptimized, nbytes):
+        """log the attribute pools and the size of a mesh file before and after optimize_mesh"""
+        before = sum(b for b, _ in stats.values())
+        after = sum(a for _, a in stats.values())
+        for name, (b, a) in stats.items():
+            self.optimize_stats[name][0] += b
+            self.optimize_stats[name][1] += a
+        self.optimize_stats["bytes"][0] += unoptimized
+        self.optimize_stats["bytes"][1] += nbytes
+        self.verbose("OPTIMIZE: %s %s, %d attributes -> %d (-%.1f%%), %d bytes -> %d (-%.1f%%)" % (
+            mesh_path, ", ".join("%s %d -> %d" % (name, b, a) for name, (b, a) in stats.items() if b),
+            before, after, 100.0 * (before - after) / max(before, 1),
+            unoptimized, nbytes, 100.0 * (unoptimized - nbytes) / max(unoptimized, 1)))
+
     def write_mesh(self,mesh, mesh_path, exportMeshLights, exportMaterialColor, progress):
         if mesh.type in SUPPORTED_OBJECT_TYPES and mesh.type != "EMPTY":
             for meshEntry in self.write_mesh_info(mesh, mesh_path, exportMeshLights, exportMaterialColor, progress):
@@ -380,64 +1197,86 @@ class NoriWriter:
 
     def write_mesh_info(self, mesh, mesh_path, exportMeshLights, exportMaterialColor, progress):
 
-        # We check if the object has any other instances, and if so create a temporary joined object.
-        mesh, created_instance_ob = join_instances(self.context, mesh)
-        mesh = mesh.evaluated_get(self.depsgraph) #this gives us the evaluated version of the object. 
+        # We check if the object is the source of instances: either reference its mesh
+        # once per instance, or create a temporary joined object.
+        instance_matrices = self.instances.get(mesh.original)
+        if instance_matrices is not None and not self.reference_instances:
+            with self.profiler.timer("join_instances"):
+                joined = join_instances(self.context, mesh, instance_matrices)
+            try:
+                return self.write_mesh_info(joined, mesh_path, exportMeshLights, exportMaterialColor, progress)
+            finally:
+                # free the temporary object and its mesh as soon as its entries are written
+                joined_mesh = joined.data
+                bpy.data.objects.remove(joined, do_unlink=True)
+                bpy.data.meshes.remove(joined_mesh)
+        with self.profiler.timer("evaluate"):
+            mesh = mesh.evaluated_get(self.depsgraph) #this gives us the evaluated version of the object. 
         #Aka with all modifiers and deformations applied.
 
-        haveMaterial = (len(mesh.material_slots) != 0 and mesh.material_slots[0].name != '')
+        # empty slots get the default BSDF, only objects without any material skip the conversion
+        haveMaterial = any(slot.material is not None for slot in mesh.material_slots)
 
         # write_file export by default meshes in world coordinates, we transform back to local coordinate.
         world_to_local = mesh.matrix_world.copy().inverted_safe()
 
+        # (slot index, mesh file) of every slot used by the faces. The native writer
+        # splits the faces per slot, the operator writes all of them in one file.
+        if self.mesh_backend == "NATIVE":
+            mesh_files = self.write_mesh_file(mesh, mesh_path, local=instance_matrices is not None)
+        else:
+            mesh_files = [(id_mat, mesh_path) for id_mat in range(max(1, len(mesh.material_slots)))]
+        if instance_matrices is not None:
+            placements = instance_matrices
+        elif self.meshes_in_local_space():
+            placements = [mesh.matrix_world]
+        else:
+            placements = [None]
+
         # if added_uv:
         #     mesh.data.uv_layers.remove(mesh.data.uv_layers['DefaultUvMap'])
         #     dg = bpy.context.evaluated_depsgraph_get()
         #     mesh = mesh.evaluated_get(dg)
         # write all polygones (faces)
-        listMeshXML = []
+        # (mesh file, bsdf, emitter) entries of every slot, cloned for every placement
+        slotEntries = []
         if(not haveMaterial):
-            # add default BSDF
-            meshElement = self.__createMeshEntry(mesh_path, mesh.matrix_world)
-            bsdfElement = self.__createElement("bsdf", {"type":"diffuse"})
-            bsdfElement.appendChild(self.__createEntry("color", "albedo", "0.75,0.75,0.75"))
-            meshElement.appendChild(bsdfElement)
-            listMeshXML = [meshElement]
+            # add default BSDF to every file (the faces may still be split by slot)
+            for slot_path in dict.fromkeys(path for _, path in mesh_files):
+                bsdfElement = self.__createElement("bsdf", {"type":"diffuse"})
+                bsdfElement.appendChild(self.__createEntry("color", "albedo", "0.75,0.75,0.75"))
+                slotEntries.append((slot_path, bsdfElement, None))
         else:
-            for id_mat in range(len(mesh.material_slots)):
+            for id_mat, slot_path in mesh_files:
                 slot = mesh.material_slots[id_mat]
                 self.verbose("MESH: "+mesh.name+" BSDF: "+slot.name)
 
-                # We create xml related entry
-                meshElement = self.__createMeshEntry(mesh_path, mesh.matrix_world)
-                meshElement.appendChild(self.__createBSDFEntry(slot, exportMaterialColor))
+                if slot.material is None:
+                    # empty slot, its faces get the default BSDF
+                    bsdfElement = self.__createElement("bsdf", {"type":"diffuse"})
+                    bsdfElement.appendChild(self.__createEntry("color", "albedo", "0.75,0.75,0.75"))
+                    slotEntries.append((slot_path, bsdfElement, None))
+                    continue
 
-                # Check for emissive surfaces
-                node_tree = slot.material.node_tree
+                with self.profiler.timer("bsdf"):
+                    bsdfElement, areaLight = self.convert_material(slot.material, exportMeshLights, exportMaterialColor)
+                slotEntries.append((slot_path, bsdfElement, areaLight))
 
-                if (node_tree is None):
-                    continue
-                nodes = node_tree.nodes
-                emission = nodes.get("Emission")
-                
-                if (emission and exportMeshLights):
-                    strength = emission.inputs["Strength"].default_value
-                    color = emission.inputs["Color"].default_value
-                    vec = [0,0,0]
-                    vec[0] = color[0] * strength
-                    vec[1] = color[1] * strength 
-                    vec[2] = color[2] * strength 
-
-                    areaLight = self.__createElement("emitter", {"type" : "area" })
-                    areaLight.appendChild(self.__createEntry("color", "radiance", "%f,%f,%f"%(vec[0],vec[1],vec[2])))
+        listMeshXML = []
+        for id_place, matrix in enumerate(placements):
+            for slot_path, bsdfElement, areaLight in slotEntries:
+                meshElement = self.__createMeshEntry(slot_path, matrix)
+                if id_place > 0:
+                    bsdfElement = bsdfElement.cloneNode(True)
+                    areaLight = areaLight and areaLight.cloneNode(True)
+                meshElement.appendChild(bsdfElement)
+                if areaLight:
                     meshElement.appendChild(areaLight)
-
                 listMeshXML.append(meshElement)
 
-        # free the memory
-        # bpy.data.meshes.remove(mesh.data)
-        if (created_instance_ob):
-            bpy.data.objects.remove(mesh, do_unlink=True)
-
+        if self.scene_report is not None:
+            # the operator writes the files itself, only the triangle count is known
+            triangles = triangle_count(mesh) if self.mesh_backend != "NATIVE" else None
+            self.scene_report.object(mesh.name, slotEntries, placements, triangles)
 
         return listMeshXML
@@ -0,0 +1,73 @@
+import sys, multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# -----------------------------------------------------------------------------
+# Mesh encoding pipeline
+#
+# bpy data can only be read from the main thread, so the exporter extracts
+# array snapshots there and hands the encoding and file writing to a pool of
+# workers. At most max_in_flight snapshots, and optionally max_bytes of
+# snapshot arrays, are queued at a time: when a limit is reached the main
+# thread waits for the oldest job. Callbacks run
+# on the main thread in submission order, so the result does not depend on
+# the number of workers.
+
+class MeshPipeline:
+    def __init__(self, workers=0, mode="THREAD", max_in_flight=None, log=print, max_bytes=0):
+        self.executor = None
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.max_in_flight = max_in_flight or 2 * max(1, workers)
+        self.max_bytes = max_bytes # 0: no limit
+        if workers <= 1:
+            return # encode inline on the main thread
+        if mode == "PROCESS":
+            if sys.platform.startswith("linux"):
+                # forked workers inherit the loaded add-on modules, spawned ones could not import bpy.
+                # Forking a process running threads is only dependable on Linux (system frameworks
+                # abort or deadlock in the child on macOS): the workers are started right away,
+                # before the exporter starts its own texture threads.
+                self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+                self.executor.submit(int).result()
+                return
+            log("WARN: Process workers are only supported on Linux, using threads instead")
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="nori_mesh")
+
+    def submit(self, func, *args, callback=None, nbytes=0):
+        """Run func(*args) on a worker, callback(result) is called on the main
+        thread. nbytes is the memory held by the arguments until the job ends"""
+        if self.executor is None:
+            result = func(*args)
+            if callback is not None:
+                callback(result)
+            return
+        while len(self.pending) >= self.max_in_flight or \
+                (self.pending and self.max_bytes and self.pending_bytes + nbytes > self.max_bytes):
+            self.__collect_oldest()
+        self.pending.append((self.executor.submit(func, *args), callback, nbytes))
+        self.pending_bytes += nbytes
+
+    def __collect_oldest(self):
+        future, callback, nbytes = self.pending.popleft()
+        self.pending_bytes -= nbytes
+        result = future.result()
+        if callback is not None:
+            callback(result)
+
+    def drain(self):
+        """Wait for every queued job, the workers stay up for the next ones"""
+        while self.pending:
+            self.__collect_oldest()
+
+    def finish(self):
+        """Wait for every queued job and stop the workers, raises the first worker error"""
+        self.drain()
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.pending.clear()
+        self.pending_bytes = 0
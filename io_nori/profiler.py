@@ -0,0 +1,179 @@
+import os, sys, time, json, tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# -----------------------------------------------------------------------------
+# Export profiler
+#
+# Records the wall time and the peak Python/NumPy memory (tracemalloc) of
+# every export step and of every exported object, the accumulated time of
+# the main sub-steps and the bytes written per file. Steps are sequential:
+# starting a step ends the previous one. When the profiler is disabled every
+# call is a no-op.
+
+def timed_call(func, *args):
+    """Call func(*args), returns (result, elapsed seconds). Used to time work done on workers"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def profile_path(xml_filepath):
+    return os.path.splitext(xml_filepath)[0] + ".profile.json"
+
+def max_rss():
+    """Peak resident memory of the whole process in bytes, if available"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def _mb(value):
+    return "%.1f MB" % (value / (1 << 20)) if value is not None else "n/a"
+
+class ExportProfiler:
+    def __init__(self, enabled=False, track_memory=True):
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.steps = {}     # name -> {"calls", "time", "peak_memory"}
+        self.timers = {}    # name -> {"calls", "time"}
+        self.objects = []   # one record per exported object
+        self.files = {}     # path -> bytes written
+        self.total_time = 0.0
+        self._stack = []
+        self._step = None
+        self._objects = []
+        self._started_tracing = False
+        self._start = time.perf_counter()
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    # spans keep their own peak even when nested spans reset the tracemalloc peak
+    def __enter_span(self):
+        span = {"start": time.perf_counter(), "peak": 0, "base": 0}
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent["peak"] = max(parent["peak"], peak - parent["base"])
+            tracemalloc.reset_peak()
+            span["base"] = current
+        self._stack.append(span)
+
+    def __exit_span(self):
+        span = self._stack.pop()
+        elapsed = time.perf_counter() - span["start"]
+        if self.track_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            span["peak"] = max(span["peak"], peak - span["base"])
+            if self._stack:
+                parent = self._stack[-1]
+                parent["peak"] = max(parent["peak"], peak - parent["base"])
+        return elapsed, (span["peak"] if self.track_memory else None)
+
+    def step(self, name):
+        """End the current step and start the next one (None only ends it)"""
+        if not self.enabled:
+            return
+        if self._step is not None:
+            elapsed, peak = self.__exit_span()
+            record = self.steps.setdefault(self._step, {"calls": 0, "time": 0.0, "peak_memory": None})
+            record["calls"] += 1
+            record["time"] += elapsed
+            if peak is not None:
+                record["peak_memory"] = max(record["peak_memory"] or 0, peak)
+        self._step = name
+        if name is not None:
+            self.__enter_span()
+
+    @contextmanager
+    def object(self, name):
+        """Time one exported object, extra fields can be set with annotate"""
+        if not self.enabled:
+            yield
+            return
+        record = {"name": name}
+        self._objects.append(record)
+        self.__enter_span()
+        try:
+            yield
+        finally:
+            record["time"], record["peak_memory"] = self.__exit_span()
+            self._objects.pop()
+            self.objects.append(record)
+
+    def annotate(self, **fields):
+        """Add fields to the record of the object being exported"""
+        if self._objects:
+            self._objects[-1].update(fields)
+
+    @contextmanager
+    def timer(self, name):
+        """Accumulate the wall time of a sub-step"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, elapsed):
+        if not self.enabled:
+            return
+        record = self.timers.setdefault(name, {"calls": 0, "time": 0.0})
+        record["calls"] += 1
+        record["time"] += elapsed
+
+    def add_file(self, path, nbytes):
+        if self.enabled and nbytes is not None:
+            self.files[path] = nbytes
+
+    def finish(self):
+        self.step(None)
+        self.total_time = time.perf_counter() - self._start
+        self.stop_tracing()
+
+    def stop_tracing(self):
+        """stop tracemalloc if start() started it"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def to_dict(self):
+        return {
+            "total_time": self.total_time,
+            "max_rss": max_rss(),
+            "steps": self.steps,
+            "timers": self.timers,
+            "objects": self.objects,
+            "files": self.files,
+            "bytes_written": sum(self.files.values()),
+        }
+
+    def write_json(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def summary(self, top=10):
+        lines = ["PROFILE: total %.3fs, process peak memory %s, %d files, %s written" %
+                 (self.total_time, _mb(max_rss()), len(self.files), _mb(sum(self.files.values())))]
+        for name, record in self.steps.items():
+            share = 100.0 * record["time"] / self.total_time if self.total_time > 0 else 0.0
+            lines.append("  %-24s %8.3fs %5.1f%%  peak %s" % (name, record["time"], share, _mb(record["peak_memory"])))
+        for name, record in self.timers.items():
+            lines.append("  - %-22s %8.3fs  (%d calls)" % (name, record["time"], record["calls"]))
+        slowest = sorted(self.objects, key=lambda r: r["time"], reverse=True)[:top]
+        if slowest:
+            lines.append("  slowest objects:")
+        for record in slowest:
+            lines.append("    %-30s %8.3fs  peak %s" % (record["name"], record["time"], _mb(record["peak_memory"])))
+        return "\n".join(lines)
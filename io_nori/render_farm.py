@@ -0,0 +1,286 @@
+"""Render farm jobs of an exported Nori scene
+
+    python render_farm.py split scene.xml --jobs 16 [--by tiles|samples]
+    python render_farm.py run scene.jobs.json [--renderer "nori"] [--parallel 4]
+    python render_farm.py merge scene.jobs.json --output scene.pfm
+    python render_farm.py stub job.xml
+
+split writes N job descriptions next to the scene, sharing its mesh and
+texture files, and a job manifest (scene.jobs.json). A job either renders
+a crop window of the image (tiles, camera entries cropOffsetX, cropOffsetY,
+cropWidth and cropHeight) or a slice of the samples with its own seed
+(samples, sampler entries sampleCount and seed).
+
+run renders every job as a subprocess, "renderer job.xml", in the folder of
+the manifest. Without --renderer, the built-in stub renderer is used: it
+writes a deterministic test image (stub command) so the whole chain can be
+tried locally. merge reassembles the tiles, or averages the sample slices
+weighted by their sample count, into the final image.
+
+A job output is the job xml with another extension. .pfm and .npy images
+are read with NumPy, other formats (like the .exr written by Nori) need
+the imageio package. Runs without Blender.
+"""
+import os, sys, json, shlex, hashlib, argparse, subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    from .atomic import AtomicFile
+except ImportError: # run as a script
+    from atomic import AtomicFile
+
+JOBS_VERSION = 1
+OUTPUT_EXTENSIONS = (".pfm", ".npy", ".exr", ".png", ".hdr")
+
+def jobs_path(xml_filepath):
+    """scene.xml -> scene.jobs.json"""
+    return os.path.splitext(xml_filepath)[0] + ".jobs.json"
+
+def read_jobs(manifest_filepath):
+    """jobs of a manifest, [] when there is none"""
+    try:
+        with open(manifest_filepath) as f:
+            return json.load(f)["jobs"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+def remove_stale_jobs(manifest_filepath, previous):
+    """remove the xml and outputs of the previous jobs that the manifest no longer lists"""
+    directory = os.path.dirname(os.path.abspath(manifest_filepath))
+    current = {job["xml"] for job in read_jobs(manifest_filepath)}
+    for job in previous:
+        if job["xml"] in current:
+            continue # unchanged job, its output is still valid
+        for filename in [job["xml"]] + [job["output"] + ext for ext in OUTPUT_EXTENSIONS]:
+            if os.path.exists(os.path.join(directory, filename)):
+                os.remove(os.path.join(directory, filename))
+
+######################
+# scene entries
+######################
+def _entry(parent, tag, name):
+    for child in parent.findall(tag):
+        if child.get("name") == name:
+            return child
+    return None
+
+def _set_entry(parent, tag, name, value):
+    entry = _entry(parent, tag, name)
+    if entry is None:
+        entry = ET.SubElement(parent, tag, {"name": name})
+    entry.set("value", str(value))
+
+def _grid(count):
+    # rows x columns = count, as square as possible
+    rows = max(d for d in range(1, int(count ** 0.5) + 1) if count % d == 0)
+    return rows, count // rows
+
+def _split_range(total, parts):
+    # [(start, size)] of parts nearly equal slices of total
+    sizes = [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+    return [(sum(sizes[:i]), size) for i, size in enumerate(sizes)]
+
+######################
+# split
+######################
+def split_scene(xml_filepath, count, split="TILES", seed=0):
+    """Write count job descriptions of the scene and their manifest, returns the manifest path"""
+    tree = ET.parse(xml_filepath)
+    root = tree.getroot()
+    camera = root.find("camera")
+    sampler = root.find("sampler")
+    if camera is None or sampler is None:
+        raise ValueError("%s has no camera or no sampler" % xml_filepath)
+    width = int(_entry(camera, "integer", "width").get("value"))
+    height = int(_entry(camera, "integer", "height").get("value"))
+    samples = int(_entry(sampler, "integer", "sampleCount").get("value"))
+    split = split.upper()
+    if split == "SAMPLES":
+        count = min(count, samples)
+    else:
+        count = min(count, width * height)
+
+    directory = os.path.dirname(os.path.abspath(xml_filepath))
+    stem = os.path.splitext(os.path.basename(xml_filepath))[0]
+    jobs = []
+    if split == "SAMPLES":
+        for i, (_, nb_samples) in enumerate(_split_range(samples, count)):
+            jobs.append({"samples": nb_samples, "seed": seed + i})
+    elif split == "TILES":
+        rows, columns = _grid(count)
+        for y, tile_height in _split_range(height, rows):
+            for x, tile_width in _split_range(width, columns):
+                jobs.append({"crop": [x, y, tile_width, tile_height]})
+    else:
+        raise ValueError("unknown split %s" % split)
+
+    ET.indent(tree, "\t")
+    for i, job in enumerate(jobs):
+        if "crop" in job:
+            for key, value in zip(("cropOffsetX", "cropOffsetY", "cropWidth", "cropHeight"), job["crop"]):
+                _set_entry(camera, "integer", key, value)
+        else:
+            _set_entry(sampler, "integer", "sampleCount", job["samples"])
+            _set_entry(sampler, "integer", "seed", job["seed"])
+        ET.indent(camera if "crop" in job else sampler, "\t", level=1)
+        text = '<?xml version="1.0" ?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+        # named after their content, an output is never mistaken for the one of another scene or split
+        name = "%s.job_%03d_%s" % (stem, i, hashlib.blake2b(text.encode("utf-8"), digest_size=4).hexdigest())
+        job.update(id=i, xml=name + ".xml", output=name)
+        with AtomicFile(os.path.join(directory, job["xml"])) as f:
+            f.write(text)
+
+    manifest = {"version": JOBS_VERSION, "scene": os.path.basename(xml_filepath), "split": split,
+                "width": width, "height": height, "samples": samples, "jobs": jobs}
+    path = jobs_path(xml_filepath)
+    previous = read_jobs(path)
+    with AtomicFile(path) as f:
+        json.dump(manifest, f, indent=1)
+    remove_stale_jobs(path, previous)
+    return path
+
+######################
+# images
+######################
+def write_pfm(filepath, image):
+    """(H, W, C >= 3) float image, top row first, as a color pfm"""
+    image = np.ascontiguousarray(image[::-1, :, :3], "<f4") # pfm rows go bottom to top
+    with open(filepath, "wb") as f:
+        f.write(b"PF\n%d %d\n-1.0\n" % (image.shape[1], image.shape[0]))
+        f.write(image.tobytes())
+
+def read_pfm(filepath):
+    with open(filepath, "rb") as f:
+        kind = f.readline().strip()
+        width, height = map(int, f.readline().split())
+        scale = float(f.readline())
+        channels = 3 if kind == b"PF" else 1
+        data = np.frombuffer(f.read(), "<f4" if scale < 0 else ">f4", width * height * channels)
+    return data.reshape(height, width, channels)[::-1].astype(np.float32)
+
+def read_image(filepath):
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".pfm":
+        return read_pfm(filepath)
+    if ext == ".npy":
+        return np.load(filepath).astype(np.float32)
+    try:
+        import imageio.v3 as iio
+    except ImportError:
+        raise RuntimeError("reading %s images needs the imageio package" % ext)
+    return np.asarray(iio.imread(filepath), np.float32)
+
+def job_output(directory, job):
+    """path of the image rendered for a job, None if there is none yet"""
+    for ext in OUTPUT_EXTENSIONS:
+        path = os.path.join(directory, job["output"] + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+######################
+# merge
+######################
+def merge_jobs(manifest_filepath):
+    """Final (H, W, C) image of the rendered jobs of a manifest"""
+    with open(manifest_filepath) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(os.path.abspath(manifest_filepath))
+    missing = [job["xml"] for job in manifest["jobs"] if job_output(directory, job) is None]
+    if missing:
+        raise RuntimeError("%d jobs have no output: %s" % (len(missing), ", ".join(missing)))
+
+    result = None
+    for job in manifest["jobs"]:
+        image = read_image(job_output(directory, job))
+        if result is None:
+            result = np.zeros((manifest["height"], manifest["width"], image.shape[2]), np.float64)
+        if manifest["split"] == "TILES":
+            x, y, width, height = job["crop"]
+            if image.shape[:2] == (manifest["height"], manifest["width"]):
+                image = image[y:y + height, x:x + width] # full frame output, only the crop was rendered
+            result[y:y + height, x:x + width] = image
+        else:
+            # each slice is a mean over its samples
+            result += image * (job["samples"] / manifest["samples"])
+    return result.astype(np.float32)
+
+######################
+# local run
+######################
+def stub_render(xml_filepath):
+    """Stand-in renderer: a gradient plus noise that decreases with the
+    sample count, rendered only inside the crop window"""
+    root = ET.parse(xml_filepath).getroot()
+    camera, sampler = root.find("camera"), root.find("sampler")
+    value = lambda parent, name, default: int(_entry(parent, "integer", name).get("value")) \
+        if _entry(parent, "integer", name) is not None else default
+    width, height = value(camera, "width", 0), value(camera, "height", 0)
+    x, y = value(camera, "cropOffsetX", 0), value(camera, "cropOffsetY", 0)
+    crop_width, crop_height = value(camera, "cropWidth", width), value(camera, "cropHeight", height)
+    samples, seed = value(sampler, "sampleCount", 1), value(sampler, "seed", 0)
+
+    ys, xs = np.mgrid[y:y + crop_height, x:x + crop_width]
+    image = np.stack(((xs + 0.5) / width, (ys + 0.5) / height, np.full(xs.shape, 0.5)), axis=-1)
+    noise = np.random.default_rng(seed).standard_normal(image.shape) * 0.1 / np.sqrt(samples)
+    write_pfm(os.path.splitext(xml_filepath)[0] + ".pfm", image + noise)
+
+def run_jobs(manifest_filepath, renderer=None, parallel=1, log=print):
+    """Render every job without an output as a subprocess, returns the failed jobs"""
+    with open(manifest_filepath) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(os.path.abspath(manifest_filepath))
+    command = shlex.split(renderer) if renderer else [sys.executable, os.path.abspath(__file__), "stub"]
+    todo = [job for job in manifest["jobs"] if job_output(directory, job) is None]
+
+    def render(job):
+        process = subprocess.run(command + [job["xml"]], cwd=directory, capture_output=True, text=True)
+        log("job %d (%s): %s" % (job["id"], job["xml"], "done" if process.returncode == 0 else
+                                 "failed, exit code %d\n%s" % (process.returncode, process.stderr)))
+        return process.returncode == 0
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        results = list(pool.map(render, todo))
+    return [job for job, ok in zip(todo, results) if not ok]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    split = commands.add_parser("split", help="write the jobs of a scene")
+    split.add_argument("scene")
+    split.add_argument("--jobs", type=int, required=True)
+    split.add_argument("--by", choices=("tiles", "samples"), default="tiles")
+    split.add_argument("--seed", type=int, default=0)
+    run = commands.add_parser("run", help="render the jobs of a manifest locally")
+    run.add_argument("manifest")
+    run.add_argument("--renderer", help="command rendering a job xml, the stub renderer by default")
+    run.add_argument("--parallel", type=int, default=os.cpu_count() or 1)
+    merge = commands.add_parser("merge", help="assemble the outputs of the jobs")
+    merge.add_argument("manifest")
+    merge.add_argument("--output", required=True, help=".pfm or .npy image")
+    stub = commands.add_parser("stub", help="stand-in renderer writing job.pfm")
+    stub.add_argument("xml")
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        print("Jobs written, manifest " + split_scene(args.scene, args.jobs, args.by, args.seed))
+    elif args.command == "run":
+        failed = run_jobs(args.manifest, args.renderer, args.parallel)
+        if failed:
+            print("%d jobs failed" % len(failed))
+            return 1
+    elif args.command == "merge":
+        image = merge_jobs(args.manifest)
+        if args.output.endswith(".npy"):
+            np.save(args.output, image)
+        else:
+            write_pfm(args.output, image)
+        print("Merged image written to " + args.output)
+    elif args.command == "stub":
+        stub_render(args.xml)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
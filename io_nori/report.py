@@ -0,0 +1,187 @@
+import os, math, json
+from collections import Counter
+
+from .atomic import AtomicFile
+from .envmap import LUMINANCE
+
+# -----------------------------------------------------------------------------
+# Render cost report
+#
+# Built from what the exporter already walks while writing a scene
+# description: the geometry of every mesh file, the entries (bsdf, area
+# emitter, placements) of every object, the staged textures and the
+# emitters. Memory is an estimate of what the renderer allocates: per
+# vertex a position, a normal and a uv (32 bytes), per triangle its indices
+# and a share of the BVH (44 bytes), per texel an RGB float color (12
+# bytes, mip levels included). Instances are separate meshes in Nori, each
+# placement counts. Emitted power is luminance based: 4 pi I for point
+# lights, pi A L for diffuse area emitters. The objects and textures above
+# DOMINANT_SHARE of the total are flagged, and so is a scene over the
+# triangle or memory budget.
+
+REPORT_VERSION = 1
+BYTES_PER_VERTEX = 32
+BYTES_PER_TRIANGLE = 44
+BYTES_PER_TEXEL = 12
+DOMINANT_SHARE = 0.1
+
+def report_path(xml_filepath):
+    """scene.xml -> scene.report.json"""
+    return os.path.splitext(xml_filepath)[0] + ".report.json"
+
+def luminance(rgb):
+    return sum(w * c for w, c in zip(LUMINANCE, rgb))
+
+def _children(element, tag):
+    return [node for node in element.childNodes if getattr(node, "tagName", None) == tag]
+
+def _entry(element, name):
+    """value of the named child entry of a xml element, None if missing"""
+    for node in element.childNodes:
+        if getattr(node, "tagName", None) is not None and node.getAttribute("name") == name:
+            return node.getAttribute("value")
+    return None
+
+def _color(value):
+    return [float(c) for c in value.split(",")] if value else [0.0, 0.0, 0.0]
+
+def _texture_files(element):
+    # filenames of the textures anywhere below a bsdf entry
+    files = [_entry(node, "filename") for node in _children(element, "texture")]
+    for node in element.childNodes:
+        if getattr(node, "tagName", None) not in (None, "texture"):
+            files += _texture_files(node)
+    return [f for f in files if f]
+
+def _mb(nbytes):
+    return nbytes / (1 << 20)
+
+class SceneReport:
+    def __init__(self):
+        self.mesh_files = {}    # mesh file -> {"triangles", "vertices", "area"}, kept for the whole export
+        self.textures = {}      # texture file -> {"width", "height", "mip_levels", "memory"}
+        self.reset()
+
+    def reset(self):
+        """start the report of another scene description (mesh files and textures are kept)"""
+        self.objects = []
+        self.emitters = []
+        self.bsdfs = Counter()
+        self.used_textures = Counter()
+
+    def mesh_file(self, path, data, area):
+        if path not in self.mesh_files:
+            vertices = max(len(pool) for pool in (data.positions, data.normals, data.uvs) if pool is not None)
+            self.mesh_files[path] = {"triangles": data.triangle_count, "vertices": vertices, "area": area}
+
+    def texture(self, texture_file, width, height, mip_levels=0):
+        texels = sum(max(width >> level, 1) * max(height >> level, 1) for level in range(mip_levels + 1))
+        self.textures[texture_file] = {"width": width, "height": height, "mip_levels": mip_levels,
+                                       "memory": texels * BYTES_PER_TEXEL}
+
+    def object(self, name, slots, placements, triangles=None):
+        """slots: [(mesh file, bsdf entry, area emitter entry or None)],
+        placements: [4x4 matrix or None (geometry in world space)]"""
+        triangles_per_copy = vertices = area = 0
+        for path, bsdf, emitter in slots:
+            stats = self.mesh_files.get(path, {"triangles": 0, "vertices": 0, "area": 0.0})
+            triangles_per_copy += stats["triangles"]
+            vertices += stats["vertices"]
+            self.bsdfs[bsdf.getAttribute("type")] += len(placements)
+            for texture_file in set(_texture_files(bsdf)):
+                self.used_textures[texture_file] += 1
+            if emitter is not None:
+                radiance = _color(_entry(emitter, "radiance"))
+                emitter_area = sum(stats["area"] * self.__area_scale(m) for m in placements)
+                self.emitters.append({"type": "area", "name": name, "mesh": path, "area": emitter_area,
+                                      "radiance": radiance, "power": math.pi * emitter_area * luminance(radiance)})
+        if triangles is not None and not triangles_per_copy:
+            triangles_per_copy = triangles # geometry written by the export operator, not measured
+        self.objects.append({"name": name, "placements": len(placements), "triangles_per_copy": triangles_per_copy,
+                             "triangles": triangles_per_copy * len(placements), "vertices": vertices * len(placements),
+                             "memory": (triangles_per_copy * BYTES_PER_TRIANGLE + vertices * BYTES_PER_VERTEX) * len(placements),
+                             "files": [path for path, _, _ in slots]})
+
+    @staticmethod
+    def __area_scale(matrix):
+        if matrix is None:
+            return 1.0
+        m = [[matrix[i][j] for j in range(3)] for i in range(3)]
+        det = m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1]) - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0]) \
+            + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0])
+        return abs(det) ** (2.0 / 3.0) # exact for uniform scales
+
+    def point_light(self, name, element):
+        intensity = _color(_entry(element, "radiance"))
+        self.emitters.append({"type": "point", "name": name, "intensity": intensity,
+                              "power": 4.0 * math.pi * luminance(intensity)})
+
+    def environment(self, texture_file, radiance_scale):
+        """radiance_scale multiplies the pixels of the map, its power depends on the scene size and is not summed"""
+        self.used_textures[texture_file] += 1
+        self.emitters.append({"type": "environment", "name": texture_file, "radiance_scale": radiance_scale})
+
+    def to_dict(self, max_triangles=0, max_memory_mb=0):
+        triangles = sum(o["triangles"] for o in self.objects)
+        geometry = sum(o["memory"] for o in self.objects)
+        textures = [dict(file=f, users=n, **self.textures[f]) for f, n in self.used_textures.items() if f in self.textures]
+        texture_memory = sum(t["memory"] for t in textures)
+        objects = sorted(self.objects, key=lambda o: o["triangles"], reverse=True)
+        textures.sort(key=lambda t: t["memory"], reverse=True)
+
+        flags = []
+        for o in objects:
+            if triangles and o["triangles"] >= DOMINANT_SHARE * triangles:
+                o["flag"] = "%.0f%% of the triangles" % (100.0 * o["triangles"] / triangles)
+                flags.append("object %s: %s" % (o["name"], o["flag"]))
+        for t in textures:
+            if texture_memory and t["memory"] >= DOMINANT_SHARE * texture_memory:
+                t["flag"] = "%.0f%% of the texture memory" % (100.0 * t["memory"] / texture_memory)
+                flags.append("texture %s: %s" % (t["file"], t["flag"]))
+        over_budget = []
+        if max_triangles and triangles > max_triangles:
+            over_budget.append("%d triangles, budget %d" % (triangles, max_triangles))
+        if max_memory_mb and _mb(geometry + texture_memory) > max_memory_mb:
+            over_budget.append("%.1f MB, budget %d MB" % (_mb(geometry + texture_memory), max_memory_mb))
+
+        emitters = Counter(e["type"] for e in self.emitters)
+        return {
+            "version": REPORT_VERSION,
+            "totals": {
+                "objects": len(self.objects),
+                "triangles": triangles,
+                "vertices": sum(o["vertices"] for o in self.objects),
+                "geometry_memory": geometry,
+                "texture_memory": texture_memory,
+                "textures": len(textures),
+                "emitters": dict(emitters),
+                "emitted_power": {kind: sum(e["power"] for e in self.emitters if e["type"] == kind)
+                                  for kind in ("point", "area") if emitters[kind]},
+            },
+            "bsdfs": dict(self.bsdfs.most_common()),
+            "over_budget": over_budget,
+            "flags": flags,
+            "objects": objects,
+            "textures": textures,
+            "emitters": self.emitters,
+        }
+
+    def write_json(self, filepath, report):
+        with AtomicFile(filepath) as f:
+            json.dump(report, f, indent=1)
+
+    @staticmethod
+    def summary(report):
+        totals = report["totals"]
+        lines = ["REPORT: %d objects, %d triangles, %d vertices, ~%.1f MB of geometry and ~%.1f MB of %d textures" % (
+            totals["objects"], totals["triangles"], totals["vertices"], _mb(totals["geometry_memory"]),
+            _mb(totals["texture_memory"]), totals["textures"])]
+        if totals["emitters"]:
+            lines.append("REPORT: emitters %s, power %s" % (
+                ", ".join("%d %s" % (n, kind) for kind, n in totals["emitters"].items()),
+                ", ".join("%s %.1f" % (kind, p) for kind, p in totals["emitted_power"].items()) or "n/a"))
+        if report["bsdfs"]:
+            lines.append("REPORT: bsdfs " + ", ".join("%s %d" % item for item in report["bsdfs"].items()))
+        lines += ["REPORT: " + flag for flag in report["flags"]]
+        lines += ["WARN: Over the scene budget, " + text for text in report["over_budget"]]
+        return lines
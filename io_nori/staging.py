@@ -0,0 +1,35 @@
+import os, shutil
+
+# -----------------------------------------------------------------------------
+# Staged output
+#
+# An export writes everything (xml, meshes, textures, reports) into a hidden
+# staging folder next to the xml. Only when the export succeeded are the
+# files moved to their final place, with one atomic rename per file and the
+# xml files last. A failed or cancelled export leaves the previous output
+# untouched, and a reader of the xml never sees a half-written mesh.
+
+def staging_path(xml_filepath):
+    """scene.xml -> .scene.staging, in the same folder (renames stay on one file system)"""
+    directory, name = os.path.split(xml_filepath)
+    return os.path.join(directory, ".%s.staging" % os.path.splitext(name)[0])
+
+def create_staging(staging_dir):
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir) # left over by an interrupted export
+    os.makedirs(staging_dir)
+
+def commit_staging(staging_dir, target_dir):
+    """Move every staged file to the same relative path in target_dir, returns the number of files"""
+    files = []
+    for root, _, names in os.walk(staging_dir):
+        for name in names:
+            files.append(os.path.relpath(os.path.join(root, name), staging_dir))
+    # the scene descriptions go last, once everything they reference is in place
+    files.sort(key=lambda path: (os.path.dirname(path) == "" and path.endswith(".xml"), path))
+    for relpath in files:
+        destination = os.path.join(target_dir, relpath)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(os.path.join(staging_dir, relpath), destination)
+    shutil.rmtree(staging_dir)
+    return len(files)
@@ -0,0 +1,124 @@
+import os, json, zlib, struct, hashlib
+import numpy as np
+
+from .atomic import AtomicFile
+
+# -----------------------------------------------------------------------------
+# Texture processing
+#
+# Instead of being copied verbatim, 8-bit textures can be converted to PNG,
+# halved until they fit a maximum resolution (global, or estimated from the
+# screen footprint of the objects using them) and written with a chain of
+# pre-filtered mip levels (<name>_mip1.png, <name>_mip2.png, ...). The main
+# thread only reads the pixels out of Blender, resizing and encoding run on
+# the texture workers. Outputs are cached next to the xml, keyed by the
+# content hash of the source and the settings.
+
+PROCESS_VERSION = 1
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def texture_cache_path(xml_filepath):
+    """scene.xml -> scene.texture_cache folder"""
+    return os.path.splitext(xml_filepath)[0] + ".texture_cache"
+
+def process_key(content_hash, max_size, mip_levels):
+    text = json.dumps([PROCESS_VERSION, content_hash, max_size, mip_levels])
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+def processed_size(width, height, max_size):
+    """size once halved until it fits max_size (0: no limit)"""
+    while max_size > 0 and max(width, height) > max_size and min(width, height) > 1:
+        width, height = (width + 1) // 2, (height + 1) // 2
+    return width, height
+
+def mip_count(width, height, mip_levels):
+    """mip levels below the base level, down to 1 pixel"""
+    return min(mip_levels, int(np.log2(max(min(width, height), 1))))
+
+def _halve(image):
+    # 2x2 box filter, odd sizes repeat their last row or column
+    if image.shape[0] % 2:
+        image = np.concatenate((image, image[-1:]), axis=0)
+    if image.shape[1] % 2:
+        image = np.concatenate((image, image[:, -1:]), axis=1)
+    h, w = image.shape[0] // 2, image.shape[1] // 2
+    return image.reshape(h, 2, w, 2, image.shape[2]).mean(axis=(1, 3), dtype=np.float32)
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+def write_png(filepath, pixels, level=6):
+    """Write (H, W, C) uint8 pixels, top row first, as an 8-bit PNG"""
+    height, width, channels = pixels.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    rows = pixels.reshape(height, width * channels)
+    # "Up" filter on every row, vectorized
+    filtered = np.empty((height, width * channels + 1), np.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+    data = PNG_SIGNATURE
+    data += _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+    data += _png_chunk(b"IDAT", zlib.compress(filtered.tobytes(), level))
+    data += _png_chunk(b"IEND", b"")
+    with AtomicFile(filepath, "wb") as f:
+        f.write(data)
+
+def process_texture(pixels, width, height, channels, max_size, outputs):
+    """Resize the pixels of a Blender image (flat float32 array, bottom row
+    first) to max_size and write the base level then one mip level per
+    extra path of outputs"""
+    os.makedirs(os.path.dirname(outputs[0]), exist_ok=True)
+    image = pixels.reshape(height, width, channels)[::-1]
+    while max_size > 0 and max(image.shape[:2]) > max_size and min(image.shape[:2]) > 1:
+        image = _halve(image)
+    if channels == 4 and np.all(image[..., 3] >= 1.0):
+        image = image[..., :3] # opaque, the alpha channel is not written
+    for id_level, path in enumerate(outputs):
+        if id_level > 0:
+            image = _halve(image)
+        write_png(path, np.clip(np.rint(image * 255.0), 0, 255).astype(np.uint8))
+
+class TextureCache:
+    """Processed textures in directory, and the content hash of every source
+    (recomputed only when its size or mtime change)"""
+
+    def __init__(self, directory, prune=True):
+        self.directory = directory
+        self.prune = prune # False for a cache shared with other exports
+        self.index_path = os.path.join(directory, "index.json")
+        self.hashes = {}
+        self.used = set()
+        try:
+            with open(self.index_path) as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def content_hash(self, source, stamp):
+        entry = self.hashes.get(source)
+        if entry is None or entry["stamp"] != stamp:
+            h = hashlib.blake2b(digest_size=16)
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            entry = self.hashes[source] = {"stamp": stamp, "hash": h.hexdigest()}
+        return entry["hash"]
+
+    def files(self, key, nb_mips):
+        """cache paths of the base level and the mip levels"""
+        self.used.add(key)
+        return [os.path.join(self.directory, "%s%s.png" % (key, "_mip%d" % i if i else "")) for i in range(nb_mips + 1)]
+
+    def finish(self):
+        """drop the outputs this export did not use and save the index"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory) if self.prune else []:
+            if name.endswith(".png") and name.split("_")[0].split(".")[0] not in self.used:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        with AtomicFile(self.index_path) as f:
+            json.dump(self.hashes, f, indent=1, sort_keys=True)
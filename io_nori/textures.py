@@ -0,0 +1,208 @@
+import os, shutil, hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .manifest import source_stamp
+from .atomic import write_atomic
+from .texture_processing import process_key, processed_size, mip_count, process_texture
+
+# -----------------------------------------------------------------------------
+# Texture staging
+#
+# Every texture referenced by the scene goes through TextureStager.stage,
+# which returns its path relative to the xml right away and schedules the
+# transfer on a thread pool, so copies overlap with the mesh export. Each
+# source is transferred at most once per export. stage_processed converts
+# the texture instead (see texture_processing.py). With by_content, files
+# are named after the content of the source and never rewritten, so
+# exports sharing a folder share them.
+
+FICLONE = 0x40049409 # linux ioctl, clones a file on copy-on-write filesystems
+
+def _reflink(source, destination):
+    import fcntl
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, destination)
+
+def _file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def transfer_file(source, destination, mode="REFLINK"):
+    """Place a copy of source at destination, returns how it was done
+
+    mode "HARDLINK" tries a hard link then a reflink, "REFLINK" only a reflink,
+    "COPY" always copies. Every mode falls back to a plain copy."""
+    return write_atomic(_place, destination, source, mode)
+
+def _place(tmp_path, source, mode):
+    if mode == "HARDLINK":
+        try:
+            os.link(source, tmp_path)
+            return "linked"
+        except OSError:
+            pass
+    if mode in ("HARDLINK", "REFLINK"):
+        try:
+            _reflink(source, tmp_path)
+            return "linked"
+        except (OSError, ImportError):
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+    # copy2 keeps the mtime, so the destination can be checked against the source later
+    shutil.copy2(source, tmp_path)
+    return "copied"
+
+class TextureStager:
+    def __init__(self, working_dir, texture_dir, manifest=None, mode="REFLINK", workers=4, verify_hash=False, target_dir=None,
+                 cache=None, by_content=False):
+        self.working_dir = working_dir
+        self.target_dir = target_dir or working_dir # where up to date copies are looked for (working_dir may be a staging folder)
+        self.texture_dir = texture_dir
+        self.manifest = manifest
+        self.mode = mode
+        self.verify_hash = verify_hash
+        self.cache = cache # TextureCache of the processed textures
+        self.by_content = by_content
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="nori_texture")
+        self.staged = {}    # source path (or processing request) -> texture file (relative to the xml)
+        self.names = {}     # texture file -> source path, to detect basename collisions
+        self.jobs = []      # (texture files, stamp, future or None when skipped)
+        self.files = []     # (texture file, bytes) of the transferred textures
+        self.stats = {"references": 0, "copied": 0, "linked": 0, "processed": 0, "cached": 0, "skipped": 0, "failed": 0}
+
+    def __texture_file(self, source, name=None, digest=None):
+        name = name or os.path.basename(source)
+        if digest is not None:
+            # unique for its content, no collision to resolve
+            stem, ext = os.path.splitext(name)
+            return "%s/%s_%s%s" % (self.texture_dir, stem, digest[:16], ext)
+        texture_file = self.texture_dir + "/" + name
+        if self.names.get(texture_file, source) != source:
+            # another directory already provides a texture with this name
+            stem, ext = os.path.splitext(name)
+            suffix = hashlib.blake2b(os.path.dirname(source).encode("utf-8"), digest_size=4).hexdigest()
+            texture_file = "%s/%s_%s%s" % (self.texture_dir, stem, suffix, ext)
+        self.names[texture_file] = source
+        return texture_file
+
+    def __content_hash(self, source, stamp):
+        if self.cache is not None:
+            return self.cache.content_hash(source, stamp)
+        return _file_hash(source)
+
+    def __exists(self, texture_file):
+        return os.path.exists(os.path.join(self.target_dir, texture_file))
+
+    def __is_current(self, source, texture_file, stamp):
+        if self.manifest is not None and self.manifest.is_current("textures", texture_file, stamp):
+            return True
+        try:
+            st = os.stat(os.path.join(self.target_dir, texture_file))
+        except OSError:
+            return False
+        if st.st_size != stamp["size"]:
+            return False
+        if st.st_mtime_ns == stamp["mtime"]:
+            return True
+        return self.verify_hash and _file_hash(source) == _file_hash(os.path.join(self.target_dir, texture_file))
+
+    def stage(self, source):
+        """Schedule the transfer of source into the texture folder (once per
+        export), returns the texture path to write in the xml"""
+        self.stats["references"] += 1
+        if source in self.staged:
+            return self.staged[source]
+
+        stamp = source_stamp(source) # raises if the source is missing
+        if self.by_content:
+            texture_file = self.__texture_file(source, digest=self.__content_hash(source, stamp))
+        else:
+            texture_file = self.__texture_file(source)
+        self.staged[source] = texture_file
+        if (self.by_content and self.__exists(texture_file)) or self.__is_current(source, texture_file, stamp):
+            self.jobs.append(((texture_file,), stamp, None))
+        else:
+            destination = os.path.join(self.working_dir, texture_file)
+            self.jobs.append(((texture_file,), stamp, self.pool.submit(transfer_file, source, destination, self.mode)))
+        return texture_file
+
+    def stage_processed(self, image, source, max_size=0, mip_levels=0):
+        """Schedule the conversion of image, the Blender image of source, to a
+        PNG of at most max_size pixels (0: any size) with mip_levels levels.
+        Returns the texture path of the base level and the number of mip levels"""
+        self.stats["references"] += 1
+        request = (source, max_size, mip_levels)
+        if request in self.staged:
+            return self.staged[request]
+
+        stamp = source_stamp(source) # raises if the source is missing
+        width, height = image.size
+        nb_mips = mip_count(*processed_size(width, height, max_size), mip_levels)
+        key = process_key(self.cache.content_hash(source, stamp), max_size, nb_mips)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        texture_file = self.__texture_file(source, "%s_%dpx.png" % (stem, max_size) if max_size else stem + ".png",
+                                           digest=key if self.by_content else None)
+        base = os.path.splitext(texture_file)[0]
+        texture_files = tuple([texture_file] + ["%s_mip%d.png" % (base, i) for i in range(1, nb_mips + 1)])
+        self.staged[request] = (texture_file, nb_mips)
+
+        cache_files = self.cache.files(key, nb_mips)
+        stamp = {"key": key}
+        if self.by_content and all(self.__exists(f) for f in texture_files):
+            self.jobs.append((texture_files, stamp, None))
+        elif self.manifest is not None and all(self.manifest.is_current("textures", f, stamp) for f in texture_files):
+            self.jobs.append((texture_files, stamp, None))
+        elif all(os.path.exists(f) for f in cache_files):
+            self.jobs.append((texture_files, stamp, self.pool.submit(self.__place, cache_files, texture_files, "cached")))
+        else:
+            if width == 0 or height == 0:
+                raise OSError("could not load " + image.name)
+            # Blender data is only read on the main thread
+            pixels = np.empty(width * height * image.channels, np.float32)
+            image.pixels.foreach_get(pixels)
+            self.jobs.append((texture_files, stamp, self.pool.submit(self.__process, pixels, width, height, image.channels,
+                                                                     max_size, cache_files, texture_files)))
+        return texture_file, nb_mips
+
+    def __process(self, pixels, width, height, channels, max_size, cache_files, texture_files):
+        process_texture(pixels, width, height, channels, max_size, cache_files)
+        del pixels
+        return self.__place(cache_files, texture_files, "processed")
+
+    def __place(self, cache_files, texture_files, method):
+        for cache_file, texture_file in zip(cache_files, texture_files):
+            transfer_file(cache_file, os.path.join(self.working_dir, texture_file), self.mode)
+        return method
+
+    def wait(self, log=print):
+        """Wait for all the transfers, record them in the manifest and stop the pool"""
+        self.pool.shutdown(wait=True)
+        self.collect(log)
+
+    def collect(self, log=print):
+        """Wait for the scheduled transfers and record them in the manifest, the pool stays up"""
+        for texture_files, stamp, future in self.jobs:
+            if future is None:
+                self.stats["skipped"] += 1
+            else:
+                try:
+                    self.stats[future.result()] += 1
+                except (OSError, ValueError) as e:
+                    self.stats["failed"] += 1
+                    log("WARN: Could not copy texture %s: %s" % (texture_files[0], e))
+                    continue
+                for texture_file in texture_files:
+                    self.files.append((texture_file, os.path.getsize(os.path.join(self.working_dir, texture_file))))
+            if self.manifest is not None:
+                for texture_file in texture_files:
+                    self.manifest.record("textures", texture_file, stamp, skipped=future is None)
+        self.jobs = []
+
+    def summary(self):
+        return "%(references)d references, %(copied)d copied, %(linked)d linked, %(processed)d processed, " \
+               "%(cached)d from cache, %(skipped)d up to date, %(failed)d failed" % self.stats
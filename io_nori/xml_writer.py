@@ -0,0 +1,128 @@
+from .atomic import AtomicFile
+
+# -----------------------------------------------------------------------------
+# Streaming XML backend
+#
+# Drop-in replacement for the subset of xml.dom.minidom used by NoriWriter.
+# Children of the document root are serialized to the output stream as soon
+# as they are appended, so only one top level entry (a mesh with its bsdf,
+# an emitter, ...) lives in memory at a time. The output mirrors
+# Document.writexml(writer, "", "\t", "\n") byte for byte. A document
+# opened on a path is written under a temporary name and only replaces the
+# file when closed, discard() drops it and keeps the previous one.
+
+def _escape(data):
+    # Same escaping as xml.dom.minidom._write_data
+    return data.replace("&", "&amp;").replace("<", "&lt;"). \
+                replace("\"", "&quot;").replace(">", "&gt;")
+
+class Element:
+    """Lightweight element node, only keeps its attributes and children"""
+    __slots__ = ("tagName", "attributes", "childNodes")
+
+    def __init__(self, tagName):
+        self.tagName = tagName
+        self.attributes = {}
+        self.childNodes = []
+
+    def setAttribute(self, name, value):
+        self.attributes[name] = value
+
+    def getAttribute(self, name):
+        return self.attributes.get(name, "")
+
+    def appendChild(self, node):
+        self.childNodes.append(node)
+        return node
+
+    def cloneNode(self, deep):
+        clone = Element(self.tagName)
+        clone.attributes = dict(self.attributes)
+        if deep:
+            clone.childNodes = [c.cloneNode(True) for c in self.childNodes]
+        return clone
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        writer.write(indent + "<" + self.tagName)
+        for k, v in self.attributes.items():
+            writer.write(" %s=\"" % k)
+            if v:
+                writer.write(_escape(v))
+            writer.write("\"")
+        if self.childNodes:
+            writer.write(">" + newl)
+            for node in self.childNodes:
+                node.writexml(writer, indent + addindent, addindent, newl)
+            writer.write("%s</%s>%s" % (indent, self.tagName, newl))
+        else:
+            writer.write("/>%s" % newl)
+
+class StreamingRoot(Element):
+    """Document root whose children are flushed to the stream on append"""
+    __slots__ = ("_doc", "_opened")
+
+    def __init__(self, doc, tagName):
+        super().__init__(tagName)
+        self._doc = doc
+        self._opened = False
+
+    def appendChild(self, node):
+        doc = self._doc
+        if not self._opened:
+            # opening tag is delayed so that an empty scene gives <scene/>
+            doc.stream.write("<" + self.tagName)
+            for k, v in self.attributes.items():
+                doc.stream.write(" %s=\"%s\"" % (k, _escape(v)))
+            doc.stream.write(">" + doc.newl)
+            self._opened = True
+        node.writexml(doc.stream, doc.addindent, doc.addindent, doc.newl)
+        return node
+
+    def close(self):
+        doc = self._doc
+        if self._opened:
+            doc.stream.write("</%s>%s" % (self.tagName, doc.newl))
+        else:
+            Element.writexml(self, doc.stream, "", doc.addindent, doc.newl)
+
+class StreamingDocument:
+    """Writes the xml declaration and the root element to a buffered stream"""
+
+    def __init__(self, stream, addindent="\t", newl="\n"):
+        self.stream = stream
+        self.addindent = addindent
+        self.newl = newl
+        self.root = None
+        self.target = None # AtomicFile of a document opened on a path
+
+    @classmethod
+    def open(cls, filepath, buffer_size=1 << 20, **kwargs):
+        doc = cls(None, **kwargs)
+        doc.target = AtomicFile(filepath, "w", buffering=buffer_size)
+        doc.stream = doc.target.file
+        return doc
+
+    def createElement(self, tagName):
+        return Element(tagName)
+
+    def appendChild(self, node):
+        """Set the document root, use the returned node to add children"""
+        self.stream.write('<?xml version="1.0" ?>' + self.newl)
+        self.root = StreamingRoot(self, node.tagName)
+        self.root.attributes = node.attributes
+        return self.root
+
+    def close(self):
+        if self.root is not None:
+            self.root.close()
+        if self.target is not None:
+            self.target.commit()
+        else:
+            self.stream.close()
+
+    def discard(self):
+        """stop writing, a document opened on a path leaves the file as it was"""
+        if self.target is not None:
+            self.target.discard()
+        else:
+            self.stream.close()
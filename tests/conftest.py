@@ -0,0 +1,5 @@
+import os, sys
+
+# io_nori imports Blender modules, the tests use the stand-ins of the benchmarks
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(REPO_DIR, "benchmarks", "stubs"), os.path.join(REPO_DIR, "benchmarks"), REPO_DIR]
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from io_nori.atomic import AtomicFile, write_atomic
+
+def test_commit_replaces_the_file(tmp_path):
+    path = tmp_path / "scene.json"
+    path.write_text("old")
+    with AtomicFile(str(path)) as f:
+        f.write("new")
+        assert path.read_text() == "old" # readers see the previous file meanwhile
+    assert path.read_text() == "new"
+    assert os.listdir(tmp_path) == ["scene.json"]
+
+def test_failure_keeps_the_previous_file(tmp_path):
+    path = tmp_path / "scene.json"
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with AtomicFile(str(path)) as f:
+            f.write("partial")
+            raise RuntimeError("export failed")
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["scene.json"]
+
+def test_write_atomic(tmp_path):
+    def write(path, text):
+        with open(path, "w") as f:
+            return f.write(text)
+    assert write_atomic(write, str(tmp_path / "a.txt"), "abc") == 3
+    assert (tmp_path / "a.txt").read_text() == "abc"
+    assert os.listdir(tmp_path) == ["a.txt"]
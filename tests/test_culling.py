@@ -0,0 +1,67 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import stub_scene
+from mathutils import Matrix
+from io_nori.culling import FrustumCuller, placed_corners
+
+from test_nori_writer import export, referenced_files
+
+UNIT_BOX = [(x, y, z) for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)]
+RENDER = SimpleNamespace(resolution_x=200, resolution_y=100, pixel_aspect_x=1.0, pixel_aspect_y=1.0)
+
+def camera(kind="PERSP", clip_end=100.0):
+    # at the origin, looking down -Z: 90 degrees wide, the height is half the width
+    data = SimpleNamespace(type=kind, angle=math.pi / 2, ortho_scale=4.0, sensor_fit="AUTO", clip_end=clip_end)
+    return SimpleNamespace(matrix_world=np.eye(4), data=data)
+
+def visible(culler, *centers):
+    matrices = [np.array([[1, 0, 0, x], [0, 1, 0, y], [0, 0, 1, z], [0, 0, 0, 1]]) for x, y, z in centers]
+    return culler.visible(placed_corners(UNIT_BOX, matrices)).tolist()
+
+def test_placed_corners():
+    matrix = np.array([[0, -1, 0, 1], [1, 0, 0, 2], [0, 0, 2, 3], [0, 0, 0, 1]])
+    corners = placed_corners([UNIT_BOX, UNIT_BOX], [np.eye(4), matrix])
+    assert corners.shape == (2, 8, 3)
+    np.testing.assert_allclose(corners[0], UNIT_BOX)
+    np.testing.assert_allclose(corners[1], np.array(UNIT_BOX) @ matrix[:3, :3].T + matrix[:3, 3])
+
+def test_perspective_view():
+    culler = FrustumCuller(camera(), RENDER, margin=0.0)
+    # in front, behind, left and right, above (the view is half as high), beyond the clip end
+    assert visible(culler, (0, 0, -10), (0, 0, 10), (-12, 0, -10), (12, 0, -10), (0, 6, -10), (0, 0, -101)) == \
+        [True, False, False, False, False, False]
+    # boxes crossing a plane of the view are kept
+    assert visible(culler, (10.4, 0, -10), (0, 5.4, -10), (0, 0, 0.4), (0, 0, -100.4)) == [True] * 4
+
+def test_margin_and_distance():
+    box = (12.5, 0, -10) # x >= 12, the view ends at x = depth <= 10.5
+    assert visible(FrustumCuller(camera(), RENDER, margin=0.1), box) == [False]
+    assert visible(FrustumCuller(camera(), RENDER, margin=0.2), box) == [True]
+    culler = FrustumCuller(camera(), RENDER, margin=0.0, far_distance=20.0)
+    assert visible(culler, (0, 0, -19), (0, 0, -21)) == [True, False]
+
+def test_orthographic_view():
+    culler = FrustumCuller(camera("ORTHO"), RENDER, margin=0.0)
+    # 4 x 2 units wide at any depth
+    assert visible(culler, (0, 0, -50), (1.6, 0, -50), (2.6, 0, -50), (0, 1.4, -50), (0, 1.6, -1)) == \
+        [True, True, False, True, False]
+
+@pytest.mark.parametrize("exempt", [False, True])
+def test_export_skips_the_objects_out_of_view(tmp_path, exempt):
+    # the camera is at y = -10 looking along +y
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=4, triangles=200, textures=0)
+    behind = context.scene.objects[3]
+    behind.matrix_world = Matrix([[1, 0, 0, 0], [0, 1, 0, -30], [0, 0, 1, 0], [0, 0, 0, 1]])
+    behind.nori_cull_exempt = exempt
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_culling=True)
+
+    files = referenced_files(tmp_path / "scene.xml")
+    assert any(f.startswith("meshes/Object.00001") for f in files) == exempt
+    assert sum(f.startswith("meshes/Object.") for f in files) == (8 if exempt else 6)
+    summary = next(text for text in logs if text.startswith("CULLING: "))
+    assert summary.startswith("CULLING: %d of %d objects" % ((0, 3) if exempt else (1, 4)))
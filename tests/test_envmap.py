@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from io_nori import envmap
+from io_nori.envmap import write_env_tables, read_tables_key, env_tables_key, LUMINANCE
+
+KEY = env_tables_key({"source": "sky.exr", "size": 1, "mtime": 0}, 180, 2)
+
+def read_tables(filepath):
+    """(key, width, height, marginal, conditional, mip levels) of a sidecar"""
+    with open(filepath, "rb") as f:
+        content = f.read()
+    assert content[:8] == envmap.TABLES_MAGIC
+    width, height, nb_mips = np.frombuffer(content, "<u4", 3, 24)
+    offset = 36
+    marginal = np.frombuffer(content, "<f4", height + 1, offset)
+    offset += 4 * (height + 1)
+    conditional = np.frombuffer(content, "<f4", height * (width + 1), offset).reshape(height, width + 1)
+    offset += conditional.nbytes
+    mips = []
+    for _ in range(nb_mips):
+        w, h = np.frombuffer(content, "<u4", 2, offset)
+        mips.append(np.frombuffer(content, "<f4", w * h, offset + 8).reshape(h, w))
+        offset += 8 + mips[-1].nbytes
+    assert offset == len(content)
+    return content[8:24], width, height, marginal, conditional, mips
+
+def image(width, height, channels=4):
+    # Blender's pixel order: bottom row first
+    rng = np.random.default_rng(0)
+    return rng.random((height, width, channels), dtype=np.float32)
+
+def test_tables_follow_the_luminance(tmp_path):
+    pixels = np.zeros((6, 8, 4), np.float32)
+    pixels[4, 5, :3] = 10.0 # second row from the top
+    write_env_tables(str(tmp_path / "sky.envcdf"), KEY, pixels.ravel(), 8, 6, 4)
+    key, width, height, marginal, conditional, mips = read_tables(tmp_path / "sky.envcdf")
+    assert (key, width, height, mips) == (KEY, 8, 6, [])
+    assert read_tables_key(str(tmp_path / "sky.envcdf")) == KEY
+
+    # all the energy is in one row and one column
+    np.testing.assert_allclose(np.diff(marginal), [0, 1, 0, 0, 0, 0], atol=1e-6)
+    np.testing.assert_allclose(np.diff(conditional[1]), np.eye(8)[5], atol=1e-6)
+    # black rows sample their columns uniformly
+    np.testing.assert_allclose(conditional[0], np.linspace(0, 1, 9), atol=1e-6)
+
+def test_rows_are_weighted_by_their_solid_angle(tmp_path):
+    # a uniform grey sky: rows near the poles are less likely
+    height = 16
+    pixels = np.full((height, 4, 3), 0.5, np.float32)
+    write_env_tables(str(tmp_path / "sky.envcdf"), KEY, pixels.ravel(), 4, height, 3)
+    _, _, _, marginal, conditional, _ = read_tables(tmp_path / "sky.envcdf")
+    sin_theta = np.sin(np.pi * (np.arange(height) + 0.5) / height)
+    np.testing.assert_allclose(np.diff(marginal), sin_theta / sin_theta.sum(), atol=1e-6)
+    np.testing.assert_allclose(conditional, np.tile(np.linspace(0, 1, 5), (height, 1)), atol=1e-6)
+
+def test_black_image_is_uniform(tmp_path):
+    write_env_tables(str(tmp_path / "sky.envcdf"), KEY, np.zeros(4 * 4 * 4, np.float32), 4, 4, 4)
+    _, _, _, marginal, conditional, _ = read_tables(tmp_path / "sky.envcdf")
+    np.testing.assert_allclose(marginal, np.linspace(0, 1, 5), atol=1e-6)
+    np.testing.assert_allclose(conditional, np.tile(np.linspace(0, 1, 5), (4, 1)), atol=1e-6)
+
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_chunks_and_mip_levels(tmp_path, monkeypatch, channels):
+    width, height = 16, 12
+    pixels = image(width, height, channels)
+    write_env_tables(str(tmp_path / "whole.envcdf"), KEY, pixels.ravel(), width, height, channels, mip_levels=5)
+    monkeypatch.setattr(envmap, "ROWS_PER_CHUNK", 2)
+    write_env_tables(str(tmp_path / "chunked.envcdf"), KEY, pixels.ravel(), width, height, channels, mip_levels=5)
+    assert (tmp_path / "whole.envcdf").read_bytes() == (tmp_path / "chunked.envcdf").read_bytes()
+
+    _, _, _, marginal, conditional, mips = read_tables(tmp_path / "whole.envcdf")
+    assert np.all(np.diff(marginal) >= 0) and marginal[0] == 0 and marginal[-1] == pytest.approx(1)
+    assert np.all(np.diff(conditional, axis=1) >= 0)
+    np.testing.assert_allclose(conditional[:, -1], 1, atol=1e-6)
+    # levels down to a single row, each a 2x2 average of the previous one
+    assert [level.shape for level in mips] == [(6, 8), (3, 4), (1, 2)]
+    top_first = pixels[::-1]
+    luminance = top_first[..., :3] @ np.array(LUMINANCE, np.float32) if channels >= 3 else top_first[..., 0]
+    np.testing.assert_allclose(mips[0], luminance.reshape(6, 2, 8, 2).mean(axis=(1, 3)), rtol=1e-5)
+    np.testing.assert_allclose(mips[1], mips[0].reshape(3, 2, 4, 2).mean(axis=(1, 3)), rtol=1e-5)
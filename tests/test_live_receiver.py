@@ -0,0 +1,83 @@
+import os, json, glob
+import xml.etree.ElementTree as ET
+
+import bpy
+import stub_scene
+from mathutils import Matrix
+from io_nori import live_sync
+from io_nori.live_receiver import SceneState, handle
+
+from test_live_sync import Timers
+
+MESH = '<mesh type="obj"><string name="filename" value="meshes/%s.obj"/>%s<bsdf type="diffuse" name="%s"/></mesh>'
+TO_WORLD = '<transform name="toWorld"><matrix value="1,0,0,0,0,1,0,0,0,0,1,0,0,0,0,1"/></transform>'
+MATRIX = [1.0, 0.0, 0.0, 2.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+def read_scene(filepath):
+    return ET.parse(filepath).getroot()
+
+def test_apply_messages(tmp_path):
+    state = SceneState()
+    for message in [
+            {"type": "settings", "entries": '<integrator type="path_mis"/><sampler type="independent"/>'},
+            {"type": "camera", "entry": '<camera type="perspective"/>'},
+            {"type": "light", "object": "Lamp", "entry": '<emitter type="point"/>'},
+            {"type": "light", "object": "Sun", "entry": '<emitter type="point"/>'},
+            {"type": "light", "object": "Sun", "entry": None},
+            {"type": "object", "object": "A", "entries": MESH % ("A", TO_WORLD, "Wood")},
+            {"type": "object", "object": "B", "entries": MESH % ("B", "", "Metal") + MESH % ("B_1", "", "Wood")},
+            {"type": "object", "object": "C", "entries": MESH % ("C", "", "Wood")},
+            {"type": "remove", "object": "C"},
+            {"type": "transform", "object": "A", "matrix": MATRIX},
+            {"type": "transform", "object": "B", "matrix": MATRIX},
+            {"type": "material", "material": "Wood", "bsdf": '<bsdf type="mirror" name="Wood"/>',
+             "emitter": '<emitter type="area"/>'}]:
+        state.apply(message)
+    state.write(str(tmp_path / "scene.xml"))
+
+    scene = read_scene(tmp_path / "scene.xml")
+    assert [child.tag for child in scene] == ["integrator", "sampler", "camera", "emitter", "mesh", "mesh", "mesh"]
+    meshes = scene.findall("mesh")
+    assert [m.find("string").get("value") for m in meshes] == ["meshes/A.obj", "meshes/B.obj", "meshes/B_1.obj"]
+    # every mesh of a moved object gets the matrix, added when it had none
+    value = ",".join(repr(v) for v in MATRIX)
+    assert [m.find("transform[@name='toWorld']/matrix").get("value") for m in meshes] == [value] * 3
+    assert len(meshes[0].findall("transform")) == 1
+    # the edited material replaces the bsdf (and emitter) of its users only
+    assert [(m.find("bsdf").get("type"), len(m.findall("emitter"))) for m in meshes] == \
+        [("mirror", 1), ("diffuse", 0), ("mirror", 1)]
+
+def test_session_batches(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(bpy.app, "timers", Timers())
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=0)
+    updates = tmp_path / "live" / "updates"
+    session = live_sync.LiveSync(str(tmp_path / "live"), live_sync.DirectoryTransport(str(updates)), log=lambda text: None)
+    session.start()
+    try:
+        moved, hidden = context.scene.objects[2:4]
+        moved.matrix_world = Matrix([[1, 0, 0, 5], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]])
+        session.changed_objects[moved.name] = {"transform"}
+        session.tick()
+        hidden.visible = False
+        session.changed_objects[hidden.name] = {"other"}
+        session.tick()
+    finally:
+        session.stop()
+
+    state = SceneState()
+    output = str(tmp_path / "live" / "scene.xml")
+    batches = sorted(glob.glob(str(updates / "batch_*.json")))
+    assert len(batches) == 3
+    for path in batches:
+        with open(path) as f:
+            handle(state, json.load(f), output)
+    assert capsys.readouterr().out.splitlines()[-1].startswith("batch 3: 1 remove, 1 objects")
+
+    scene = read_scene(output)
+    assert [child.tag for child in scene][:4] == ["integrator", "sampler", "camera", "emitter"]
+    files = [m.find("string[@name='filename']").get("value") for m in scene.findall("mesh")]
+    assert len(files) == 2 and all(f.startswith("meshes/%s_v" % moved.name) for f in files)
+    assert all(os.path.exists(tmp_path / "live" / f) for f in files)
+    for mesh in scene.findall("mesh"):
+        matrix = [float(v) for v in mesh.find("transform[@name='toWorld']/matrix").get("value").split(",")]
+        assert matrix[3] == 5.0
@@ -0,0 +1,42 @@
+import os, json
+
+import bpy
+import stub_scene
+from io_nori import live_sync
+
+class Timers:
+    """bpy.app.timers, which matches the callbacks by identity"""
+    def __init__(self):
+        self.callbacks = []
+
+    def register(self, func, first_interval=0, persistent=False):
+        self.callbacks.append(func)
+
+    def is_registered(self, func):
+        return any(f is func for f in self.callbacks)
+
+    def unregister(self, func):
+        if not self.is_registered(func):
+            raise ValueError("not registered")
+        self.callbacks = [f for f in self.callbacks if f is not func]
+
+def test_session(tmp_path, monkeypatch):
+    timers = Timers()
+    monkeypatch.setattr(bpy.app, "timers", timers)
+    stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=1)
+    updates = tmp_path / "live" / "updates"
+    session = live_sync.LiveSync(str(tmp_path / "live"), live_sync.DirectoryTransport(str(updates)), log=lambda text: None)
+    session.start()
+    writer = session.writer
+    assert len(timers.callbacks) == 1
+
+    session.changed_settings = True
+    session.tick()
+    assert session.writer is writer # one writer, and its workers, for the whole session
+    assert len(os.listdir(updates)) == 2
+    with open(updates / "batch_000001.json") as f:
+        assert {m["type"] for m in json.load(f)["messages"]} >= {"settings", "camera", "object"}
+
+    session.stop()
+    assert timers.callbacks == []
+    assert session.writer is None and writer.textures.pool._shutdown
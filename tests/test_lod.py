@@ -0,0 +1,85 @@
+import math, os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import stub_scene
+from mathutils import Matrix
+from io_nori.lod import LodCache, coverage_pixels, lod_budget, lod_cache_path
+from io_nori.mesh_writer import MeshData, extract_mesh_data
+
+from test_nori_writer import export, referenced_files
+
+RENDER = SimpleNamespace(resolution_x=200, resolution_y=100, resolution_percentage=100)
+
+def camera(kind="PERSP"):
+    data = SimpleNamespace(type=kind, angle=math.pi / 2, ortho_scale=10.0, sensor_fit="AUTO")
+    return SimpleNamespace(matrix_world=np.eye(4), data=data)
+
+def cube(center, half):
+    return np.array([[[center[0] + x, center[1] + y, center[2] + z]
+                      for x in (-half, half) for y in (-half, half) for z in (-half, half)]], np.float64)
+
+def test_coverage_pixels():
+    # radius sqrt(3), nearest point at 10 - sqrt(3): r * (200 / 2) / (d - r) pixels, tan(45) = 1
+    radius = math.sqrt(3)
+    expected = math.pi * (radius * 100 / (10 - radius)) ** 2
+    assert coverage_pixels(camera(), RENDER, cube((0, 0, -10), 1))[0] == pytest.approx(expected)
+    # farther is smaller, close or around the camera is the whole image
+    assert coverage_pixels(camera(), RENDER, cube((0, 0, -40), 1))[0] < expected / 10
+    assert coverage_pixels(camera(), RENDER, cube((0, 0, -2), 1))[0] == 200 * 100
+    assert coverage_pixels(camera(), RENDER, cube((0, 0, 0), 1))[0] == 200 * 100
+    # orthographic: the distance does not matter
+    ortho = [coverage_pixels(camera("ORTHO"), RENDER, cube((0, 0, z), 1))[0] for z in (-10, -100)]
+    assert ortho == pytest.approx([math.pi * (radius * 200 / 10) ** 2] * 2)
+
+def test_lod_budget():
+    assert lod_budget(1000, 1.0, 64) == 1024
+    assert lod_budget(1024, 1.0, 64) == 1024
+    assert lod_budget(1000, 0.25, 64) == 256
+    assert lod_budget(3, 1.0, 64) == 64
+    assert lod_budget(0, 1.0, 0) == 1
+
+def sphere(triangles):
+    ob = stub_scene.StubObject("Sphere", mesh=stub_scene.StubMesh(*stub_scene.uv_sphere(triangles)))
+    return extract_mesh_data(ob, np.eye(4), True)
+
+def test_cache(tmp_path):
+    data = sphere(4000)
+    cache = LodCache(str(tmp_path / "lod"))
+    decimated = cache.decimate(data, 256)
+    assert decimated.triangle_count <= 1.25 * 256
+    assert cache.decimate(data, 256) is decimated
+    assert (cache.misses, cache.hits) == (1, 1)
+
+    # read back by the next export, the unused levels are dropped
+    cache.decimate(data, 512)
+    cache = LodCache(str(tmp_path / "lod"))
+    again = cache.decimate(data, 256)
+    assert (cache.misses, cache.hits) == (0, 1)
+    for name in MeshData.__slots__[1:]:
+        assert np.array_equal(getattr(again, name), getattr(decimated, name)), name
+    cache.finish()
+    assert len(os.listdir(tmp_path / "lod")) == 1
+
+def test_export_decimates_far_objects(tmp_path):
+    # the camera is at y = -10 looking along +y
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=2000, textures=0)
+    near, far = context.scene.objects[2:4]
+    near.matrix_world = Matrix([[1, 0, 0, 0], [0, 1, 0, -7], [0, 0, 1, 0], [0, 0, 0, 1]])
+    far.matrix_world = Matrix([[1, 0, 0, 0], [0, 1, 0, 500], [0, 0, 1, 0], [0, 0, 0, 1]])
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_lod=True, lod_min_triangles=64)
+
+    def triangles(ob):
+        count = 0
+        for path in referenced_files(tmp_path / "scene.xml"):
+            if path.startswith("meshes/" + ob.name):
+                with open(tmp_path / path) as f:
+                    count += sum(line.startswith("f ") for line in f)
+        return count
+    assert triangles(near) > 1000
+    assert triangles(far) <= 1.25 * 64
+    assert any(text.startswith("LOD: 1 of 2 meshes over budget") for text in logs)
+    assert os.path.isdir(lod_cache_path(str(tmp_path / "scene.xml")))
@@ -0,0 +1,73 @@
+import os
+
+import stub_scene
+from io_nori.manifest import ExportManifest
+from io_nori.nori_writer import NoriWriter
+
+from test_nori_writer import export, referenced_files
+
+def write_file(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+def test_unchanged_files_are_skipped(tmp_path):
+    write_file(tmp_path / "a.obj", "v 0 0 0\n")
+    manifest = ExportManifest(str(tmp_path / "scene.manifest.json"), str(tmp_path))
+    manifest.record("meshes", "a.obj", "digest")
+    manifest.finish()
+
+    manifest = ExportManifest(str(tmp_path / "scene.manifest.json"), str(tmp_path))
+    assert manifest.is_current("meshes", "a.obj", "digest")
+    assert not manifest.is_current("meshes", "a.obj", "other digest")
+    # edited outside of the export
+    write_file(tmp_path / "a.obj", "v 1 1 1 1\n")
+    assert not manifest.is_current("meshes", "a.obj", "digest")
+
+def test_stale_files_are_removed(tmp_path):
+    for name in ("a.obj", "b.obj"):
+        write_file(tmp_path / name, name)
+    manifest = ExportManifest(str(tmp_path / "scene.manifest.json"), str(tmp_path))
+    manifest.record("meshes", "a.obj", "a")
+    manifest.record("meshes", "b.obj", "b")
+    manifest.finish()
+
+    manifest = ExportManifest(str(tmp_path / "scene.manifest.json"), str(tmp_path))
+    manifest.record("meshes", "a.obj", "a", skipped=True)
+    manifest.finish()
+    assert os.path.exists(tmp_path / "a.obj")
+    assert not os.path.exists(tmp_path / "b.obj")
+    assert (manifest.skipped, manifest.written, manifest.removed) == (1, 0, 1)
+
+def test_shared_folders_keep_stale_files(tmp_path):
+    write_file(tmp_path / "a.obj", "a")
+    manifest = ExportManifest(str(tmp_path / "scene.manifest.json"), str(tmp_path))
+    manifest.record("meshes", "a.obj", "a")
+    manifest.finish()
+
+    manifest = ExportManifest(str(tmp_path / "scene.manifest.json"), str(tmp_path), remove_stale=False)
+    manifest.finish()
+    assert os.path.exists(tmp_path / "a.obj")
+
+def test_incremental_export_skips_unchanged_meshes(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=0)
+    export(context, tmp_path / "scene.xml", export_incremental=True)
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_incremental=True)
+    assert "INCREMENTAL: 4 files skipped, 0 rewritten, 0 stale files removed" in logs
+
+def test_operator_meshes_are_not_stale(tmp_path, monkeypatch):
+    # the stub operator writes nothing, write the file it would export
+    def write_mesh_operator(self, mesh, obj_path):
+        write_file(os.path.join(self.workingDir, obj_path), mesh.name)
+    monkeypatch.setattr(NoriWriter, "write_mesh_operator", write_mesh_operator)
+
+    # one slot: both backends write meshes/<object>.obj
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=0)
+    for ob in context.scene.objects[2:]:
+        ob.material_slots = ob.material_slots[:1]
+    export(context, tmp_path / "scene.xml", export_incremental=True)
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_incremental=True, mesh_backend="OPERATOR")
+    assert "INCREMENTAL: 0 files skipped, 2 rewritten, 0 stale files removed" in logs
+    assert sorted(os.listdir(tmp_path / "meshes")) == ["Object.00000.obj", "Object.00001.obj"]
+    assert sorted(referenced_files(tmp_path / "scene.xml")) == ["meshes/Object.00000.obj", "meshes/Object.00001.obj"]
@@ -0,0 +1,30 @@
+import tracemalloc
+
+import numpy as np
+
+from io_nori.memory import MemoryBudget
+
+def test_budget_is_per_object():
+    # the process is already far above a 1 MB budget, an object allocating nothing is not over it
+    ballast = np.ones(64 << 20, np.uint8)
+    logs = []
+    budget = MemoryBudget(1, logs.append)
+    budget.begin()
+    budget.end("Light", 0)
+    assert budget.over_budget == [] and logs == []
+    del ballast
+
+def test_object_over_budget():
+    logs = []
+    budget = MemoryBudget(8, logs.append)
+    tracemalloc.start()
+    try:
+        budget.begin()
+        data = np.ones(32 << 20, np.uint8)
+        budget.end("Heavy", 1000)
+    finally:
+        tracemalloc.stop()
+    del data
+    assert [name for name, _ in budget.over_budget] == ["Heavy"]
+    assert budget.over_budget[0][1] >= 32 << 20
+    assert len(logs) == 1 and "Heavy" in logs[0] and "1000 triangles" in logs[0]
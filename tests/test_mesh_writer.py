@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from io_nori import mesh_writer
+from io_nori.mesh_writer import MeshData, write_obj, write_ply, read_ply
+
+def read_obj(filepath):
+    """(positions, normals, uvs) of every face corner, and the face sizes"""
+    v, vt, vn, sizes, corners = [], [], [], [], []
+    with open(filepath) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            if tokens[0] == "v":
+                v.append([float(x) for x in tokens[1:4]])
+            elif tokens[0] == "vt":
+                vt.append([float(x) for x in tokens[1:3]])
+            elif tokens[0] == "vn":
+                vn.append([float(x) for x in tokens[1:4]])
+            elif tokens[0] == "f":
+                sizes.append(len(tokens) - 1)
+                corners += [[int(i) - 1 if i else -1 for i in (c.split("/") + ["", ""])[:3]] for c in tokens[1:]]
+    corners = np.array(corners, np.int64).reshape(-1, 3)
+    pick = lambda pool, column: np.array(pool, np.float32)[corners[:, column]] if pool else None
+    positions = np.array(v, np.float32).reshape(-1, 3)[corners[:, 0]]
+    return positions, pick(vn, 2), pick(vt, 1), np.array(sizes, np.int32)
+
+def corner_attributes(data):
+    pick = lambda pool, indices: pool[indices] if pool is not None else None
+    return (data.positions[data.face_vertices], pick(data.normals, data.face_normals),
+            pick(data.uvs, data.face_uvs), data.face_sizes)
+
+def synthetic_mesh(nb_faces, seed=0, normals=True, uvs=True, quads=False):
+    rng = np.random.default_rng(seed)
+    face_sizes = rng.integers(3, 5, nb_faces).astype(np.int32) if quads else np.full(nb_faces, 3, np.int32)
+    nb_corners = int(face_sizes.sum())
+    nb_vertices = max(nb_faces // 2, 3)
+    kwargs = {}
+    if normals:
+        pool = rng.standard_normal((nb_vertices, 3)).astype(np.float32)
+        kwargs.update(normals=pool / np.linalg.norm(pool, axis=1, keepdims=True),
+                      face_normals=rng.integers(0, nb_vertices, nb_corners).astype(np.int32))
+    if uvs:
+        kwargs.update(uvs=rng.random((nb_vertices, 2), dtype=np.float32),
+                      face_uvs=rng.integers(0, nb_vertices, nb_corners).astype(np.int32))
+    return MeshData("synthetic", rng.uniform(-10, 10, (nb_vertices, 3)).astype(np.float32), face_sizes,
+                    rng.integers(0, nb_vertices, nb_corners).astype(np.int32), **kwargs)
+
+def assert_round_trip(data, tmp_path):
+    write_obj(str(tmp_path / "mesh.obj"), data)
+    write_ply(str(tmp_path / "mesh.ply"), data)
+    obj = read_obj(str(tmp_path / "mesh.obj"))
+    ply = corner_attributes(read_ply(str(tmp_path / "mesh.ply")))
+    expected = corner_attributes(data)
+    np.testing.assert_array_equal(ply[3], expected[3])
+    np.testing.assert_array_equal(obj[3], expected[3])
+    # the binary file is exact, the text file rounds positions and uvs to 6 decimals, normals to 4
+    for ply_values, obj_values, values, atol in zip(ply[:3], obj[:3], expected[:3], (1e-5, 1e-4, 1e-6)):
+        if values is None:
+            assert ply_values is None and obj_values is None
+            continue
+        np.testing.assert_array_equal(ply_values, values)
+        np.testing.assert_allclose(obj_values, ply_values, atol=atol)
+
+@pytest.mark.parametrize("normals, uvs", [(True, True), (True, False), (False, True), (False, False)])
+def test_ply_matches_obj(tmp_path, normals, uvs):
+    assert_round_trip(synthetic_mesh(500, normals=normals, uvs=uvs), tmp_path)
+
+def test_polygons(tmp_path):
+    assert_round_trip(synthetic_mesh(500, quads=True), tmp_path)
+
+def test_empty_mesh(tmp_path):
+    empty = np.zeros(0, np.int32)
+    data = MeshData("empty", np.zeros((0, 3), np.float32), empty, empty)
+    assert_round_trip(data, tmp_path)
+    assert len(read_ply(str(tmp_path / "mesh.ply")).face_sizes) == 0
+
+@pytest.mark.parametrize("big_face", [255, 256, 1000])
+def test_faces_with_many_corners(tmp_path, monkeypatch, big_face):
+    # a byte counts the corners of a face up to 255
+    data = synthetic_mesh(50, quads=True)
+    rng = np.random.default_rng(1)
+    n = len(data.positions)
+    data.face_sizes = np.concatenate((data.face_sizes, [big_face, 3])).astype(np.int32)
+    for name in ("face_vertices", "face_normals", "face_uvs"):
+        setattr(data, name, np.concatenate((getattr(data, name), rng.integers(0, n, big_face + 3))).astype(np.int32))
+    monkeypatch.setattr(mesh_writer, "CHUNK_ROWS", 7)
+    assert_round_trip(data, tmp_path)
+    header = (tmp_path / "mesh.ply").read_bytes().split(b"end_header")[0]
+    assert (b"list uint uint" if big_face > 255 else b"list uchar uint") in header
+    assert mesh_writer.ply_size(data) == (tmp_path / "mesh.ply").stat().st_size
+
+@pytest.mark.parametrize("nb_faces", [mesh_writer.CHUNK_ROWS - 1, mesh_writer.CHUNK_ROWS, mesh_writer.CHUNK_ROWS + 1])
+def test_chunk_boundary(tmp_path, nb_faces):
+    assert_round_trip(synthetic_mesh(nb_faces, seed=nb_faces), tmp_path)
+
+def test_small_chunks(tmp_path, monkeypatch):
+    # every chunk boundary, with faces of different sizes spanning them
+    data = synthetic_mesh(200, quads=True)
+    write_obj(str(tmp_path / "reference.obj"), data)
+    write_ply(str(tmp_path / "reference.ply"), data)
+    monkeypatch.setattr(mesh_writer, "CHUNK_ROWS", 7)
+    assert_round_trip(data, tmp_path)
+    for ext in ("obj", "ply"):
+        assert (tmp_path / ("mesh." + ext)).read_bytes() == (tmp_path / ("reference." + ext)).read_bytes()
+
+@pytest.mark.parametrize("normals, uvs", [(True, True), (True, False), (False, True), (False, False)])
+@pytest.mark.parametrize("quads", [False, True])
+def test_sizes_without_encoding(tmp_path, normals, uvs, quads):
+    data = synthetic_mesh(2000, normals=normals, uvs=uvs, quads=quads)
+    # signs, rounding to -0, carries into the next digit and large coordinates
+    data.positions[:8, 0] = [-0.0, -1e-9, 9.9999999, 99.9999996, -999.99999, 1e6, -123456.7, 0.5]
+    assert mesh_writer.obj_size(data) == write_obj(str(tmp_path / "mesh.obj"), data)
+    assert mesh_writer.ply_size(data) == write_ply(str(tmp_path / "mesh.ply"), data)
+    assert mesh_writer.ply_size(data) == (tmp_path / "mesh.ply").stat().st_size
+
+def test_empty_sizes(tmp_path):
+    empty = np.zeros(0, np.int32)
+    data = MeshData("empty", np.zeros((0, 3), np.float32), empty, empty)
+    assert mesh_writer.obj_size(data) == write_obj(str(tmp_path / "mesh.obj"), data)
+    assert mesh_writer.ply_size(data) == write_ply(str(tmp_path / "mesh.ply"), data)
+
+@pytest.mark.parametrize("triangulate", [True, False])
+@pytest.mark.parametrize("mirror", [1.0, -1.0])
+def test_chunked_extraction(monkeypatch, triangulate, mirror):
+    import stub_scene
+    ob = stub_scene.StubObject("Sphere", mesh=stub_scene.StubMesh(*stub_scene.uv_sphere(2000), nb_materials=3))
+    matrix = np.array([[2.0 * mirror, 0, 0, 1], [0, 0.5, 0.3, 0], [0, 0, 1, 2], [0, 0, 0, 1]])
+    whole = mesh_writer.extract_mesh_data(ob, matrix, triangulate)
+    monkeypatch.setattr(mesh_writer, "CHUNK_ROWS", 7)
+    chunked = mesh_writer.extract_mesh_data(ob, matrix, triangulate)
+    for name in MeshData.__slots__[1:]:
+        assert np.array_equal(getattr(whole, name), getattr(chunked, name)), name
+    # split parts keep their faces in order
+    parts = mesh_writer.split_by_material(whole, 3)
+    assert [slot for slot, _ in parts] == [0, 1, 2]
+    assert sum(len(part.face_sizes) for _, part in parts) == len(whole.face_sizes)
+    for slot, part in parts:
+        faces = np.flatnonzero(whole.face_materials == slot)
+        corners = np.concatenate([np.arange(s, s + n) for s, n in zip((np.cumsum(whole.face_sizes) - whole.face_sizes)[faces],
+                                                                       whole.face_sizes[faces])])
+        assert np.array_equal(part.positions[part.face_vertices], whole.positions[whole.face_vertices[corners]])
+        assert np.array_equal(part.normals[part.face_normals], whole.normals[whole.face_normals[corners]])
@@ -0,0 +1,283 @@
+import io, os, re
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+import stub_scene
+from mathutils import Matrix
+from io_nori.nori_writer import NoriWriter
+from io_nori.xml_writer import StreamingDocument
+
+def make_writer(context, filepath, logs=None, **options):
+    writer = NoriWriter(context, str(filepath))
+    writer.verbose = logs.append if logs is not None else lambda text: None
+    writer.setExportMeshesWorld(True)
+    for key, value in options.items():
+        setattr(writer, key, value)
+    return writer
+
+def export(context, filepath, logs=None, **options):
+    writer = make_writer(context, filepath, logs, **options)
+    writer.write(True, True, 4)
+    return writer
+
+def referenced_files(xml_filepath):
+    with open(xml_filepath) as f:
+        return re.findall(r'name="filename" value="([^"]+)"', f.read())
+
+def mesh_entries(xml_filepath):
+    """(filename, toWorld translation) of every mesh entry, None for meshes in world space"""
+    entries = []
+    for mesh in ET.parse(xml_filepath).getroot().findall("mesh"):
+        translation, matrix = None, mesh.find("transform[@name='toWorld']/matrix")
+        if matrix is not None:
+            values = [float(v) for v in matrix.get("value").split(",")]
+            translation = (values[3], values[7], values[11])
+        entries.append((mesh.find("string[@name='filename']").get("value"), translation))
+    return entries
+
+def test_empty_slots_keep_every_split_file(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=0)
+    no_material, first_empty = context.scene.objects[2:4]
+    empty_slot = SimpleNamespace(name="", material=None, link="DATA")
+    no_material.material_slots = [empty_slot, empty_slot]
+    first_empty.material_slots = [empty_slot, first_empty.material_slots[1]]
+    export(context, tmp_path / "scene.xml")
+
+    written = sorted("meshes/" + name for name in os.listdir(tmp_path / "meshes"))
+    assert written == ["meshes/Object.00000_m0.obj", "meshes/Object.00000_m1.obj",
+                       "meshes/Object.00001_m0.obj", "meshes/Object.00001_m1.obj"]
+    assert sorted(referenced_files(tmp_path / "scene.xml")) == written
+
+@pytest.mark.parametrize("processing", [False, True])
+def test_shared_assets_are_named_by_content(tmp_path, processing):
+    # two shots whose textures have the same file name but not the same content
+    (tmp_path / "out").mkdir()
+    sources = {}
+    for shot, seed in (("a", 1), ("b", 2)):
+        context = stub_scene.build_scene(str(tmp_path / shot), objects=1, triangles=200, textures=1, seed=seed)
+        export(context, tmp_path / "out" / (shot + ".xml"), shared_assets=True,
+               export_textures=True, texture_processing=processing)
+        sources[shot] = referenced_files(tmp_path / "out" / (shot + ".xml"))
+
+    textures = {shot: [f for f in files if f.startswith("textures/")] for shot, files in sources.items()}
+    assert len(textures["a"]) == len(textures["b"]) == 1
+    assert textures["a"] != textures["b"]
+    for shot, (texture_file,) in textures.items():
+        assert os.path.exists(tmp_path / "out" / texture_file)
+        if not processing:
+            with open(tmp_path / shot / "sources" / "texture_000.png", "rb") as source, \
+                 open(tmp_path / "out" / texture_file, "rb") as staged:
+                assert source.read() == staged.read()
+    # the same geometry, one file whatever the name of its data
+    meshes = {shot: [f for f in files if f.startswith("meshes/")] for shot, files in sources.items()}
+    assert meshes["a"] == meshes["b"]
+    assert all("Object" not in f for f in meshes["a"])
+
+class RemovedObject(stub_scene.StubObject):
+    removed = False
+
+    @property
+    def name(self):
+        if self.removed:
+            raise ReferenceError("StructRNA of type Object has been removed")
+        return self.__dict__["name"]
+
+def test_removed_objects_are_skipped(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=0)
+    removed = context.scene.objects[3]
+    removed.__class__ = RemovedObject
+    logs = []
+    writer = make_writer(context, tmp_path / "scene.xml", logs)
+    export_object = writer.export_object
+    def export_and_remove(mesh, *args):
+        export_object(mesh, *args)
+        removed.removed = True # deleted while the UI had control
+    writer.export_object = export_and_remove
+    writer.write(True, True, 4)
+
+    assert "WARN: Object.00001 was removed during the export, it is skipped" in logs
+    assert all("Object.00001" not in f for f in referenced_files(tmp_path / "scene.xml"))
+
+def test_missing_environment_map_is_skipped(tmp_path, monkeypatch):
+    import bpy
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=1, triangles=200, textures=0)
+    image = SimpleNamespace(filepath=str(tmp_path / "src" / "missing.hdr"), size=(64, 32))
+    nodes = {"Environment Texture": SimpleNamespace(image=image),
+             "Background": SimpleNamespace(inputs=[None, SimpleNamespace(default_value=1.0)])}
+    monkeypatch.setitem(bpy.data.worlds, "World", SimpleNamespace(node_tree=SimpleNamespace(nodes=nodes)))
+    logs = []
+    export(context, tmp_path / "scene.xml", logs)
+
+    assert any(text.startswith("WARN: Could not transfer environment map") for text in logs)
+    with open(tmp_path / "scene.xml") as f:
+        assert 'type="environment"' not in f.read()
+
+def test_optimization_logs_both_sizes(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=1, triangles=500, textures=0)
+    for name in ("plain", "opt"):
+        (tmp_path / name).mkdir()
+    export(context, tmp_path / "plain" / "scene.xml")
+    plain_sizes = sorted(os.path.getsize(tmp_path / "plain" / f) for f in referenced_files(tmp_path / "plain" / "scene.xml"))
+
+    logs = []
+    export(context, tmp_path / "opt" / "scene.xml", logs, optimize_meshes=True)
+    sizes = []
+    for text in logs:
+        match = re.match(r"OPTIMIZE: (meshes/\S+) .* (\d+) bytes -> (\d+) \(", text)
+        if match:
+            sizes.append(int(match.group(2)))
+            assert int(match.group(3)) == os.path.getsize(tmp_path / "opt" / match.group(1))
+    assert sorted(sizes) == plain_sizes
+
+def test_staged_export_removes_stale_jobs(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=1, triangles=200, textures=0)
+    out = tmp_path / "out"
+    out.mkdir()
+    export(context, out / "scene.xml", export_staging=True, farm_jobs=4, farm_split="TILES")
+    tiles = sorted(f for f in os.listdir(out) if ".job_" in f)
+    assert len(tiles) == 4
+    open(out / (tiles[0][:-len(".xml")] + ".pfm"), "w").close() # a rendered tile
+
+    export(context, out / "scene.xml", export_staging=True, farm_jobs=4, farm_split="SAMPLES")
+    jobs = sorted(f for f in os.listdir(out) if ".job_" in f)
+    assert len(jobs) == 4 and not set(jobs) & set(tiles)
+
+def test_camera_batch_leaves_the_main_camera_out(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=1, triangles=200, textures=0)
+    main = context.scene.objects[0]
+    other = stub_scene.StubObject("Side", type="CAMERA", matrix=[[0, 0, 1, 10], [1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1]],
+                                  data=main.data)
+    context.scene.objects.insert(1, other)
+    export(context, tmp_path / "scene.xml", camera_batch="CAMERAS")
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".xml")) == ["scene.xml", "scene_Side.xml"]
+
+def test_dom_and_stream_outputs_are_identical(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=4, triangles=200, textures=2)
+    outputs = {}
+    for backend in ("DOM", "STREAM"):
+        (tmp_path / backend).mkdir()
+        export(context, tmp_path / backend / "scene.xml", xml_backend=backend, export_textures=True)
+        outputs[backend] = (tmp_path / backend / "scene.xml").read_bytes()
+    assert outputs["DOM"].count(b"<mesh") == 8 # two material slots per object
+    assert outputs["DOM"] == outputs["STREAM"]
+
+@pytest.mark.parametrize("backend", ["DOM", "STREAM"])
+@pytest.mark.parametrize("cancel", [False, True])
+def test_failed_export_keeps_the_previous_xml(tmp_path, backend, cancel):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=4, triangles=200, textures=0)
+    export(context, tmp_path / "scene.xml", xml_backend=backend)
+    good = (tmp_path / "scene.xml").read_bytes()
+
+    writer = make_writer(context, tmp_path / "scene.xml", xml_backend=backend)
+    steps = writer.write_steps(True, True, 4)
+    if cancel:
+        for progress in steps:
+            if progress >= 0.5: # half of the objects exported
+                break
+        steps.close() # Esc
+    else:
+        export_object = writer.export_object
+        def fail_on_second(mesh, *args):
+            if mesh.name == "Object.00001":
+                raise RuntimeError("export failed")
+            export_object(mesh, *args)
+        writer.export_object = fail_on_second
+        with pytest.raises(RuntimeError):
+            for _ in steps:
+                pass
+    assert (tmp_path / "scene.xml").read_bytes() == good
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+@pytest.mark.parametrize("cancel", [False, True])
+def test_failed_export_stops_the_profiler(tmp_path, cancel):
+    import tracemalloc
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=0)
+    writer = make_writer(context, tmp_path / "scene.xml", export_profile=True)
+    def fail(*args):
+        raise RuntimeError("export failed")
+    if not cancel:
+        writer.export_object = fail
+    steps = writer.write_steps(True, True, 4)
+    try:
+        next(steps)
+        assert tracemalloc.is_tracing()
+        steps.close()
+    except RuntimeError:
+        pass
+    assert not tracemalloc.is_tracing()
+
+def test_material_cache_follows_edits(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=1, triangles=200, textures=0)
+    writer = make_writer(context, tmp_path / "scene.xml")
+    writer.doc = StreamingDocument(None)
+    writer.start_export()
+    material = context.scene.objects[2].material_slots[0].material
+    def convert():
+        bsdf, _ = writer.convert_material(material, True, True)
+        text = io.StringIO()
+        bsdf.writexml(text)
+        return text.getvalue()
+    first, cached = convert(), convert()
+    material.node_tree.nodes["Principled BSDF"].inputs["Roughness"].default_value = 0.25
+    edited = convert()
+    assert first == cached != edited
+    assert 'value="0.250000"' in edited
+    assert writer.material_stats == {"hits": 1, "misses": 2}
+
+def test_animation_shares_the_static_meshes(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=3, triangles=200, textures=0)
+    static, moving, deforming = context.scene.objects[2:5]
+    positions, polygons = stub_scene.uv_sphere(200)
+    deforming.mesh = stub_scene.StubMesh(positions, polygons, nb_materials=2)
+    frame_set = context.scene.frame_set
+    def animate(frame):
+        frame_set(frame)
+        moving.matrix_world = Matrix([[1, 0, 0, frame], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]])
+        deforming.mesh.vertices.arrays["co"] = positions * (1.0 + 0.1 * frame)
+    context.scene.frame_set = animate
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_animation=True, frame_start=1, frame_end=3)
+
+    files = [referenced_files(tmp_path / ("scene_%04d.xml" % frame)) for frame in (1, 2, 3)]
+    users = lambda ob, frame_files: sorted(f for f in frame_files if f.startswith("meshes/" + ob.name))
+    # moved or not, the same geometry is written once for all the frames
+    for ob in (static, moving):
+        assert users(ob, files[0]) == users(ob, files[1]) == users(ob, files[2])
+        assert len(users(ob, files[0])) == 2
+    deformed = [users(deforming, frame_files) for frame_files in files]
+    assert len(set(sum(deformed, []))) == 6
+    assert "ANIMATION: 3 frames share 10 mesh files" in logs
+    assert sorted("meshes/" + name for name in os.listdir(tmp_path / "meshes")) == sorted(set(sum(files, [])))
+    assert context.scene.frame_current == 1
+
+def test_identical_meshes_are_written_once(tmp_path):
+    # every object has its own mesh data but the same geometry
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=4, triangles=200, textures=0)
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_meshes_dedup=True)
+
+    assert "MESHES: 4 objects share 2 unique mesh files" in logs
+    entries = mesh_entries(tmp_path / "scene.xml")
+    files = sorted(set(filename for filename, _ in entries))
+    assert len(entries) == 8 and len(files) == 2
+    assert sorted("meshes/" + name for name in os.listdir(tmp_path / "meshes")) == files
+    # every object places the shared files with its own transform
+    placements = sorted(set(translation for _, translation in entries))
+    expected = sorted(tuple(float(ob.matrix_world[i][3]) for i in range(3)) for ob in context.scene.objects[2:])
+    assert placements == expected
+
+def test_instances_reference_their_source(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=1, triangles=200, textures=0, instances=5)
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, instance_mode="REFERENCE")
+
+    assert "INSTANCES: 5 instances of 1 source objects" in logs
+    # the hidden source is written once, one entry per instance
+    instances = [translation for filename, translation in mesh_entries(tmp_path / "scene.xml")
+                 if filename == "meshes/InstanceSource.obj"]
+    expected = [tuple(float(instance.matrix_world[i][3]) for i in range(3))
+                for instance in context.evaluated_depsgraph_get().object_instances]
+    assert sorted(instances) == pytest.approx(sorted(expected))
+    assert sorted(os.listdir(tmp_path / "meshes")) == ["InstanceSource.obj", "Object.00000_m0.obj", "Object.00000_m1.obj"]
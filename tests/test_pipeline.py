@@ -0,0 +1,33 @@
+import multiprocessing, sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from io_nori.pipeline import MeshPipeline
+
+def test_results_keep_the_submission_order():
+    pipeline = MeshPipeline(workers=3, max_in_flight=2)
+    results = []
+    for i in range(20):
+        pipeline.submit(pow, i, 2, callback=results.append)
+    pipeline.finish()
+    assert results == [i * i for i in range(20)]
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="process workers are Linux only")
+def test_process_workers_start_before_the_first_job():
+    pipeline = MeshPipeline(workers=2, mode="PROCESS")
+    try:
+        assert isinstance(pipeline.executor, ProcessPoolExecutor)
+        assert len(multiprocessing.active_children()) >= 2
+    finally:
+        pipeline.close()
+
+def test_process_workers_fall_back_to_threads(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "darwin")
+    logs = []
+    pipeline = MeshPipeline(workers=2, mode="PROCESS", log=logs.append)
+    try:
+        assert isinstance(pipeline.executor, ThreadPoolExecutor)
+        assert logs == ["WARN: Process workers are only supported on Linux, using threads instead"]
+    finally:
+        pipeline.close()
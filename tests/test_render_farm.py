@@ -0,0 +1,112 @@
+import os, json
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+from io_nori.render_farm import split_scene, merge_jobs, run_jobs, write_pfm, read_pfm
+
+SCENE = """<?xml version="1.0" ?>
+<scene>
+\t<integrator type="path_mis"/>
+\t<sampler type="independent">
+\t\t<integer name="sampleCount" value="%d"/>
+\t</sampler>
+\t<camera type="perspective">
+\t\t<integer name="width" value="%d"/>
+\t\t<integer name="height" value="%d"/>
+\t</camera>
+\t<mesh type="obj">
+\t\t<string name="filename" value="meshes/Cube.obj"/>
+\t</mesh>
+</scene>
+"""
+
+def write_scene(directory, width=7, height=5, samples=10):
+    path = os.path.join(str(directory), "scene.xml")
+    with open(path, "w") as f:
+        f.write(SCENE % (samples, width, height))
+    return path
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def entries(xml_filepath, tag):
+    root = ET.parse(xml_filepath).getroot()
+    return {e.get("name"): e.get("value") for e in root.find(tag)}
+
+def test_tiles_cover_the_image_once(tmp_path):
+    manifest = load(split_scene(write_scene(tmp_path), 6))
+    assert (manifest["split"], manifest["width"], manifest["height"], len(manifest["jobs"])) == ("TILES", 7, 5, 6)
+    coverage = np.zeros((5, 7), int)
+    for job in manifest["jobs"]:
+        x, y, width, height = job["crop"]
+        coverage[y:y + height, x:x + width] += 1
+        camera = entries(tmp_path / job["xml"], "camera")
+        assert [int(camera[k]) for k in ("cropOffsetX", "cropOffsetY", "cropWidth", "cropHeight")] == job["crop"]
+        # the jobs share the files of the scene
+        assert ET.parse(tmp_path / job["xml"]).getroot().find("mesh/string").get("value") == "meshes/Cube.obj"
+    assert np.all(coverage == 1)
+
+def test_sample_slices(tmp_path):
+    manifest = load(split_scene(write_scene(tmp_path, samples=10), 3, "samples", seed=7))
+    assert [job["samples"] for job in manifest["jobs"]] == [4, 3, 3]
+    for job in manifest["jobs"]:
+        sampler = entries(tmp_path / job["xml"], "sampler")
+        assert (int(sampler["sampleCount"]), int(sampler["seed"])) == (job["samples"], 7 + job["id"])
+    # never more jobs than samples
+    assert len(load(split_scene(write_scene(tmp_path, samples=2), 5, "samples"))["jobs"]) == 2
+
+def test_merge_tiles(tmp_path):
+    manifest_path = split_scene(write_scene(tmp_path), 4)
+    image = np.random.default_rng(0).random((5, 7, 3)).astype(np.float32)
+    for job in load(manifest_path)["jobs"]:
+        x, y, width, height = job["crop"]
+        if job["id"] == 0:
+            # a renderer writing the full frame, with only the crop window rendered
+            write_pfm(str(tmp_path / (job["output"] + ".pfm")), image)
+        else:
+            np.save(str(tmp_path / (job["output"] + ".npy")), image[y:y + height, x:x + width])
+    np.testing.assert_array_equal(merge_jobs(manifest_path), image)
+
+def test_merge_weights_the_sample_slices(tmp_path):
+    manifest_path = split_scene(write_scene(tmp_path, samples=10), 3, "samples")
+    for job, value in zip(load(manifest_path)["jobs"], (1.0, 2.0, 4.0)):
+        np.save(str(tmp_path / (job["output"] + ".npy")), np.full((5, 7, 3), value, np.float32))
+    np.testing.assert_allclose(merge_jobs(manifest_path), (4 * 1.0 + 3 * 2.0 + 3 * 4.0) / 10)
+
+def test_merge_needs_every_output(tmp_path):
+    manifest_path = split_scene(write_scene(tmp_path), 2)
+    job = load(manifest_path)["jobs"][0]
+    np.save(str(tmp_path / (job["output"] + ".npy")), np.zeros((5, 4, 3), np.float32))
+    with pytest.raises(RuntimeError, match="1 jobs have no output"):
+        merge_jobs(manifest_path)
+
+def test_split_again_removes_stale_jobs(tmp_path):
+    scene = write_scene(tmp_path)
+    old_jobs = load(split_scene(scene, 4))["jobs"]
+    for job in old_jobs:
+        np.save(str(tmp_path / (job["output"] + ".npy")), np.zeros((1, 1, 3), np.float32))
+    new_jobs = load(split_scene(scene, 2))["jobs"]
+    kept = {job["xml"] for job in new_jobs}
+    assert sorted(f for f in os.listdir(tmp_path) if ".job_" in f) == sorted(kept)
+    # the same split again keeps the jobs and their outputs
+    np.save(str(tmp_path / (new_jobs[0]["output"] + ".npy")), np.zeros((1, 1, 3), np.float32))
+    assert load(split_scene(scene, 2))["jobs"] == new_jobs
+    assert os.path.exists(tmp_path / (new_jobs[0]["output"] + ".npy"))
+
+def test_run_and_merge_with_the_stub_renderer(tmp_path):
+    manifest_path = split_scene(write_scene(tmp_path, width=8, height=6, samples=1 << 16), 4)
+    assert run_jobs(manifest_path, parallel=2, log=lambda text: None) == []
+    image = merge_jobs(manifest_path)
+    ys, xs = np.mgrid[0:6, 0:8]
+    gradient = np.stack(((xs + 0.5) / 8, (ys + 0.5) / 6, np.full(xs.shape, 0.5)), axis=-1)
+    np.testing.assert_allclose(image, gradient, atol=0.01)
+    # done jobs are not rendered again
+    assert run_jobs(manifest_path, renderer="false", log=lambda text: None) == []
+
+def test_pfm_round_trip(tmp_path):
+    image = np.random.default_rng(1).random((3, 4, 3)).astype(np.float32)
+    write_pfm(str(tmp_path / "image.pfm"), image)
+    np.testing.assert_array_equal(read_pfm(str(tmp_path / "image.pfm")), image)
@@ -0,0 +1,93 @@
+import json, math
+from xml.dom.minidom import Document
+
+import numpy as np
+import pytest
+
+import stub_scene
+from io_nori.mesh_writer import MeshData
+from io_nori.report import SceneReport, report_path, luminance, BYTES_PER_VERTEX, BYTES_PER_TRIANGLE, BYTES_PER_TEXEL
+
+from test_nori_writer import export, referenced_files
+
+DOC = Document()
+
+def element(tag, attributes=None, *children):
+    node = DOC.createElement(tag)
+    for key, value in (attributes or {}).items():
+        node.setAttribute(key, value)
+    for child in children:
+        node.appendChild(child)
+    return node
+
+def entry(tag, name, value):
+    return element(tag, {"name": name, "value": value})
+
+def square(name, triangles):
+    # a fan of triangles over a unit square
+    positions = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], np.float32)
+    faces = np.tile([0, 1, 2], triangles).astype(np.int32)
+    return MeshData(name, positions, np.full(triangles, 3, np.int32), faces)
+
+def scale(s):
+    return [[s, 0, 0, 0], [0, s, 0, 0], [0, 0, s, 0], [0, 0, 0, 1]]
+
+def test_totals():
+    report = SceneReport()
+    report.mesh_file("meshes/a.obj", square("a", 100), 1.0)
+    report.mesh_file("meshes/b.obj", square("b", 10), 1.0)
+    report.texture("textures/wood.png", 4, 4, mip_levels=2)
+    report.texture("textures/unused.png", 1024, 1024)
+    diffuse = element("bsdf", {"type": "diffuse"}, element("texture", {"type": "textmap"},
+                                                           entry("string", "filename", "textures/wood.png")))
+    light = element("emitter", {"type": "area"}, entry("color", "radiance", "1,1,1"))
+    report.object("Wood", [("meshes/a.obj", diffuse, None)], [None, scale(1), scale(1)])
+    report.object("Lamp", [("meshes/b.obj", element("bsdf", {"type": "mirror"}), light)], [scale(2)])
+    report.point_light("Point", element("emitter", {"type": "point"}, entry("color", "radiance", "2,2,2")))
+
+    result = report.to_dict()
+    totals = result["totals"]
+    assert (totals["objects"], totals["triangles"], totals["vertices"]) == (2, 310, 16)
+    assert totals["geometry_memory"] == 310 * BYTES_PER_TRIANGLE + 16 * BYTES_PER_VERTEX
+    # 16 + 4 + 1 texels, the unused texture does not count
+    assert (totals["textures"], totals["texture_memory"]) == (1, 21 * BYTES_PER_TEXEL)
+    assert totals["emitters"] == {"area": 1, "point": 1}
+    # the area of the scaled emitter is 4 times larger
+    assert totals["emitted_power"]["area"] == pytest.approx(math.pi * 4.0 * luminance([1, 1, 1]))
+    assert totals["emitted_power"]["point"] == pytest.approx(4 * math.pi * luminance([2, 2, 2]))
+    assert result["bsdfs"] == {"diffuse": 3, "mirror": 1}
+    assert [o["name"] for o in result["objects"]] == ["Wood", "Lamp"]
+    assert result["flags"] == ["object Wood: 97% of the triangles", "texture textures/wood.png: 100% of the texture memory"]
+    assert result["over_budget"] == []
+
+def test_budgets_and_reset():
+    report = SceneReport()
+    report.mesh_file("meshes/a.obj", square("a", 1000), 1.0)
+    report.object("A", [("meshes/a.obj", element("bsdf", {"type": "diffuse"}), None)], [None])
+    result = report.to_dict(max_triangles=500, max_memory_mb=0)
+    assert result["over_budget"] == ["1000 triangles, budget 500"]
+    assert "WARN: Over the scene budget, 1000 triangles, budget 500" in SceneReport.summary(result)
+
+    # the next scene description only counts its own objects, the mesh files are known
+    report.reset()
+    report.object("B", [("meshes/a.obj", element("bsdf", {"type": "diffuse"}), None)], [None, None])
+    assert report.to_dict()["totals"]["triangles"] == 2000
+
+def test_export_writes_the_report(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=3, triangles=200, textures=1)
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_report=True, export_textures=True)
+    with open(report_path(str(tmp_path / "scene.xml"))) as f:
+        report = json.load(f)
+
+    # every face of the written mesh files is a triangle
+    triangles = 0
+    for path in referenced_files(tmp_path / "scene.xml"):
+        if path.startswith("meshes/"):
+            with open(tmp_path / path) as f:
+                triangles += sum(line.startswith("f ") for line in f)
+    totals = report["totals"]
+    assert (totals["objects"], totals["triangles"], totals["textures"]) == (3, triangles, 1)
+    assert totals["emitters"] == {"point": 1}
+    assert sum(report["bsdfs"].values()) == 6 # two slots per object
+    assert any(text.startswith("REPORT: 3 objects, %d triangles" % triangles) for text in logs)
@@ -0,0 +1,91 @@
+import re, zlib, struct
+
+import numpy as np
+import pytest
+
+import stub_scene
+from io_nori.texture_processing import processed_size, mip_count, process_texture, write_png, PNG_SIGNATURE
+
+from test_nori_writer import export
+
+def read_png(filepath):
+    """(H, W, C) uint8 pixels of a PNG written by write_png (8-bit, "Up" filter on every row)"""
+    with open(filepath, "rb") as f:
+        content = f.read()
+    assert content.startswith(PNG_SIGNATURE)
+    offset, chunks = len(PNG_SIGNATURE), {}
+    while offset < len(content):
+        length, kind = struct.unpack(">I4s", content[offset:offset + 8])
+        chunks[kind] = chunks.get(kind, b"") + content[offset + 8:offset + 8 + length]
+        offset += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    channels = {0: 1, 4: 2, 2: 3, 6: 4}[color_type]
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), np.uint8).reshape(height, width * channels + 1)
+    assert depth == 8 and np.all(rows[:, 0] == 2)
+    return np.cumsum(rows[:, 1:], axis=0, dtype=np.uint8).reshape(height, width, channels)
+
+def test_sizes():
+    assert processed_size(1024, 512, 0) == (1024, 512)
+    assert processed_size(1024, 512, 256) == (256, 128)
+    assert processed_size(1000, 7, 300) == (250, 2) # odd sizes are rounded up
+    assert processed_size(1000, 3, 100) == (250, 1) # down to one pixel on the short side
+    assert mip_count(256, 128, 3) == 3
+    assert mip_count(256, 4, 5) == 2
+
+@pytest.mark.parametrize("channels", [1, 2, 3, 4])
+def test_png_round_trip(tmp_path, channels):
+    pixels = np.random.default_rng(channels).integers(0, 256, (5, 7, channels), dtype=np.uint8)
+    write_png(str(tmp_path / "image.png"), pixels)
+    assert np.array_equal(read_png(tmp_path / "image.png"), pixels)
+
+def test_resize_and_mip_levels(tmp_path):
+    # Blender's order: bottom row first, RGBA floats
+    height, width = 8, 16
+    image = np.zeros((height, width, 4), np.float32)
+    image[..., 0] = np.linspace(0, 1, width)
+    image[:height // 2, ..., 1] = 1.0 # the bottom half is green
+    image[..., 3] = 1.0
+    outputs = [str(tmp_path / name) for name in ("tex.png", "tex_mip1.png", "tex_mip2.png")]
+    process_texture(image.ravel(), width, height, 4, 8, outputs)
+
+    levels = [read_png(path) for path in outputs]
+    # opaque: the alpha channel is dropped
+    assert [level.shape for level in levels] == [(4, 8, 3), (2, 4, 3), (1, 2, 3)]
+    # top row first, the bottom half is green
+    assert np.all(levels[0][:2, :, 1] == 0) and np.all(levels[0][2:, :, 1] == 255)
+    # every level is the 2x2 average of the previous one
+    red = image[::-1, :, 0].reshape(4, 2, 8, 2).mean(axis=(1, 3))
+    assert np.abs(levels[0][..., 0] - red * 255).max() <= 0.5
+    for finer, coarser in zip(levels, levels[1:]):
+        average = finer.astype(np.float32).reshape(coarser.shape[0], 2, coarser.shape[1], 2, 3).mean(axis=(1, 3))
+        assert np.abs(coarser - average).max() <= 1
+
+def test_transparent_textures_keep_their_alpha(tmp_path):
+    image = np.full((2, 2, 4), 0.5, np.float32)
+    process_texture(image.ravel(), 2, 2, 4, 0, [str(tmp_path / "tex.png")])
+    assert read_png(tmp_path / "tex.png").shape == (2, 2, 4)
+
+def test_export_processes_the_textures(tmp_path):
+    context = stub_scene.build_scene(str(tmp_path / "src"), objects=2, triangles=200, textures=1)
+    logs = []
+    export(context, tmp_path / "scene.xml", logs, export_textures=True, texture_processing=True,
+           texture_max_size=64, texture_mip_levels=2)
+    with open(tmp_path / "scene.xml") as f:
+        xml = f.read()
+    filenames = set(re.findall(r'name="filename" value="(textures/[^"]+)"', xml))
+    assert filenames == {"textures/texture_000_64px.png"}
+    assert set(re.findall(r'name="mipLevels" value="(\d+)"', xml)) == {"2"}
+    # the stub image is 256 x 256
+    shapes = [read_png(tmp_path / "textures" / name).shape[:2]
+              for name in ("texture_000_64px.png", "texture_000_64px_mip1.png", "texture_000_64px_mip2.png")]
+    assert shapes == [(64, 64), (32, 32), (16, 16)]
+
+    # an export to another folder sharing the cache folder takes them from the cache
+    options = dict(export_textures=True, texture_processing=True, texture_max_size=64, texture_mip_levels=2,
+                   cache_dir=str(tmp_path / "cache"))
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        logs = []
+        export(context, tmp_path / name / "scene.xml", logs, **options)
+    assert any(re.search(r"TEXTURES: .* 1 from cache", text) for text in logs)
+    assert read_png(tmp_path / "b" / "textures" / "texture_000_64px_mip2.png").shape[:2] == (16, 16)